@@ -0,0 +1,42 @@
+__all__ = ["AnswerKey", "to_bucket"]
+
+from typing import Any, Container, Dict, List, Optional, Tuple
+
+from app.matching import MatchIndex, normalize
+from app.schemas import StudentAnswer
+
+
+def to_bucket(text: str) -> str:
+    """ Answers that normalize the same (see matching.normalize) share a bucket """
+    return normalize(text)
+
+
+class AnswerKey:
+    def __init__(self, content: Dict[str, Any]):
+        """
+        The correct answers of one version of a quiz.
+        Build it once per version; short answers are indexed up front.
+        """
+        # (question type, correct choices or a MatchIndex of buckets) by index
+        self.questions: List[Tuple[str, Container]] = []
+        for question in content.get("q", []):
+            if question["type"] == "multiple-choice":
+                correct = frozenset(
+                    i
+                    for i, answer in enumerate(question["answers"])
+                    if answer.get("is_correct")
+                )
+            else:
+                correct = MatchIndex(
+                    question["answers"], max_edits=question.get("max_edits", 0)
+                )
+            self.questions.append((question["type"], correct))
+
+    def grade(self, answer: StudentAnswer) -> Optional[bool]:
+        """ None if the question doesn't exist """
+        if not 0 <= answer.question < len(self.questions):
+            return None
+        type_, correct = self.questions[answer.question]
+        if type_ == "multiple-choice":
+            return answer.choice in correct
+        return answer.text is not None and to_bucket(answer.text) in correct
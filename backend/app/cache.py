@@ -0,0 +1,104 @@
+__all__ = ["LRUCache"]
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Generic, Hashable, Optional, Set, Tuple, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+_MISSING = object()
+
+
+class LRUCache(Generic[K, V]):
+    def __init__(self, maxsize: int, ttl: Optional[float] = None):
+        """
+        Thread-safe, size-bounded cache with optional time-to-live.
+
+        Routes are synchronous and run in FastAPI's threadpool,
+        so every operation takes a lock.
+
+        **Parameters**
+
+        * `maxsize`: The maximum number of entries. The least recently used entry
+            is evicted once the cache is full.
+        * `ttl`: Seconds an entry stays valid. `None` means entries never expire.
+
+        Entries may be stored with a `tag` (e.g. a user id).
+        `invalidate(tag)` drops every entry sharing that tag.
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[K, Tuple[V, float, Any]]" = OrderedDict()
+        self._tags: Dict[Any, Set[K]] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: K, default: Optional[V] = None) -> Optional[V]:
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                self.misses += 1
+                return default
+            value, expires, _ = entry
+            if expires and expires < time.monotonic():
+                self._pop(key)
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: K, value: V, *, tag: Any = None) -> None:
+        if self.maxsize <= 0:
+            return
+        expires = time.monotonic() + self.ttl if self.ttl else 0.0
+        with self._lock:
+            if key in self._data:
+                self._pop(key)
+            self._data[key] = (value, expires, tag)
+            if tag is not None:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._data) > self.maxsize:
+                self._pop(next(iter(self._data)))
+
+    def pop(self, key: K) -> None:
+        with self._lock:
+            if key in self._data:
+                self._pop(key)
+
+    def invalidate(self, tag: Any) -> int:
+        """ Removes every entry stored with `tag`. Returns the number removed. """
+        with self._lock:
+            keys = self._tags.pop(tag, set())
+            for key in keys:
+                self._data.pop(key, None)
+            return len(keys)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._tags.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+        }
+
+    def _pop(self, key: K) -> None:
+        # Caller must hold the lock
+        _, _, tag = self._data.pop(key)
+        if tag is not None:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
@@ -1,10 +1,15 @@
 __all__ = ["settings", "security"]
 
+import asyncio
+import multiprocessing
 import secrets
+import threading
 import unicodedata
 import warnings
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 from datetime import datetime as DateTime, timedelta as TimeDelta
-from typing import List, Optional, Dict, Any, Union
+from typing import List, Optional, Dict, Any, Union, Callable, Tuple, Iterable
 
 from passlib.context import CryptContext
 from pydantic import BaseSettings, AnyHttpUrl, validator, EmailStr, PostgresDsn, HttpUrl
@@ -15,6 +20,8 @@ with warnings.catch_warnings():
     )
     from jose import jwt
 
+from app.exceptions import Http503ServerBusy
+
 
 # # Todo: Figure out why these two lines are needed.
 # #  It is directly related to CMD ["python" "manage.py" "initdb"] in backend.dockerfile
@@ -28,6 +35,13 @@ class Settings(BaseSettings):
     SECRET_KEY: str = secrets.token_urlsafe(32)
     # Todo: Lower expire minutes for production
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 60 * 24
+    # Authenticated users are cached so each request doesn't have to load the user.
+    #  Invalidation only reaches the current process; the TTL bounds staleness
+    #  across workers.
+    PRINCIPAL_CACHE_TTL_SECONDS: int = 60
+    PRINCIPAL_CACHE_SIZE: int = 4096
+    # Resolved "name#number" -> user id entries (see crud.CRUDUser.get_by_name)
+    USER_NAME_CACHE_SIZE: int = 4096
     SERVER_NAME: str
     # todo: SERVER_HOST: AnyHttpUrl
     # BACKEND_CORS_ORIGINS is a JSON-formatted list of origins
@@ -101,13 +115,222 @@ class Settings(BaseSettings):
     FIRST_SUPERUSER_PASSWORD: str
     USERS_OPEN_REGISTRATION: bool = False
 
+    # Hashes with fewer rounds than BCRYPT_ROUNDS are upgraded when the user logs in
+    BCRYPT_ROUNDS: int = 12
+    # bcrypt runs in a dedicated process pool so a burst of logins can't starve
+    #  the threadpool serving every other endpoint.
+    #  Once PASSWORD_HASH_WORKERS + PASSWORD_HASH_QUEUE_DEPTH requests are waiting,
+    #  new requests are answered with 503 and a Retry-After header.
+    #  PASSWORD_HASH_WORKERS=0 hashes inline.
+    #  The login and registration routes await their hashes off the threadpool,
+    #  but other hashing callers still hold a threadpool thread (40 by default)
+    #  while they wait, so the two settings together must stay well below that.
+    PASSWORD_HASH_WORKERS: int = 2
+    PASSWORD_HASH_QUEUE_DEPTH: int = 16
+    PASSWORD_HASH_RETRY_AFTER_SECONDS: int = 1
+
+    # A quiz's full content is snapshotted every QUIZ_SNAPSHOT_INTERVAL versions,
+    #  so reading an old version replays at most this many patches
+    QUIZ_SNAPSHOT_INTERVAL: int = 16
+    # Serialized student views of quizzes (see crud.CRUDQuiz.get_for_student)
+    STUDENT_QUIZ_CACHE_SIZE: int = 1024
+
+    # Seconds before the code of a closed room can be given to a new room
+    ROOM_CODE_COOLDOWN_SECONDS: int = 600
+    # Active rooms (and their sessions) by code, for students joining a room.
+    #  Changes made by other workers are seen once the TTL runs out.
+    ACTIVE_ROOM_CACHE_SIZE: int = 4096
+    ACTIVE_ROOM_CACHE_TTL_SECONDS: int = 30
+    # Rooms nobody has joined or changed for ROOM_IDLE_SECONDS are closed.
+    #  The sweeper runs every ROOM_SWEEP_INTERVAL_SECONDS (0 disables it)
+    #  and closes at most ROOM_SWEEP_BATCH_SIZE rooms per transaction.
+    ROOM_IDLE_SECONDS: int = 60 * 60 * 3
+    ROOM_SWEEP_INTERVAL_SECONDS: int = 60
+    ROOM_SWEEP_BATCH_SIZE: int = 500
+    # Events a room's websocket client may fall behind before it's disconnected
+    ROOM_HUB_QUEUE_SIZE: int = 64
+    # Room events are relayed between workers with NOTIFY, whose payloads
+    #  must be under 8000 bytes. Larger events go through a table instead.
+    ROOM_RELAY_MAX_PAYLOAD: int = 7900
+    # Rooms are split by code across SHARDS worker processes (see sharding.py);
+    #  this process owns shard SHARD. Set by `manage.py runsharded`.
+    SHARDS: int = 1
+    SHARD: int = 0
+    # Student responses are buffered and written RESPONSE_FLUSH_ROWS at a time,
+    #  or every RESPONSE_FLUSH_INTERVAL_MS. Sockets wait while
+    #  RESPONSE_BUFFER_CAPACITY responses are waiting to be written.
+    RESPONSE_FLUSH_ROWS: int = 1000
+    RESPONSE_FLUSH_INTERVAL_MS: int = 50
+    RESPONSE_BUFFER_CAPACITY: int = 20000
+    # Teachers get the changes to their session's tallies every TALLY_TICK_MS.
+    #  Short answers are counted by text, up to TALLY_MAX_BUCKETS texts a question.
+    #  Tallies of sessions nobody has answered or watched for
+    #  TALLY_IDLE_SECONDS are dropped from memory (and reloaded when needed).
+    TALLY_TICK_MS: int = 250
+    TALLY_MAX_BUCKETS: int = 50
+    TALLY_IDLE_SECONDS: int = 600
+    # Versions of quizzes' answer keys kept for grading
+    ANSWER_KEY_CACHE_SIZE: int = 1024
+    # Normalized short answers kept, and fuzzy matches kept per question
+    #  (see matching.py). Bursts of answers to a question repeat a lot.
+    SHORT_ANSWER_CACHE_SIZE: int = 4096
+
     class Config:
         case_sensitive = True
 
 
+settings = Settings()
+
+
+########################################################################################
+# Password hashing
+#  These functions run in the worker processes, so they must be importable at the top
+#  level of the module.
+_pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=settings.BCRYPT_ROUNDS,
+    bcrypt__min_rounds=settings.BCRYPT_ROUNDS,
+)
+
+
+def _hash_password(password: str) -> str:
+    return _pwd_context.hash(password)
+
+
+def _verify_and_update_password(
+    plain_password: str, hashed_password: str
+) -> Tuple[bool, Optional[str]]:
+    return _pwd_context.verify_and_update(plain_password, hashed_password)
+
+
+class PasswordPool:
+    def __init__(self, workers: int, queue_depth: int, retry_after: int):
+        """
+        A process pool for password hashing with admission control.
+
+        **Parameters**
+
+        * `workers`: The number of processes. With 0 workers, work runs inline.
+        * `queue_depth`: How many requests may wait for a free process.
+        * `retry_after`: Seconds a rejected client is told to wait.
+        """
+        self.workers = workers
+        self.retry_after = retry_after
+        self._slots = threading.BoundedSemaphore(workers + queue_depth)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._executor_lock = threading.Lock()
+
+    def run(self, func: Callable, *args):
+        """
+        Runs `func` on a worker, blocking the calling thread until it's done.
+
+        Raises: Http503ServerBusy
+        """
+        if self.workers <= 0:
+            return func(*args)
+        self._admit()
+        try:
+            return self._get_executor().submit(func, *args).result()
+        finally:
+            self._slots.release()
+
+    async def run_async(self, func: Callable, *args):
+        """
+        Runs `func` on a worker without holding a thread while it waits.
+
+        With 0 workers, work runs in the event loop's default executor.
+
+        Raises: Http503ServerBusy
+        """
+        loop = asyncio.get_running_loop()
+        if self.workers <= 0:
+            return await loop.run_in_executor(None, func, *args)
+        self._admit()
+        try:
+            return await loop.run_in_executor(self._get_executor(), func, *args)
+        finally:
+            self._slots.release()
+
+    def map(self, func: Callable, iterable: Iterable) -> List:
+        """
+        Runs `func` over `iterable` on every worker at once.
+
+        The batch is admitted as a single request.
+
+        Raises: Http503ServerBusy
+        """
+        if self.workers <= 0:
+            return [func(item) for item in iterable]
+        self._admit()
+        try:
+            return list(self._get_executor().map(func, iterable))
+        finally:
+            self._slots.release()
+
+    async def map_async(self, func: Callable, iterable: Iterable) -> List:
+        """
+        Like `map`, without holding a thread while the batch runs.
+
+        Raises: Http503ServerBusy
+        """
+        loop = asyncio.get_running_loop()
+        if self.workers <= 0:
+            return await loop.run_in_executor(None, list, map(func, iterable))
+        self._admit()
+        try:
+            futures = [
+                loop.run_in_executor(self._get_executor(), func, item)
+                for item in iterable
+            ]
+            return list(await asyncio.gather(*futures))
+        finally:
+            self._slots.release()
+
+    def _admit(self) -> None:
+        if not self._slots.acquire(blocking=False):
+            raise Http503ServerBusy(headers={"Retry-After": str(self.retry_after)})
+
+    def shutdown(self) -> None:
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        # Processes are started lazily so that importing the app stays cheap.
+        #  By then the app's threads (relay, sweeper, ingester, the threadpool)
+        #  are running, and a forked child could inherit a lock one of them
+        #  holds, so workers are started from a fresh process instead.
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        mp_context=multiprocessing.get_context("forkserver"),
+                    )
+        return self._executor
+
+
+########################################################################################
+# Normalization runs on every login and lookup by name, usually for the same
+#  handful of names, so results are memoized
+@lru_cache(maxsize=settings.USER_NAME_CACHE_SIZE)
+def _normalize(text: str) -> str:
+    return unicodedata.normalize("NFKD", text).lower()
+
+
+########################################################################################
 class Security:
     ALGORITHM = "HS256"
-    pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+    pwd_context = _pwd_context
+
+    def __init__(self):
+        self.password_pool = PasswordPool(
+            workers=settings.PASSWORD_HASH_WORKERS,
+            queue_depth=settings.PASSWORD_HASH_QUEUE_DEPTH,
+            retry_after=settings.PASSWORD_HASH_RETRY_AFTER_SECONDS,
+        )
 
     def create_access_token(
         self, subject: Union[str, Any], expires_delta: TimeDelta = None
@@ -122,10 +345,49 @@ class Security:
         return jwt.encode(to_encode, settings.SECRET_KEY, algorithm=self.ALGORITHM)
 
     def hash_password(self, password: str) -> str:
-        return self.pwd_context.hash(password)
+        """ Raises: Http503ServerBusy """
+        return self.password_pool.run(_hash_password, password)
+
+    def hash_passwords(self, passwords: List[str]) -> List[str]:
+        """ Raises: Http503ServerBusy """
+        if not passwords:
+            return []
+        return self.password_pool.map(_hash_password, passwords)
+
+    async def hash_password_async(self, password: str) -> str:
+        """ Raises: Http503ServerBusy """
+        return await self.password_pool.run_async(_hash_password, password)
+
+    async def hash_passwords_async(self, passwords: List[str]) -> List[str]:
+        """ Raises: Http503ServerBusy """
+        if not passwords:
+            return []
+        return await self.password_pool.map_async(_hash_password, passwords)
 
     def verify_password(self, plain_password: str, hashed_password: str) -> bool:
-        return self.pwd_context.verify(plain_password, hashed_password)
+        """ Raises: Http503ServerBusy """
+        return self.verify_and_update_password(plain_password, hashed_password)[0]
+
+    def verify_and_update_password(
+        self, plain_password: str, hashed_password: str
+    ) -> Tuple[bool, Optional[str]]:
+        """
+        Returns whether the password matches
+        and, if the hash uses deprecated settings, a replacement hash.
+
+        Raises: Http503ServerBusy
+        """
+        return self.password_pool.run(
+            _verify_and_update_password, plain_password, hashed_password
+        )
+
+    async def verify_and_update_password_async(
+        self, plain_password: str, hashed_password: str
+    ) -> Tuple[bool, Optional[str]]:
+        """ Raises: Http503ServerBusy """
+        return await self.password_pool.run_async(
+            _verify_and_update_password, plain_password, hashed_password
+        )
 
     def to_identifier(self, text: str) -> str:
         """ Normalizes utf-8 strings using normalization form KD and lowercase characters """
@@ -137,11 +399,10 @@ class Security:
         #   then composes pre-combined characters again...
         #   The normal form KD (NFKD) will apply the compatibility decomposition,
         #   i.e. replace all compatibility characters with their equivalents.
-        name = unicodedata.normalize("NFKD", text).lower()
+        name = _normalize(text)
         if "#" in name:
             raise
         return name
 
 
-settings = Settings()
 security = Security()
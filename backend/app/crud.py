@@ -1,39 +1,74 @@
 __all__ = [
     "user",
     "room",
-    "quiz"
+    "quiz",
+    "quiz_session",
+    "student_response",
+    "quiz_rollup",
 ]
 
 # Todo: These methods fetch unnecessary information by default
 #  If efficiency becomes an issue,
 #  API Endpoints should get their own custom CRUD methods
 
+import json
+import re
+import threading
+from base64 import urlsafe_b64encode, urlsafe_b64decode
+from datetime import datetime as DateTime
 from typing import (
     Any,
     Dict,
     Generic,
+    Iterator,
     List,
+    NoReturn,
     Optional,
+    Set,
+    Tuple,
     Type,
     TypeVar,
     Union,
     NamedTuple,
 )
+from uuid import UUID as PyUUID
 
+from fastapi.concurrency import run_in_threadpool
 from fastapi.encoders import jsonable_encoder
 import jsonpatch
-from pydantic import BaseModel
-from sqlalchemy import text
-from sqlalchemy.dialects.postgresql import UUID
+from pydantic import BaseModel, ValidationError
+from sqlalchemy import (
+    text,
+    select,
+    insert,
+    update,
+    delete,
+    values,
+    column,
+    case,
+    cast,
+    literal,
+    tuple_,
+    func,
+    literal_column,
+    false,
+    null,
+)
+from sqlalchemy.dialects.postgresql import UUID, JSONB, ARRAY, insert as pg_insert
+from sqlalchemy.sql.elements import ColumnElement
+from sqlalchemy.sql.sqltypes import BOOLEAN, TEXT
 from sqlalchemy.engine import CursorResult
 from sqlalchemy.exc import (
     NoResultFound as sqlalchemy_NoResultFound,
     MultipleResultsFound as sqlalchemy_MultipleResultsFound,
     IntegrityError as sqlalchemy_IntegrityError,
 )
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, joinedload
 
-from app.core import security
+from app.answer_key import AnswerKey, to_bucket
+from app.cache import LRUCache
+from app.core import security, settings
+from app.room_codes import RoomCodeAllocator
 from app.exceptions import (
     Http404UserNotFound,
     Http400IncorrectPassword,
@@ -42,18 +77,30 @@ from app.exceptions import (
     Http404QuizNotFound,
     IntegrityError,
     Http403QuizNameConflict,
+    Http400InvalidCursor,
+    Http403RoomCodeConflict,
+    Http422InvalidQuizContent,
 )
 from app.models import (
     Base,
     User,
     Quiz,
+    QuizRevision,
+    QuizRollup,
+    QuizSnapshot,
+    QuizSession,
     Room,
+    StudentResponse,
 )
 from app.schemas import (
     UserCreate,
     UserUpdate,
     RoomCreate,
     RoomUpdate, QuizUpdate, QuizCreate,
+    QuizSessionCreate,
+    QuizSessionUpdate,
+    StudentResponseCreate,
+    _QuizContent,
 )
 
 ModelType = TypeVar("ModelType", bound=Base)
@@ -66,6 +113,21 @@ class _ModelAndSchema(NamedTuple):
     schema: Optional[Union[CreateSchemaType, UpdateSchemaType, Dict]]
 
 
+def _encode_cursor(obj: Base) -> str:
+    # The cursor is opaque to the client; it is the (ts, id) of the last object
+    position = json.dumps([obj.ts.isoformat(), str(obj.id)])
+    return urlsafe_b64encode(position.encode()).decode()
+
+
+def _decode_cursor(cursor: str) -> Tuple[DateTime, PyUUID]:
+    """ Raises: Http400InvalidCursor """
+    try:
+        ts, id = json.loads(urlsafe_b64decode(cursor.encode()))
+        return DateTime.fromisoformat(ts), PyUUID(id)
+    except (ValueError, TypeError) as err:
+        raise Http400InvalidCursor from err
+
+
 # Todo: Wrap defaults in Results
 class _CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
     def __init__(self, model: Type[ModelType]):
@@ -80,44 +142,98 @@ class _CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         self.model = model
 
     def create(self, db: Session, *, obj_in: CreateSchemaType) -> ModelType:
-        obj_in_data = jsonable_encoder(obj_in)
-        db_obj = self.model(**obj_in_data)  # type: ignore
-        db.add(db_obj)
+        """ INSERT ... RETURNING *; the object is built from the returned row """
+        table = self.model.__table__
+        statement = (
+            insert(table).values(**jsonable_encoder(obj_in)).returning(*table.columns)
+        )
+        row = db.execute(statement).mappings().one()
         db.commit()
-        db.refresh(db_obj)  # Todo: Look up what this does
-        return db_obj
+        return self.model(**row)
 
     def get(self, db: Session, id: Any) -> Optional[ModelType]:
         return db.query(self.model).filter(self.model.id == id).first()
 
     def get_multi(
-        self, db: Session, *, skip: int = 0, limit: int = 100
-    ) -> List[ModelType]:
-        return db.query(self.model).offset(skip).limit(limit).all()
+        self, db: Session, *, cursor: Optional[str] = None, limit: int = 100, **where
+    ) -> Tuple[List[ModelType], Optional[str]]:
+        """
+        Returns a page of objects ordered by (ts, id) and the cursor of the next page.
+
+        Pages are found by seeking past the previous page's last (ts, id)
+        rather than with OFFSET, so deep pages are as fast as the first.
+        The next cursor is None on the last page.
+
+        Raises: Http400InvalidCursor
+        """
+        query = self._ordered(db, **where)
+        if cursor:
+            ts, id = _decode_cursor(cursor)
+            position = tuple_(
+                literal(ts, self.model.ts.type), literal(id, self.model.id.type)
+            )
+            query = query.filter(tuple_(self.model.ts, self.model.id) > position)
+        objs = query.limit(limit + 1).all()
+        if len(objs) <= limit:
+            return objs, None
+        objs = objs[:limit]
+        return objs, _encode_cursor(objs[-1])
+
+    def stream(
+        self, db: Session, *, batch_size: int = 500, **where
+    ) -> Iterator[ModelType]:
+        """
+        Yields every object ordered by (ts, id).
+
+        Rows are fetched `batch_size` at a time from a server-side cursor,
+        so memory use doesn't grow with the number of rows.
+        """
+        yield from self._ordered(db, **where).yield_per(batch_size)
+
+    def _ordered(self, db: Session, **where):
+        return (
+            db.query(self.model)
+            .filter_by(**where)
+            .order_by(self.model.ts, self.model.id)
+        )
 
     def update(
         self,
         db: Session,
         *,
-        db_obj: ModelType,
+        id: Any,
         obj_in: Union[UpdateSchemaType, Dict[str, Any]],
-    ) -> ModelType:
-        obj_data = jsonable_encoder(db_obj)
-        print("obj_data type", type(obj_data))
-        if isinstance(obj_in, dict):
-            update_data = obj_in
-        else:
-            update_data = obj_in.dict(exclude_unset=True)
-        for field in obj_data:
-
-            if field in update_data:
-                print(update_data[field])
-                setattr(db_obj, field, update_data[field])
+        **where: Any,
+    ) -> Optional[ModelType]:
+        """
+        UPDATE ... SET <changed columns> WHERE id = :id RETURNING *
 
-        db.add(db_obj)
+        The row isn't read first. Extra keyword arguments are added to the WHERE
+        clause (e.g. `owner_id=user.id`), so permission checks don't need
+        their own query.
+        Returns None if no row matched.
+        """
+        table = self.model.__table__
+        update_data = {
+            f: v
+            for f, v in self._update_data(obj_in).items()
+            if f != "id" and f in table.c
+        }
+        criteria = [table.c.id == id] + [table.c[k] == v for k, v in where.items()]
+        if update_data:
+            statement = (
+                update(table)
+                .where(*criteria)
+                .values(update_data)
+                .returning(*table.columns)
+            )
+        else:
+            statement = select(*table.columns).where(*criteria)
+        row = db.execute(statement).mappings().one_or_none()
         db.commit()
-        db.refresh(db_obj)
-        return db_obj
+        if row is None:
+            return None
+        return self.model(**row)
 
     def remove(self, db: Session, *, id: UUID) -> int:
         obj = db.query(self.model).get(id)
@@ -125,6 +241,98 @@ class _CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         db.commit()
         return 1
 
+    # Bulk methods
+    #  Each method sends a single statement and commits once,
+    #  regardless of how many objects are passed.
+    #  Postgres limits a statement to 65535 parameters,
+    #  so very large batches should be split by the caller.
+    def create_many(
+        self, db: Session, *, objs_in: List[CreateSchemaType]
+    ) -> List[ModelType]:
+        """ INSERT ... VALUES (...), (...) RETURNING * """
+        if not objs_in:
+            return []
+        table = self.model.__table__
+        statement = (
+            insert(table)
+            .values([jsonable_encoder(obj_in) for obj_in in objs_in])
+            .returning(*table.columns)
+        )
+        rows = db.execute(statement).mappings().all()
+        db.commit()
+        return [self.model(**row) for row in rows]
+
+    def update_many(
+        self,
+        db: Session,
+        *,
+        objs_in: List[Union[UpdateSchemaType, Dict[str, Any]]],
+    ) -> List[ModelType]:
+        """
+        UPDATE ... FROM (VALUES (...), (...)) RETURNING *
+
+        Every object must include its `id`. Only the fields an object sets are
+        changed, so objects in the same batch may update different columns.
+        """
+        if not objs_in:
+            return []
+        table = self.model.__table__
+        updates = [self._update_data(obj_in) for obj_in in objs_in]
+        fields = sorted(
+            {f for data in updates for f in data if f != "id" and f in table.c}
+        )
+        if not fields:
+            return []
+
+        # Each field gets a value and a flag marking if the value was set.
+        #  Values are cast to the column's type; untyped VALUES default to text.
+        new_columns = [column("id", table.c.id.type)]
+        for f in fields:
+            new_columns.append(column(f, table.c[f].type))
+            new_columns.append(column(f"{f}__is_set", BOOLEAN))
+        new_rows = []
+        for data in updates:
+            row = [data["id"]]
+            for f in fields:
+                row.append(data.get(f))
+                row.append(f in data)
+            new_rows.append(tuple(row))
+        new = values(*new_columns, name="new").data(new_rows)
+
+        statement = (
+            update(table)
+            .where(table.c.id == cast(new.c.id, table.c.id.type))
+            .values(
+                {
+                    f: case(
+                        (new.c[f"{f}__is_set"], cast(new.c[f], table.c[f].type)),
+                        else_=table.c[f],
+                    )
+                    for f in fields
+                }
+            )
+            .returning(*table.columns)
+        )
+        rows = db.execute(statement).mappings().all()
+        db.commit()
+        return [self.model(**row) for row in rows]
+
+    def remove_many(self, db: Session, *, ids: List[UUID]) -> int:
+        """ DELETE ... WHERE id IN (...) RETURNING id """
+        if not ids:
+            return 0
+        table = self.model.__table__
+        statement = delete(table).where(table.c.id.in_(ids)).returning(table.c.id)
+        removed = db.execute(statement).scalars().all()
+        db.commit()
+        return len(removed)
+
+    @staticmethod
+    def _update_data(obj_in: Union[UpdateSchemaType, Dict[str, Any]]) -> Dict:
+        if isinstance(obj_in, dict):
+            return obj_in.copy()
+        return obj_in.dict(exclude_unset=True)
+
     # # Todo: Typing: I don't understand what a symbol is,
     # #  and Pycharm says it's the wrong type
     # def _match_by_id(
@@ -143,20 +351,52 @@ class _CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
 
 
 class CRUDUser(_CRUDBase[User, UserCreate, UserUpdate]):
-    def create(self, db: Session, *, obj_in: UserCreate) -> User:
+    def __init__(self, model: Type[User]):
+        super().__init__(model)
+        # (user id, token) -> the user's columns
+        #  Each entry is tagged with the user id so that every token of a user
+        #  can be invalidated at once.
+        self.principals: LRUCache = LRUCache(
+            maxsize=settings.PRINCIPAL_CACHE_SIZE,
+            ttl=settings.PRINCIPAL_CACHE_TTL_SECONDS,
+        )
+        # (identifier name, number) -> user id, tagged with the user id.
+        #  Only the id is cached: hits load the user by primary key and check
+        #  its name, so credentials and renames made by another worker are
+        #  never served stale.
+        self.names: LRUCache = LRUCache(maxsize=settings.USER_NAME_CACHE_SIZE)
+
+    def create(
+        self, db: Session, *, obj_in: UserCreate, hashed_password: Optional[str] = None
+    ) -> User:
+        """
+        `hashed_password`, if given, is obj_in.password already hashed,
+        e.g. by a route that hashes off the threadpool.
+        """
         # The purpose of using SQLAlchemy is to make life easier
         #  Sometimes, writing raw SQL is easiest way to express your thoughts
+        #
+        # Numbers are allocated from a per-name counter (models.UserNumber).
+        #  The upsert locks the counter row, so concurrent sign-ups with the same
+        #  name queue behind each other for the length of one statement
+        #  instead of racing for the same number and failing the unique constraint.
+        #  The first time a name is seen, the counter starts after the name's
+        #  highest existing number.
         statement = text(
             """
-            WITH highest_number AS (
-              SELECT COALESCE(
-                (
-                  SELECT number FROM "user"
-                    WHERE identifier_name = :identifier_name
-                    ORDER BY number desc limit 1
-                ),
-                0
+            WITH allocated AS (
+              INSERT INTO user_number(identifier_name, last_number)
+              VALUES(
+                :identifier_name,
+                COALESCE(
+                  (SELECT max(number) FROM "user"
+                    WHERE identifier_name = :identifier_name),
+                  0
+                ) + 1
               )
+              ON CONFLICT (identifier_name)
+                DO UPDATE SET last_number = user_number.last_number + 1
+              RETURNING last_number
             )
             INSERT INTO "user"(
               display_name, hashed_password, is_superuser, is_active,
@@ -164,7 +404,7 @@ class CRUDUser(_CRUDBase[User, UserCreate, UserUpdate]):
             )
             VALUES(
               :display_name, :hashed_password, :is_superuser, true,
-              (SELECT * FROM highest_number) + 1
+              (SELECT last_number FROM allocated)
             )
             RETURNING *
             """
@@ -172,7 +412,8 @@ class CRUDUser(_CRUDBase[User, UserCreate, UserUpdate]):
         identifier_name = security.to_identifier(obj_in.display_name)
         if obj_in.is_superuser and not (identifier_name == "admin"):
             raise PermissionError("Only admins can create super users")
-        hashed_password = security.hash_password(obj_in.password)
+        if hashed_password is None:
+            hashed_password = security.hash_password(obj_in.password)
         cursor: CursorResult = db.execute(
             statement,
             {
@@ -182,8 +423,8 @@ class CRUDUser(_CRUDBase[User, UserCreate, UserUpdate]):
                 "identifier_name": identifier_name,
             },
         )
-        db.commit()
         row = cursor.mappings().one()
+        db.commit()
         return User(**row)
 
     def get_by_name(
@@ -197,12 +438,25 @@ class CRUDUser(_CRUDBase[User, UserCreate, UserUpdate]):
             if number:
                 raise ValueError("A number and hash symbol were both passed")
             number = _number
-
-        if not (_name and number):
-            # Todo: Error handling
-            pass
+        try:
+            number = int(number)
+        except (TypeError, ValueError) as err:
+            raise Http404UserNotFound from err
 
         normalized_name = security.to_identifier(_name)
+        key = (normalized_name, number)
+        id = self.names.get(key)
+        if id is not None:
+            # Primary key lookup; free if the user is already in the session
+            _user = db.get(User, id)
+            if (
+                _user is not None
+                and _user.identifier_name == normalized_name
+                and _user.number == number
+            ):
+                return _user
+            self.names.pop(key)
+
         # Todo: normalize errors. Maybe use "one" instead of "one or none"?
         _user = (
             db.query(User)
@@ -211,13 +465,183 @@ class CRUDUser(_CRUDBase[User, UserCreate, UserUpdate]):
         )
         if _user is None:
             raise Http404UserNotFound
+        self.names.set(key, _user.id, tag=_user.id)
+        return _user
+
+    def get_principal(self, db: Session, *, id: Any, token: str) -> Optional[User]:
+        """ Returns the user a token belongs to, skipping the database when cached """
+        key = (id, token)
+        row = self.principals.get(key)
+        if row is None:
+            user = self.get(db, id=id)
+            if user is None:
+                return None
+            row = {c.key: getattr(user, c.key) for c in User.__table__.columns}
+            self.principals.set(key, row, tag=id)
+        # A new (transient) object is returned every time
+        #  so requests never share, or expire, the same instance
+        return User(**row)
+
+    def update(
+        self,
+        db: Session,
+        *,
+        id: Any,
+        obj_in: Union[UserUpdate, Dict[str, Any]],
+        **where: Any,
+    ) -> Optional[User]:
+        update_data = self._update_data(obj_in)
+        if update_data.get("password"):
+            update_data["hashed_password"] = security.hash_password(
+                update_data.pop("password")
+            )
+        _user = super().update(db, id=id, obj_in=update_data, **where)
+        self._invalidate(id)
         return _user
 
-    def authenticate(self, db: Session, *, username: str, password: str) -> User:
-        """Raises: Http404UserNotFound, Http400IncorrectPassword"""
-        user = self.get_by_name(db, name=username)
-        if not security.verify_password(password, user.hashed_password):
+    def deactivate(self, db: Session, *, id: Any) -> Optional[User]:
+        return self.update(db, id=id, obj_in={"is_active": False})
+
+    def create_many(
+        self,
+        db: Session,
+        *,
+        objs_in: List[UserCreate],
+        hashed_passwords: Optional[List[str]] = None,
+    ) -> List[User]:
+        """
+        Creates every user with a single INSERT.
+
+        Users sharing a name (e.g. "dave" and "Dave") get consecutive numbers
+        in the order they were passed.
+        `hashed_passwords`, if given, are the passwords of objs_in already hashed.
+        """
+        if not objs_in:
+            return []
+        statement = text(
+            """
+            WITH new_user AS (
+              SELECT * FROM unnest(
+                CAST(:display_names AS VARCHAR[]),
+                CAST(:hashed_passwords AS TEXT[]),
+                CAST(:is_superusers AS BOOL[]),
+                CAST(:identifier_names AS VARCHAR[])
+              ) WITH ORDINALITY AS t(
+                display_name, hashed_password, is_superuser, identifier_name, ord
+              )
+            ),
+            name_count AS (
+              SELECT identifier_name, count(*) AS n FROM new_user
+                GROUP BY identifier_name
+            ),
+            -- Reserves a block of n numbers per name.
+            --  Counters are locked in name order so concurrent batches can't deadlock.
+            allocated AS (
+              INSERT INTO user_number(identifier_name, last_number)
+              SELECT
+                c.identifier_name,
+                COALESCE(
+                  (SELECT max(number) FROM "user" u
+                    WHERE u.identifier_name = c.identifier_name),
+                  0
+                ) + c.n
+              FROM name_count c
+              ORDER BY c.identifier_name
+              ON CONFLICT (identifier_name)
+                DO UPDATE SET last_number = user_number.last_number + (
+                  SELECT n FROM name_count
+                    WHERE identifier_name = EXCLUDED.identifier_name
+                )
+              RETURNING identifier_name, last_number
+            )
+            INSERT INTO "user"(
+              display_name, hashed_password, is_superuser, is_active,
+              number
+            )
+            SELECT
+              n.display_name, n.hashed_password, n.is_superuser, true,
+              a.last_number - c.n + row_number() OVER (
+                PARTITION BY n.identifier_name ORDER BY n.ord
+              )
+            FROM new_user n
+              JOIN name_count c USING (identifier_name)
+              JOIN allocated a USING (identifier_name)
+            ORDER BY n.ord
+            RETURNING *
+            """
+        )
+        identifier_names = [security.to_identifier(o.display_name) for o in objs_in]
+        for obj_in, identifier_name in zip(objs_in, identifier_names):
+            if obj_in.is_superuser and not (identifier_name == "admin"):
+                raise PermissionError("Only admins can create super users")
+        if hashed_passwords is None:
+            hashed_passwords = security.hash_passwords([o.password for o in objs_in])
+        cursor: CursorResult = db.execute(
+            statement,
+            {
+                "display_names": [o.display_name for o in objs_in],
+                "hashed_passwords": hashed_passwords,
+                "is_superusers": [o.is_superuser for o in objs_in],
+                "identifier_names": identifier_names,
+            },
+        )
+        db.commit()
+        return [User(**row) for row in cursor.mappings()]
+
+    def update_many(
+        self,
+        db: Session,
+        *,
+        objs_in: List[Union[UserUpdate, Dict[str, Any]]],
+    ) -> List[User]:
+        updates = [self._update_data(obj_in) for obj_in in objs_in]
+        to_hash = [data for data in updates if data.get("password")]
+        hashed_passwords = security.hash_passwords(
+            [data.pop("password") for data in to_hash]
+        )
+        for data, hashed_password in zip(to_hash, hashed_passwords):
+            data["hashed_password"] = hashed_password
+        users = super().update_many(db, objs_in=updates)
+        for _user in users:
+            self._invalidate(_user.id)
+        return users
+
+    def remove(self, db: Session, *, id: UUID) -> int:
+        removed = super().remove(db, id=id)
+        self._invalidate(id)
+        return removed
+
+    def remove_many(self, db: Session, *, ids: List[UUID]) -> int:
+        removed = super().remove_many(db, ids=ids)
+        for id in ids:
+            self._invalidate(id)
+        return removed
+
+    def _invalidate(self, id: Any) -> None:
+        # Drops everything cached about a user, e.g. after a rename
+        self.principals.invalidate(id)
+        self.names.invalidate(id)
+
+    async def authenticate(
+        self, db: Session, *, username: str, password: str
+    ) -> User:
+        """
+        Database work runs in the threadpool; the password is checked
+        in the password pool without holding a thread.
+
+        Raises: Http404UserNotFound, Http400IncorrectPassword, Http503ServerBusy
+        """
+        user = await run_in_threadpool(self.get_by_name, db, name=username)
+        is_correct, new_hash = await security.verify_and_update_password_async(
+            password, user.hashed_password
+        )
+        if not is_correct:
             raise Http400IncorrectPassword
+        if new_hash:
+            # The hash was made with outdated settings (e.g. fewer bcrypt rounds)
+            await run_in_threadpool(
+                self.update, db, id=user.id, obj_in={"hashed_password": new_hash}
+            )
         return user
 
     # Todo: Figure out point of method. It's in the cookiecutter so there has to be a
@@ -230,11 +654,260 @@ class CRUDUser(_CRUDBase[User, UserCreate, UserUpdate]):
 
 
 class CRUDRoom(_CRUDBase[Room, RoomCreate, RoomUpdate]):
+    def __init__(self, model: Type[Room]):
+        super().__init__(model)
+        # Codes are claimed when a room is created and released when it's closed.
+        #  Codes of rooms that were active before the process started
+        #  are claimed the first time a room is created.
+        # When rooms are sharded, this process only allocates the codes it owns
+        self.codes = RoomCodeAllocator(
+            cooldown=settings.ROOM_CODE_COOLDOWN_SECONDS,
+            shard=settings.SHARD,
+            shards=settings.SHARDS,
+        )
+        self._codes_loaded = False
+        # code -> (the room's columns, its sessions' columns),
+        #  tagged with the room id
+        self.active: LRUCache = LRUCache(
+            maxsize=settings.ACTIVE_ROOM_CACHE_SIZE,
+            ttl=settings.ACTIVE_ROOM_CACHE_TTL_SECONDS,
+        )
+        # Ids of rooms joined since the last flush_activity
+        self._touched: Set[PyUUID] = set()
+        self._touched_lock = threading.Lock()
+
+    def create(self, db: Session, *, obj_in: RoomCreate) -> Room:
+        """ Raises: Http403RoomCodeConflict, Http503ServerBusy """
+        return self.create_many(db, objs_in=[obj_in])[0]
+
+    def create_many(self, db: Session, *, objs_in: List[RoomCreate]) -> List[Room]:
+        """
+        INSERT ... ON CONFLICT DO NOTHING RETURNING *
+
+        Rooms without a code get one from self.codes. A code that another
+        process claimed in the meantime is re-allocated once; a code that was
+        asked for, or collides twice, raises.
+
+        Raises: Http403RoomCodeConflict, Http503ServerBusy
+        """
+        if not objs_in:
+            return []
+        if not self._codes_loaded:
+            self.codes.load(
+                db.execute(select(Room.code).where(Room.is_active == True)).scalars()
+            )
+            self._codes_loaded = True
+        data = [jsonable_encoder(obj_in) for obj_in in objs_in]
+        allocated = []
+        for room_data in data:
+            if room_data["code"] is None:
+                room_data["code"] = self.codes.allocate()
+                allocated.append(room_data["code"])
+        rows = self._insert(db, data)
+        skipped = [i for i, row in enumerate(rows) if row is None]
+        if skipped and all(objs_in[i].code is None for i in skipped):
+            # Only another process can have claimed the codes;
+            #  this process's allocator never hands out the same code twice.
+            #  Its rooms may close without this process hearing of it,
+            #  so the active codes are reloaded rather than claimed one by one.
+            self.codes.reload(
+                db.execute(select(Room.code).where(Room.is_active == True)).scalars()
+            )
+            for i in skipped:
+                allocated.remove(data[i]["code"])
+                data[i]["code"] = self.codes.allocate()
+                allocated.append(data[i]["code"])
+            for i, row in zip(skipped, self._insert(db, [data[i] for i in skipped])):
+                rows[i] = row
+        if any(row is None for row in rows):
+            db.rollback()
+            # The reload may have claimed the codes of rooms that were rolled back
+            for code in allocated + [row["code"] for row in rows if row is not None]:
+                self.codes.release(code)
+            raise Http403RoomCodeConflict
+        db.commit()
+        rooms = [Room(**row) for row in rows]
+        for room in rooms:
+            self._track_code(room)
+        return rooms
+
+    @staticmethod
+    def _insert(db: Session, data: List[Dict[str, Any]]) -> List[Optional[Dict]]:
+        # A room whose code an active room is using is skipped rather than
+        #  raising, so the transaction doesn't need to be rolled back.
+        #  (The code's exclusion constraint can't be an ON CONFLICT target.)
+        # Returns each room's row, or None where it was skipped
+        table = Room.__table__
+        statement = (
+            pg_insert(table)
+            .values(data)
+            .on_conflict_do_nothing()
+            .returning(*table.columns)
+        )
+        inserted: Dict[str, List[Dict]] = {}
+        for row in db.execute(statement).mappings():
+            inserted.setdefault(row["code"], []).append(dict(row))
+        rows = []
+        for room_data in data:
+            matches = inserted.get(room_data["code"])
+            rows.append(matches.pop(0) if matches else None)
+        return rows
+
+    def update(
+        self,
+        db: Session,
+        *,
+        id: Any,
+        obj_in: Union[RoomUpdate, Dict[str, Any]],
+        **where: Any,
+    ) -> Optional[Room]:
+        update_data = self._update_data(obj_in)
+        update_data["last_active"] = func.now()
+        room = super().update(db, id=id, obj_in=update_data, **where)
+        if room is not None:
+            self._track_code(room)
+        return room
+
+    def update_many(
+        self, db: Session, *, objs_in: List[Union[RoomUpdate, Dict[str, Any]]]
+    ) -> List[Room]:
+        updates = [self._update_data(obj_in) for obj_in in objs_in]
+        for update_data in updates:
+            update_data["last_active"] = func.now()
+        rooms = super().update_many(db, objs_in=updates)
+        for room in rooms:
+            self._track_code(room)
+        return rooms
+
+    def remove(self, db: Session, *, id: UUID) -> int:
+        return self.remove_many(db, ids=[id])
+
+    def remove_many(self, db: Session, *, ids: List[UUID]) -> int:
+        """ DELETE ... WHERE id IN (...) RETURNING code """
+        if not ids:
+            return 0
+        statement = delete(Room).where(Room.id.in_(ids)).returning(Room.code)
+        codes = db.execute(statement).scalars().all()
+        db.commit()
+        for id in ids:
+            self.active.invalidate(id)
+        for code in codes:
+            self.codes.release(code)
+        return len(codes)
+
+    def _track_code(self, room: Room) -> None:
+        self.active.invalidate(room.id)
+        if room.is_active:
+            self.codes.claim(room.code)
+        else:
+            self.codes.release(room.code)
+
     def get_by_code(self, db: Session, *, code: str) -> Room:
-        """ Raises: sqlalchemy_NoResultFound, sqlalchemy_MultipleResultsFound"""
+        """
+        Returns the active room with the code, with its sessions.
+
+        Served from memory when cached; otherwise the room and its sessions
+        are loaded with one query.
+
+        Raises: Http404ActiveRoomNotFound, Http404InvalidRequestError
+        """
+        cached = self.active.get(code)
+        if cached is None:
+            room = self._get_by_code(db, code=code)
+            cached = (
+                _columns(room),
+                [_columns(quiz_session) for quiz_session in room.session],
+            )
+            self.active.set(code, cached, tag=room.id)
+        # New (transient) objects every time, so requests never share an instance
+        room, sessions = cached
+        with self._touched_lock:
+            self._touched.add(room["id"])
+        return Room(**room, session=[QuizSession(**s) for s in sessions])
+
+    def flush_activity(self, db: Session) -> int:
+        """
+        Writes the last_active time of every room joined since the last flush.
+
+        Joins are usually served from the cache,
+        so they are written in one UPDATE instead of one per join.
+        """
+        with self._touched_lock:
+            ids, self._touched = self._touched, set()
+        if not ids:
+            return 0
+        table = Room.__table__
+        statement = (
+            update(table)
+            .where(table.c.id.in_(ids), table.c.is_active == True)
+            .values(last_active=func.now())
+        )
+        updated = db.execute(statement).rowcount
+        db.commit()
+        return updated
+
+    def deactivate_idle(self, db: Session, *, idle_seconds: int, limit: int) -> int:
+        """
+        Closes up to `limit` rooms that have been idle for `idle_seconds`,
+        and their active sessions, in one statement.
+
+        Rooms locked by another transaction are skipped (FOR UPDATE SKIP LOCKED),
+        so sweeps never wait on, or deadlock with, requests or other sweepers.
+        Returns the number of rooms closed.
+        The closed sessions are rolled up later (see
+        CRUDQuizRollup.add_closed_sessions).
+        """
+        idle = (
+            select(Room.id)
+            .where(
+                Room.is_active == True,
+                Room.last_active
+                < func.now() - func.make_interval(0, 0, 0, 0, 0, 0, idle_seconds),
+            )
+            .order_by(Room.last_active)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+            .cte("idle")
+        )
+        table = Room.__table__
+        # false() rather than False: SQLAlchemy can't compile the same bound
+        #  parameter in both CTEs
+        rooms = (
+            update(table)
+            .where(table.c.id == idle.c.id)
+            .values(is_active=false())
+            .returning(*table.columns)
+            .cte("rooms")
+        )
+        sessions = QuizSession.__table__
+        closed_sessions = (
+            update(sessions)
+            .where(sessions.c.room_id == rooms.c.id, sessions.c.is_active == True)
+            .values(is_active=false())
+            .returning(sessions.c.id)
+            .cte("closed_sessions")
+        )
+        # The sessions' update is only rendered if the final SELECT references it
+        statement = select(
+            *rooms.c,
+            select(func.count())
+            .select_from(closed_sessions)
+            .scalar_subquery()
+            .label("closed_sessions"),
+        )
+        rows = db.execute(statement).mappings().all()
+        db.commit()
+        for row in rows:
+            self._track_code(Room(**{c.key: row[c.key] for c in table.columns}))
+        return len(rows)
+
+    def _get_by_code(self, db: Session, *, code: str) -> Room:
         try:
             return (
-                db.query(Room).filter(Room.code == code, Room.is_active == True).one()
+                db.query(Room)
+                .options(joinedload(Room.session))
+                .filter(Room.code == code, Room.is_active == True)
+                .one()
             )
         except (
             sqlalchemy_NoResultFound,
@@ -246,25 +919,1004 @@ class CRUDRoom(_CRUDBase[Room, RoomCreate, RoomUpdate]):
             raise Http404InvalidRequestError from err
 
 
+class CRUDQuizSession(
+    _CRUDBase[QuizSession, QuizSessionCreate, QuizSessionUpdate]
+):
+    # Rooms are cached with their sessions (see CRUDRoom.get_by_code),
+    #  so every write invalidates the session's room
+    def create(self, db: Session, *, obj_in: QuizSessionCreate) -> QuizSession:
+        quiz_session = super().create(db, obj_in=obj_in)
+        room.active.invalidate(quiz_session.room_id)
+        return quiz_session
+
+    def create_many(
+        self, db: Session, *, objs_in: List[QuizSessionCreate]
+    ) -> List[QuizSession]:
+        quiz_sessions = super().create_many(db, objs_in=objs_in)
+        for quiz_session in quiz_sessions:
+            room.active.invalidate(quiz_session.room_id)
+        return quiz_sessions
+
+    def update(
+        self,
+        db: Session,
+        *,
+        id: Any,
+        obj_in: Union[QuizSessionUpdate, Dict[str, Any]],
+        **where: Any,
+    ) -> Optional[QuizSession]:
+        quiz_session = super().update(db, id=id, obj_in=obj_in, **where)
+        if quiz_session is not None:
+            room.active.invalidate(quiz_session.room_id)
+            if not quiz_session.is_active:
+                quiz_rollup.add_session(db, quiz_session_id=quiz_session.id)
+        return quiz_session
+
+    def update_many(
+        self,
+        db: Session,
+        *,
+        objs_in: List[Union[QuizSessionUpdate, Dict[str, Any]]],
+    ) -> List[QuizSession]:
+        quiz_sessions = super().update_many(db, objs_in=objs_in)
+        for quiz_session in quiz_sessions:
+            room.active.invalidate(quiz_session.room_id)
+            if not quiz_session.is_active:
+                quiz_rollup.add_session(db, quiz_session_id=quiz_session.id)
+        return quiz_sessions
+
+    def remove_many(self, db: Session, *, ids: List[UUID]) -> int:
+        """ DELETE ... WHERE id IN (...) RETURNING room_id """
+        if not ids:
+            return 0
+        statement = (
+            delete(QuizSession)
+            .where(QuizSession.id.in_(ids))
+            .returning(QuizSession.room_id)
+        )
+        room_ids = db.execute(statement).scalars().all()
+        db.commit()
+        for room_id in room_ids:
+            room.active.invalidate(room_id)
+        return len(room_ids)
+
+    def remove(self, db: Session, *, id: UUID) -> int:
+        return self.remove_many(db, ids=[id])
+
+    def get_active_room_ids(self, db: Session, *, quiz_id: Any) -> List[Any]:
+        """ The rooms giving the quiz right now """
+        statement = select(QuizSession.room_id).where(
+            QuizSession.quiz_id == quiz_id, QuizSession.is_active == True
+        )
+        return db.execute(statement.distinct()).scalars().all()
+
+
+class CRUDStudentResponse(_CRUDBase[StudentResponse, StudentResponseCreate, BaseModel]):
+    # Responses are written in batches by ingest.ResponseIngester
+    def get_latest(self, db: Session, *, quiz_session_id: Any) -> List[Any]:
+        """ Each student's latest response to each question of a session """
+        statement = (
+            select(
+                StudentResponse.student_id,
+                StudentResponse.question,
+                StudentResponse.version,
+                StudentResponse.choice,
+                StudentResponse.text,
+            )
+            .where(StudentResponse.quiz_session_id == quiz_session_id)
+            .distinct(StudentResponse.student_id, StudentResponse.question)
+            .order_by(
+                StudentResponse.student_id,
+                StudentResponse.question,
+                StudentResponse.ts.desc(),
+            )
+        )
+        return db.execute(statement).all()
+
+
+def _columns(obj: Base) -> Dict[str, Any]:
+    return {c.key: getattr(obj, c.key) for c in obj.__table__.columns}
+
+
+def _as_patch(patch_content: Union[Dict, List]) -> List[Dict]:
+    # schemas.QuizUpdate accepts one operation or a list of operations
+    if isinstance(patch_content, dict):
+        return [patch_content]
+    patch = []
+    for operation in patch_content:
+        patch.extend(_as_patch(operation))
+    return patch
+
+
+def _json_pointer(pointer: Any) -> Optional[List[str]]:
+    # "/q/3/answers" -> ["q", "3", "answers"] (RFC 6901)
+    if not isinstance(pointer, str) or not pointer.startswith("/"):
+        return None
+    return [
+        token.replace("~1", "/").replace("~0", "~")
+        for token in pointer[1:].split("/")
+    ]
+
+
+def _jsonb_patch(content: ColumnElement, patch: List[Dict]) -> Optional[ColumnElement]:
+    """
+    Translates json-patch (RFC 6902) operations into jsonb functions,
+    so Postgres patches the document in place.
+
+    Supports "add", "replace" and "remove".
+    Returns None if any operation can't be translated.
+
+    Each operation is checked against the document as it was patched so far,
+    as jsonpatch checks it: replacing or removing a path that doesn't exist,
+    or adding where jsonpatch can't, makes the whole document NULL.
+    """
+    for operation in patch:
+        path = _json_pointer(operation.get("path"))
+        if not path or not all(_is_array_token(token) for token in path[:-1]):
+            return None
+        op = operation.get("op")
+        if op in ("add", "replace") and "value" not in operation:
+            return None
+        if (path[-1] == "-" and op != "add") or not _is_array_token(path[-1], "-"):
+            return None
+        value = _jsonb(operation.get("value"))
+        # Each operation is a step of its own (a LATERAL subquery),
+        #  so the document it checks and patches is only computed once
+        step = select(content.label("content")).correlate_except(None).lateral()
+        document = step.c.content
+        parent = document.op("#>")(_text_array(path[:-1]))
+        if op in ("replace", "remove"):
+            exists = document.op("#>")(_text_array(path)).isnot(None)
+            if op == "replace":
+                patched = func.jsonb_set(document, _text_array(path), value, False)
+            else:
+                patched = document.op("#-")(_text_array(path))
+        elif op == "add" and path[-1] == "-":
+            # Append to the end of an array
+            exists = func.jsonb_typeof(parent) == "array"
+            end = _text_array(path[:-1] + ["-1"])
+            patched = func.jsonb_insert(document, end, value, True)
+        elif op == "add" and _is_index(path[-1]):
+            # Insert before the index, which may be the array's length.
+            #  Quiz content never has numeric object keys (see
+            #  schemas._QuizContent), so the parent has to be an array.
+            length = case(
+                (func.jsonb_typeof(parent) == "array", func.jsonb_array_length(parent)),
+                else_=-1,
+            )
+            exists = length >= int(path[-1])
+            patched = func.jsonb_insert(document, _text_array(path), value)
+        elif op == "add":
+            exists = func.jsonb_typeof(parent) == "object"
+            patched = func.jsonb_set(document, _text_array(path), value, True)
+        else:
+            return None
+        content = (
+            select(case((exists, patched), else_=null()))
+            .select_from(step)
+            .scalar_subquery()
+        )
+    return content
+
+
+def _is_index(token: str) -> bool:
+    # An array index as RFC 6901 spells it: no sign, no leading zeros
+    return re.fullmatch(r"0|[1-9][0-9]*", token) is not None
+
+
+def _is_array_token(token: str, *allowed: str) -> bool:
+    # Whether Postgres reads a path token the way jsonpatch does.
+    #  Postgres also indexes arrays with e.g. "-1" (from the end) or "01",
+    #  which jsonpatch rejects; such patches are applied in Python.
+    if _is_index(token) or token in allowed:
+        return True
+    return re.fullmatch(r"\s*[+-]?[0-9]+\s*|-", token) is None
+
+
+def _text_array(path: List[str]) -> ColumnElement:
+    return literal(path, ARRAY(TEXT))
+
+
+def _jsonb(value: Any) -> ColumnElement:
+    return literal(value, JSONB)
+
+
+def _constraint(err: sqlalchemy_IntegrityError) -> Optional[str]:
+    # The name of the constraint (or unique index) a statement violated
+    diag = getattr(err.orig, "diag", None)
+    return getattr(diag, "constraint_name", None)
+
+
+def _replay(content: Any, patches: List[List[Dict]]) -> Any:
+    # Stored patches applied cleanly when they were written (see _jsonb_patch),
+    #  so one that doesn't apply now means the history is broken, and raises
+    for patch in patches:
+        content = jsonpatch.apply_patch(content, patch)
+    return content
+
+
+def _track_questions(
+    questions: List[Optional[int]], patch: List[Dict], *, changed: bool
+) -> List[Optional[int]]:
+    """
+    Follows the questions of a quiz through a patch.
+
+    `questions` holds a marker per question. Questions the patch adds or edits
+    are marked None if `changed`, otherwise added questions are marked 0
+    and edited questions keep their markers.
+    Only the patch's paths are looked at, never the quiz's content.
+    """
+    questions = questions.copy()
+    new = None if changed else 0
+
+    def index(path: Optional[List[str]], end: bool = False) -> Optional[int]:
+        # The question a path points into, if any
+        if not path or path[0] != "q" or len(path) < 2:
+            return None
+        if end and path[1] == "-" and len(path) == 2:
+            return len(questions)
+        if not _is_index(path[1]) or int(path[1]) > len(questions) - (not end):
+            # Stored patches always applied, so the log doesn't match the quiz
+            raise ValueError(f"The patch log has no question {path[1]!r}")
+        return int(path[1])
+
+    for operation in patch:
+        op = operation.get("op")
+        path = _json_pointer(operation.get("path"))
+        value = operation.get("value")
+        if path is None:
+            continue
+        if path == [""] and op in ("add", "replace"):
+            # The whole document
+            value = value.get("q") if isinstance(value, dict) else None
+            questions = [new] * len(value) if isinstance(value, list) else []
+        elif path == ["q"] and op in ("add", "replace"):
+            # The list of questions
+            questions = [new] * len(value) if isinstance(value, list) else []
+        elif op in ("move", "copy"):
+            source_path = _json_pointer(operation.get("from"))
+            source = index(source_path)
+            marker = new
+            if op == "move" and source is not None:
+                if len(source_path) == 2:
+                    # The question itself moves
+                    marker = questions.pop(source)
+                elif changed:
+                    # Part of the question moves out of it
+                    questions[source] = None
+            if len(path) == 2:
+                target = index(path, end=True)
+                if target is not None:
+                    questions.insert(target, marker)
+            else:
+                target = index(path)
+                if target is not None and changed:
+                    questions[target] = None
+        elif len(path) == 2 and op == "add":
+            i = index(path, end=True)
+            if i is not None:
+                questions.insert(i, new)
+        elif len(path) == 2 and op == "remove":
+            i = index(path)
+            if i is not None:
+                del questions[i]
+        elif op in ("add", "replace", "remove") and changed:
+            # Replacing a question, or editing part of one
+            i = index(path)
+            if i is not None:
+                questions[i] = None
+    return questions
+
+
+def _student_question(question: Dict) -> Dict:
+    # Multiple-choice answers without is_correct, short-answers without answers
+    redacted = {"query": question["query"], "type": question["type"]}
+    if question["type"] == "multiple-choice":
+        redacted["answers"] = [{"text": a["text"]} for a in question["answers"]]
+    return redacted
+
+
+def _student_view(quiz: Quiz) -> bytes:
+    """
+    Serializes what a student taking the quiz may see (schemas.QuizForStudent):
+    multiple-choice answers without is_correct and short-answers without answers.
+
+    Content is validated when it's written, so it's redacted as plain json
+    rather than being parsed into the pydantic models again.
+    """
+    view = {
+        "id": str(quiz.id),
+        "version": quiz.version,
+        "t": quiz.content["t"],
+        "q": [_student_question(question) for question in quiz.content["q"]],
+    }
+    return json.dumps(view, separators=(",", ":")).encode()
+
+
+def _student_path(path: List[str]) -> bool:
+    # Whether students see what a path of the content points to.
+    #  Paths into answers are visible; their values are redacted.
+    if path == ["t"] or path == ["q"]:
+        return True
+    if len(path) < 2 or path[0] != "q":
+        return False
+    if len(path) == 2 or (len(path) == 3 and path[2] in ("query", "type", "answers")):
+        return True
+    return path[2] == "answers" and (
+        len(path) == 4 or (len(path) == 5 and path[4] == "text")
+    )
+
+
+def _student_value(path: List[str], value: Any) -> Tuple[bool, Any]:
+    """
+    Redacts the value of an "add" or "replace" operation on a visible path.
+    Returns whether students see it, and what they see.
+
+    Raises: KeyError, TypeError, ValueError
+    """
+    if path == ["q"]:
+        return True, [_student_question(question) for question in value]
+    if len(path) == 2:
+        return True, _student_question(value)
+    if path[2:] == ["answers"]:
+        # Multiple-choice answers are objects, short answers are strings
+        if not value:
+            raise ValueError("Can't tell whose answers are empty")
+        if all(isinstance(answer, str) for answer in value):
+            return False, None
+        return True, [{"text": answer["text"]} for answer in value]
+    if len(path) == 4:
+        if isinstance(value, str):
+            return False, None
+        return True, {"text": value["text"]}
+    return True, value
+
+
+def _student_patch(patch: List[Dict]) -> Optional[List[Dict]]:
+    """
+    Redacts a json-patch of a quiz's content into a patch of its student view
+    (see _student_view): operations on what students can't see are dropped
+    and values are redacted.
+
+    Operations whose path isn't in the student view (e.g. editing a
+    short-answer's answers) fail and should be skipped by clients.
+    Returns None if the patch can't be redacted; students should reload.
+    """
+
+    def is_type(path: List[str]) -> bool:
+        return len(path) == 3 and path[0] == "q" and path[2] == "type"
+
+    redacted = []
+    try:
+        for operation in patch:
+            op = operation["op"]
+            pointer = operation.get("path")
+            # "" is the whole document
+            path = [""] if pointer == "" else _json_pointer(pointer)
+            if op == "test":
+                continue
+            if path is None or is_type(path):
+                # A question changing type changes which of its answers students
+                #  see (e.g. short-answers have none), which later operations
+                #  on its answers can't be redacted into
+                return None
+            if op in ("move", "copy"):
+                source = _json_pointer(operation.get("from"))
+                if source is None or path == [""] or is_type(source):
+                    return None
+                if not _student_path(path):
+                    if op == "move" and _student_path(source):
+                        # What students saw is gone
+                        redacted.append({"op": "remove", "path": operation["from"]})
+                    continue
+                if not _student_path(source):
+                    # Something they never saw appears
+                    return None
+                if source[2:3] == ["answers"] and (
+                    path[2:3] != ["answers"] or len(path) != len(source)
+                ):
+                    # Might be a short answer, which students don't have
+                    return None
+                redacted.append({"op": op, "from": operation["from"], "path": pointer})
+            elif path == [""] and op in ("add", "replace"):
+                # The whole document
+                value = operation["value"]
+                questions = [_student_question(q) for q in value["q"]]
+                redacted.append({"op": "replace", "path": "/t", "value": value["t"]})
+                redacted.append({"op": "replace", "path": "/q", "value": questions})
+            elif op in ("add", "replace") and _student_path(path):
+                visible, value = _student_value(path, operation["value"])
+                if visible:
+                    redacted.append({"op": op, "path": pointer, "value": value})
+            elif op == "remove" and path != [""]:
+                if _student_path(path):
+                    redacted.append({"op": "remove", "path": pointer})
+            elif op not in ("add", "replace"):
+                return None
+    except (KeyError, TypeError, ValueError):
+        return None
+    return redacted
+
+
 class CRUDQuiz(_CRUDBase[Quiz, QuizCreate, QuizUpdate]):
+    def __init__(self, model: Type[Quiz]):
+        super().__init__(model)
+        # (quiz id, version) -> the serialized student view, tagged with the quiz id.
+        #  A version's content never changes, so entries can't go stale;
+        #  they are rebuilt whenever this process writes a new version.
+        self.student_views: LRUCache = LRUCache(
+            maxsize=settings.STUDENT_QUIZ_CACHE_SIZE
+        )
+
+    # Every change to a quiz's content increments Quiz.version
+    #  and appends the patch to QuizRevision in the same statement.
+    #  Every QUIZ_SNAPSHOT_INTERVAL versions (and at version 1),
+    #  the full content is copied to QuizSnapshot.
+    def create(self, db: Session, *, obj_in: QuizCreate) -> Quiz:
+        """ Raises: Http403QuizNameConflict """
+        return self.create_many(db, objs_in=[obj_in])[0]
+
+    def create_many(self, db: Session, *, objs_in: List[QuizCreate]) -> List[Quiz]:
+        """
+        INSERT ... RETURNING *, snapshotting each quiz's first version
+
+        Raises: Http403QuizNameConflict
+        """
+        if not objs_in:
+            return []
+        table = Quiz.__table__
+        new_quiz = (
+            insert(table)
+            .values([jsonable_encoder(obj_in) for obj_in in objs_in])
+            .returning(*table.columns)
+            .cte("new_quiz")
+        )
+        snapshot = self._snapshot(new_quiz, every_version=True)
+        statement = select(*new_quiz.c).select_from(
+            new_quiz.join(snapshot, snapshot.c.quiz_id == new_quiz.c.id)
+        )
+        rows = self._execute(db, statement).mappings().all()
+        db.commit()
+        quizzes = [Quiz(**row) for row in rows]
+        for quiz in quizzes:
+            self._set_student_view(quiz)
+        return quizzes
+
     def update(
         self,
         db: Session,
         *,
-        db_obj: Quiz,
+        id: Any,
         obj_in: Union[QuizUpdate, Dict[str, Any]],
-    ) -> ModelType:
-        if obj_in.set_is_public:
-            db_obj.is_public = obj_in.set_is_public
-        if obj_in.patch_content:
-            jsonpatch.apply_patch(
-                doc=db_obj.content, patch=obj_in.patch_content, in_place=True
+        **where: Any,
+    ) -> Optional[Quiz]:
+        """
+        Sets is_public and applies the json-patch.
+
+        Pass `version` to only update the quiz if it is still at that version
+        (optimistic concurrency); no rows are locked either way.
+        Returns None if no quiz matched.
+        The patched content is validated before it's committed.
+
+        Raises: Http403QuizNameConflict, Http422InvalidQuizContent
+        """
+        data = self._update_data(obj_in)
+        update_data = {}
+        if data.get("set_is_public") is not None:
+            update_data["is_public"] = data["set_is_public"]
+        if not data.get("patch_content"):
+            return super().update(db, id=id, obj_in=update_data, **where)
+
+        table = Quiz.__table__
+        patch = _as_patch(data["patch_content"])
+        content = _jsonb_patch(table.c.content, patch)
+        if content is not None:
+            # Postgres applies the patch; only the patch is sent
+            return self._update_content(
+                db, id=id, content=content, patch=patch, values=update_data, **where
             )
+
+        # The patch can only be applied in Python, so the content is read first.
+        #  Nothing is locked: the write only succeeds if the version is still
+        #  the one that was read. If another editor got there first,
+        #  the patch is applied again to their content.
+        criteria = [table.c.id == id] + [table.c[k] == v for k, v in where.items()]
+        while True:
+            current = db.execute(
+                select(table.c.content, table.c.version).where(*criteria)
+            ).one_or_none()
+            if current is None:
+                db.rollback()
+                return None
+            quiz = self._update_content(
+                db,
+                id=id,
+                content=_jsonb(self._apply_patch(db, current.content, patch)),
+                patch=patch,
+                values=update_data,
+                **{**where, "version": current.version},
+            )
+            if quiz is not None or "version" in where:
+                return quiz
+
+    def _update_content(
+        self,
+        db: Session,
+        *,
+        id: Any,
+        content: ColumnElement,
+        patch: List[Dict],
+        values: Dict[str, Any],
+        **where: Any,
+    ) -> Optional[Quiz]:
+        # Writes the new content, bumps the version
+        #  and logs the patch (and maybe a snapshot) in one statement
+        table = Quiz.__table__
+        criteria = [table.c.id == id] + [table.c[k] == v for k, v in where.items()]
+        updated = (
+            update(table)
+            .where(*criteria)
+            .values(content=content, version=table.c.version + 1, **values)
+            .returning(*table.columns)
+            .cte("updated")
+        )
+        revision = (
+            insert(QuizRevision.__table__)
+            .from_select(
+                ["quiz_id", "version", "patch"],
+                select(updated.c.id, updated.c.version, _jsonb(patch)),
+            )
+            .returning(QuizRevision.quiz_id)
+            .cte("revision")
+        )
+        snapshot = self._snapshot(updated)
+        # The inserts are only rendered if the final SELECT references them
+        statement = select(*updated.c).select_from(
+            updated.join(revision, revision.c.quiz_id == updated.c.id).outerjoin(
+                snapshot, snapshot.c.quiz_id == updated.c.id
+            )
+        )
+        row = self._execute(db, statement).mappings().one_or_none()
+        if row is None:
+            db.commit()
+            return None
+        # Rolled back if invalid, e.g. a patch removing a question's query
+        self._validate_content(db, row["content"])
+        db.commit()
+        quiz = Quiz(**row)
+        self._set_student_view(quiz)
+        return quiz
+
+    def update_many(
+        self,
+        db: Session,
+        *,
+        objs_in: List[Union[QuizUpdate, Dict[str, Any]]],
+    ) -> List[Quiz]:
+        """
+        Applies every quiz's json-patch, then writes all quizzes with one UPDATE.
+
+        The patched quizzes are locked (SELECT ... FOR UPDATE) until the update
+        commits so a concurrent patch can't be lost.
+        If any patched content is invalid, no quiz is updated.
+
+        Raises: Http403QuizNameConflict, Http422InvalidQuizContent
+        """
+        updates = []
+        patches = {}
+        for obj_in in objs_in:
+            data = self._update_data(obj_in)
+            update_data = {"id": data["id"]}
+            if data.get("set_is_public") is not None:
+                update_data["is_public"] = data["set_is_public"]
+            if data.get("patch_content"):
+                patches[data["id"]] = _as_patch(data["patch_content"])
+            updates.append(update_data)
+
+        if patches:
+            rows = db.execute(
+                select(Quiz.id, Quiz.content, Quiz.version)
+                .where(Quiz.id.in_(list(patches)))
+                .with_for_update()
+            )
+            by_id = {data["id"]: data for data in updates}
+            revisions = []
+            snapshots = []
+            for id, content, version in rows:
+                data = by_id[id]
+                patch = patches.pop(id)
+                data["content"] = self._apply_patch(db, content, patch)
+                self._validate_content(db, data["content"])
+                data["version"] = version + 1
+                revision = {"quiz_id": id, "version": data["version"]}
+                revisions.append({**revision, "patch": patch})
+                if data["version"] % settings.QUIZ_SNAPSHOT_INTERVAL == 0:
+                    snapshots.append({**revision, "content": data["content"]})
+            # Quizzes that don't exist are skipped, as they are by UPDATE
+            updates = [data for data in updates if data["id"] not in patches]
+            # Committed with the update
+            if revisions:
+                db.execute(insert(QuizRevision.__table__).values(revisions))
+            if snapshots:
+                db.execute(insert(QuizSnapshot.__table__).values(snapshots))
+        try:
+            quizzes = super().update_many(db, objs_in=updates)
+        except sqlalchemy_IntegrityError as err:
+            self._raise_name_conflict(db, err)
+        for quiz in quizzes:
+            self._set_student_view(quiz)
+        return quizzes
+
+    def remove(self, db: Session, *, id: UUID) -> int:
+        removed = super().remove(db, id=id)
+        self.student_views.invalidate(id)
+        return removed
+
+    def remove_many(self, db: Session, *, ids: List[UUID]) -> int:
+        removed = super().remove_many(db, ids=ids)
+        for id in ids:
+            self.student_views.invalidate(id)
+        return removed
+
+    def _execute(self, db: Session, statement: Any) -> CursorResult:
+        """ Raises: Http403QuizNameConflict """
+        try:
+            return db.execute(statement)
+        except sqlalchemy_IntegrityError as err:
+            self._raise_name_conflict(db, err)
+
+    @staticmethod
+    def _raise_name_conflict(db: Session, err: sqlalchemy_IntegrityError) -> NoReturn:
+        db.rollback()
+        if _constraint(err) == "uq_quiz_owner_id_title":
+            raise Http403QuizNameConflict from err
+        raise err
+
+    @staticmethod
+    def _apply_patch(db: Session, content: Dict, patch: List[Dict]) -> Dict:
+        """ Raises: Http422InvalidQuizContent """
+        try:
+            return jsonpatch.apply_patch(content, patch)
+        except (jsonpatch.JsonPatchException, jsonpatch.JsonPointerException) as err:
+            db.rollback()
+            raise Http422InvalidQuizContent from err
+
+    @staticmethod
+    def _validate_content(db: Session, content: Dict) -> None:
+        """ Raises: Http422InvalidQuizContent """
+        try:
+            _QuizContent.parse_obj(content)
+        except ValidationError as err:
+            db.rollback()
+            raise Http422InvalidQuizContent from err
+
+    def get_for_student(self, db: Session, *, id: Any) -> Optional[bytes]:
+        """
+        Returns the serialized student view of a quiz's current version.
+
+        Only the version is read from the database when the view is cached.
+        Returns None if the quiz doesn't exist or isn't public.
+        """
+        version = db.execute(
+            select(Quiz.version).where(Quiz.id == id, Quiz.is_public == True)
+        ).scalar_one_or_none()
+        if version is None:
+            return None
+        view = self.student_views.get((id, version))
+        if view is None:
+            quiz = db.execute(
+                select(Quiz.id, Quiz.version, Quiz.content).where(Quiz.id == id)
+            ).one()
+            view = self._set_student_view(quiz)
+        return view
+
+    def student_event(
+        self, quiz: Quiz, *, patch_content: Union[Dict, List]
+    ) -> Dict[str, Any]:
+        """
+        The room event telling students a quiz changed, given the patch that
+        made `quiz` (see _student_patch).
+
+        A "quiz-patched" event carries the redacted patch; applied to the
+        student view of the previous version, it gives this version's view.
+        `version` numbers the events: a student who missed one (their view
+        isn't at version - 1) should reload the quiz, as they should on a
+        "quiz-resync" event, sent when the patch can't be redacted.
+        """
+        event = {"quiz_id": str(quiz.id), "version": quiz.version}
+        patch = _student_patch(_as_patch(patch_content))
+        if patch is None:
+            return {"type": "quiz-resync", **event}
+        patch.append({"op": "replace", "path": "/version", "value": quiz.version})
+        return {"type": "quiz-patched", **event, "patch": patch}
+
+    def _set_student_view(self, quiz: Quiz) -> bytes:
+        # Replaces the quiz's older versions
+        self.student_views.invalidate(quiz.id)
+        view = _student_view(quiz)
+        self.student_views.set((quiz.id, quiz.version), view, tag=quiz.id)
+        return view
+
+    def get_content(
+        self, db: Session, *, id: Any, version: int, **where: Any
+    ) -> Optional[Dict]:
+        """
+        Returns a quiz's content as of `version`.
+
+        The closest earlier snapshot is loaded and the patches since then replayed,
+        so at most QUIZ_SNAPSHOT_INTERVAL patches are applied.
+        Returns None if the quiz (or the version) doesn't exist.
+        """
+        criteria = [Quiz.id == id] + [getattr(Quiz, k) == v for k, v in where.items()]
+        snapshot = db.execute(
+            select(QuizSnapshot.version, QuizSnapshot.content)
+            .join(Quiz, Quiz.id == QuizSnapshot.quiz_id)
+            .where(*criteria, QuizSnapshot.version <= version)
+            .order_by(QuizSnapshot.version.desc())
+            .limit(1)
+        ).one_or_none()
+        if snapshot is None:
+            return None
+        patches = self._patches(db, id=id, after=snapshot.version, until=version)
+        if len(patches) != version - snapshot.version:
+            return None
+        return _replay(snapshot.content, patches)
+
+    def changed_since(
+        self, db: Session, *, id: Any, version: int, **where: Any
+    ) -> Optional[List[int]]:
+        """
+        Returns the (current) indices of the questions added or edited
+        after `version`, found from the patch log alone.
+
+        Returns None if the quiz (or the version) doesn't exist.
+        """
+        criteria = [Quiz.id == id] + [getattr(Quiz, k) == v for k, v in where.items()]
+        # Only the number of questions is read from the snapshot
+        snapshot = db.execute(
+            select(
+                QuizSnapshot.version,
+                func.jsonb_array_length(QuizSnapshot.content["q"]).label("count"),
+            )
+            .join(Quiz, Quiz.id == QuizSnapshot.quiz_id)
+            .where(*criteria, QuizSnapshot.version <= version)
+            .order_by(QuizSnapshot.version.desc())
+            .limit(1)
+        ).one_or_none()
+        if snapshot is None:
+            return None
+        patches = self._patches(db, id=id, after=snapshot.version)
+        if len(patches) < version - snapshot.version:
+            return None
+        # Count the questions up to `version`, then mark the changes after it
+        questions = [0] * snapshot.count
+        for patch in patches[: version - snapshot.version]:
+            questions = _track_questions(questions, patch, changed=False)
+        for patch in patches[version - snapshot.version :]:
+            questions = _track_questions(questions, patch, changed=True)
+        return [i for i, marker in enumerate(questions) if marker is None]
+
+    def question_epochs(
+        self, db: Session, *, id: Any, versions: Set[int]
+    ) -> Dict[int, List[Tuple[int, int]]]:
+        """
+        For each version in `versions`, the (version, index) each of its questions
+        was last added or edited at. A question keeps its epoch until it's edited,
+        however it moves, so equal epochs are the same question.
+
+        Versions that don't exist are left out.
+        """
+        count = db.execute(
+            select(func.jsonb_array_length(QuizSnapshot.content["q"])).where(
+                QuizSnapshot.quiz_id == id, QuizSnapshot.version == 1
+            )
+        ).scalar_one_or_none()
+        if count is None or not versions:
+            return {}
+        patches = self._patches(db, id=id, after=1, until=max(versions))
+        return _question_epochs(count, patches, versions)
+
+    def _patches(
+        self, db: Session, *, id: Any, after: int, until: Optional[int] = None
+    ) -> List[List[Dict]]:
+        criteria = [QuizRevision.quiz_id == id, QuizRevision.version > after]
+        if until is not None:
+            criteria.append(QuizRevision.version <= until)
+        return (
+            db.execute(
+                select(QuizRevision.patch)
+                .where(*criteria)
+                .order_by(QuizRevision.version)
+            )
+            .scalars()
+            .all()
+        )
+
+    @staticmethod
+    def _snapshot(quizzes, every_version: bool = False):
+        # INSERT INTO quiz_snapshot for the rows of a CTE returning quizzes
+        query = select(quizzes.c.id, quizzes.c.version, quizzes.c.content).where(
+            # A patch that doesn't apply leaves NULL content (see _jsonb_patch),
+            #  which is rolled back once it fails validation
+            quizzes.c.content.isnot(None)
+        )
+        if not every_version:
+            query = query.where(
+                quizzes.c.version % settings.QUIZ_SNAPSHOT_INTERVAL == 0
+            )
+        return (
+            insert(QuizSnapshot.__table__)
+            .from_select(["quiz_id", "version", "content"], query)
+            .returning(QuizSnapshot.quiz_id)
+            .cte("snapshot")
+        )
+
+
+def _question_epochs(
+    count: int, patches: List[List[Dict]], versions: Set[int]
+) -> Dict[int, List[Tuple[int, int]]]:
+    """
+    For each version in `versions`, the (version, index) each question
+    was last added or edited at.
+
+    `count` is the number of questions in version 1 and `patches`
+    are the patches from version 2 on.
+    """
+    questions = [(1, i) for i in range(count)]
+    epochs = {1: questions} if 1 in versions else {}
+    last = max(versions)
+    for version, patch in enumerate(patches[: last - 1], start=2):
+        questions = _track_questions(questions, patch, changed=True)
+        questions = [
+            marker if marker is not None else (version, i)
+            for i, marker in enumerate(questions)
+        ]
+        if version in versions:
+            epochs[version] = questions
+    return epochs
+
+
+def _add_counts(column: str) -> ColumnElement:
+    # Sums the counts of two {key: count} objects, for ON CONFLICT DO UPDATE
+    return literal_column(
+        f"""(
+            SELECT coalesce(jsonb_object_agg(key, n), '{{}}')
+            FROM (
+                SELECT key, sum(value::int) AS n
+                FROM (
+                    SELECT * FROM jsonb_each_text(quiz_rollup.{column})
+                    UNION ALL
+                    SELECT * FROM jsonb_each_text(excluded.{column})
+                ) AS counts
+                GROUP BY key
+            ) AS sums
+        )"""
+    )
+
+
+class CRUDQuizRollup(_CRUDBase[QuizRollup, BaseModel, BaseModel]):
+    def add_session(self, db: Session, *, quiz_session_id: Any) -> bool:
+        """
+        Adds a closed session's responses (each student's latest answer
+        to each question) to its quiz's rollups.
+
+        A session is only ever added once. Returns False if it's still active
+        or was already added. Responses stored after that aren't counted.
+        """
+        table = QuizSession.__table__
+        quiz_id = db.execute(
+            update(table)
+            .where(
+                table.c.id == quiz_session_id,
+                table.c.is_active == False,
+                table.c.rolled_up == False,
+            )
+            .values(rolled_up=True)
+            .returning(table.c.quiz_id)
+        ).scalar_one_or_none()
+        if quiz_id is None:
+            db.rollback()
+            return False
+        rows = student_response.get_latest(db, quiz_session_id=quiz_session_id)
+        totals = self._tally(db, quiz_id=quiz_id, rows=rows)
+        if totals:
+            statement = pg_insert(QuizRollup.__table__).values(
+                [
+                    {"quiz_id": quiz_id, "version": version, "question": i, **counts}
+                    for (version, i), counts in totals.items()
+                ]
+            )
+            excluded = statement.excluded
+            rollup = QuizRollup.__table__.c
+            statement = statement.on_conflict_do_update(
+                index_elements=[rollup.quiz_id, rollup.version, rollup.question],
+                set_={
+                    "responses": rollup.responses + excluded.responses,
+                    "correct": rollup.correct + excluded.correct,
+                    "incorrect": rollup.incorrect + excluded.incorrect,
+                    "choices": _add_counts("choices"),
+                    "buckets": _add_counts("buckets"),
+                },
+            )
+            db.execute(statement)
         db.commit()
-        db.refresh(db_obj)
-        return db_obj
+        return True
+
+    def add_closed_sessions(self, db: Session, *, limit: int) -> int:
+        """ Adds sessions that were closed without being added, e.g. by a crash """
+        ids = (
+            db.execute(
+                select(QuizSession.id)
+                .where(QuizSession.is_active == False, QuizSession.rolled_up == False)
+                .limit(limit)
+            )
+            .scalars()
+            .all()
+        )
+        return sum(self.add_session(db, quiz_session_id=id) for id in ids)
+
+    def get_all_time(self, db: Session, *, quiz_id: Any, **where) -> List[QuizRollup]:
+        """ Reads only the quiz's rollups, however many responses it has had """
+        criteria = [getattr(Quiz, k) == v for k, v in where.items()]
+        statement = (
+            select(QuizRollup)
+            .join(Quiz, Quiz.id == QuizRollup.quiz_id)
+            .where(QuizRollup.quiz_id == quiz_id, *criteria)
+            .order_by(QuizRollup.version, QuizRollup.question)
+        )
+        return db.execute(statement).scalars().all()
+
+    @staticmethod
+    def _tally(
+        db: Session, *, quiz_id: Any, rows: List[Any]
+    ) -> Dict[Tuple[int, int], Dict[str, Any]]:
+        # (version, question) -> the counts to add
+        if not rows:
+            return {}
+        versions = {row.version for row in rows}
+        epochs = quiz.question_epochs(db, id=quiz_id, versions=versions)
+        keys = {}
+        for version in versions:
+            content = quiz.get_content(db, id=quiz_id, version=version)
+            if content is not None:
+                keys[version] = AnswerKey(content)
+        totals: Dict[Tuple[int, int], Dict[str, Any]] = {}
+        for row in rows:
+            questions = epochs.get(row.version)
+            if questions is None or row.version not in keys:
+                # The version doesn't exist
+                continue
+            if not 0 <= row.question < len(questions):
+                continue
+            counts = totals.setdefault(
+                questions[row.question],
+                {
+                    "responses": 0,
+                    "correct": 0,
+                    "incorrect": 0,
+                    "choices": {},
+                    "buckets": {},
+                },
+            )
+            counts["responses"] += 1
+            is_correct = keys[row.version].grade(row)
+            if is_correct:
+                counts["correct"] += 1
+            elif is_correct is not None:
+                counts["incorrect"] += 1
+            if row.choice is not None:
+                choices = counts["choices"]
+                choices[row.choice] = choices.get(row.choice, 0) + 1
+            if row.text is not None:
+                buckets = counts["buckets"]
+                bucket = to_bucket(row.text)
+                buckets[bucket] = buckets.get(bucket, 0) + 1
+        return totals
 
 
 user = CRUDUser(User)
 room = CRUDRoom(Room)
 quiz = CRUDQuiz(Quiz)
+quiz_session = CRUDQuizSession(QuizSession)
+student_response = CRUDStudentResponse(StudentResponse)
+quiz_rollup = CRUDQuizRollup(QuizRollup)
@@ -21,17 +21,22 @@ class TuskyError(fastapi_HTTPException):
     #  Don't do anything that (for example)
     #  would expose a plain-text passwords in the logs.
 
-    def __init__(self, status_code=None, detail=None):
+    def __init__(self, status_code=None, detail=None, headers=None):
         """ Base Exception for all errors from Tusky """
         # Todo: automatically log errors
         if status_code:
             self.status_code = status_code
         if detail:
             self.detail = detail
-        super().__init__(status_code=self.status_code, detail=self.detail)
+        if headers:
+            self.headers = headers
+        super().__init__(
+            status_code=self.status_code, detail=self.detail, headers=self.headers
+        )
 
     status_code: int
     detail = "Something went wrong."
+    headers = None
 
 
 ########################################################################################
@@ -52,6 +57,14 @@ class Http400InactiveUser(AuthenticationError):
     detail = "Inactive user."
 
 
+########################################################################################
+class Http400InvalidCursor(TuskyError):
+    """ Exception raised when a pagination cursor can't be decoded. """
+
+    status_code = status.HTTP_400_BAD_REQUEST
+    detail = "Invalid cursor."
+
+
 ########################################################################################
 class Http404InvalidRequestError(TuskyError):
     """ Base exceptions for errors deriving from sqlalchemy's Invalid Request Errors. """
@@ -72,15 +85,61 @@ class Http404ActiveRoomNotFound(Http404InvalidRequestError):
     detail = "The requested room does not exist or is no longer active."
 
 
+class Http404RoomNotFound(Http404InvalidRequestError):
+    """ Exception raised when a room is not in the database. """
+
+    detail = "The requested room could not be found."
+
+
 class Http404QuizNotFound(Http404InvalidRequestError):
     """ Exception raised when a quiz is not found in the database. """
 
     detail = "The requested quiz could not be found"
 
 
+class Http404ActiveQuizSessionNotFound(Http404InvalidRequestError):
+    """ Exception raised when an active quiz session is not in the database. """
+
+    detail = "The quiz session does not exist or is no longer active."
+
+
+class Http404QuizSessionNotFound(Http404InvalidRequestError):
+    """ Exception raised when a quiz session is not in the database. """
+
+    detail = "The requested quiz session could not be found."
+
+
 class IntegrityError(TuskyError):
     status_code = status.HTTP_403_FORBIDDEN
 
 
 class Http403QuizNameConflict(IntegrityError):
-    detail = ("Two quizzes by the same owner cannot have the same name.",)
+    detail = "Two quizzes by the same owner cannot have the same name."
+
+
+class Http403RoomCodeConflict(IntegrityError):
+    detail = "Another active room is using this code."
+
+
+########################################################################################
+class Http412QuizVersionConflict(TuskyError):
+    """ Exception raised when a quiz changed since the client's copy (If-Match). """
+
+    status_code = status.HTTP_412_PRECONDITION_FAILED
+    detail = "The quiz was changed by someone else. Reload it and try again."
+
+
+########################################################################################
+class Http422InvalidQuizContent(TuskyError):
+    """ Exception raised when a json-patch would leave a quiz's content invalid. """
+
+    status_code = status.HTTP_422_UNPROCESSABLE_ENTITY
+    detail = "The patch doesn't apply to the quiz or leaves it invalid."
+
+
+########################################################################################
+class Http503ServerBusy(TuskyError):
+    """ Exception raised when the server sheds load instead of queueing it. """
+
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    detail = "The server is busy. Please try again shortly."
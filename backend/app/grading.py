@@ -0,0 +1,251 @@
+__all__ = [
+    "PackedKey",
+    "PackedResponses",
+    "SessionGrades",
+    "pack_key",
+    "pack_responses",
+    "grade",
+    "grade_session",
+]
+
+from typing import (
+    Any,
+    Container,
+    Dict,
+    Hashable,
+    Iterable,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+)
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from app import crud
+from app.answer_key import AnswerKey, to_bucket
+
+# An unanswered question in PackedResponses
+UNANSWERED = -1
+
+
+class PackedKey(NamedTuple):
+    # (questions,) Whether each question is multiple choice
+    is_multiple_choice: np.ndarray
+    # (questions, choices + 1) Whether each choice is correct. The last column
+    # stands for no (or an out of range) choice and is never correct.
+    correct_choices: np.ndarray
+    # The accepted buckets of each question, a matching.MatchIndex
+    # (empty for multiple choice)
+    accepted: List[Container[str]]
+
+
+class PackedResponses(NamedTuple):
+    # The student of each row
+    student_ids: List[Hashable]
+    # (students, questions) The chosen answer, or UNANSWERED
+    choices: np.ndarray
+    # (students, questions) 1 if the short answer is correct, 0 if it isn't,
+    # UNANSWERED if there's none
+    short_answers: np.ndarray
+
+
+class SessionGrades(NamedTuple):
+    student_ids: List[Hashable]
+    # (students,) Correct answers to included questions
+    scores: np.ndarray
+    # (questions,) The questions that count
+    included: np.ndarray
+    # (questions,) The share of students answering a question who got it right,
+    # NaN if nobody answered it or it's excluded
+    difficulty: np.ndarray
+    # (questions, choices) How many students picked each answer
+    choice_counts: np.ndarray
+    # (questions, choices) The mean score of the students who picked each answer,
+    # NaN if nobody picked it
+    choice_mean_scores: np.ndarray
+
+    def as_dict(self) -> Dict[str, Any]:
+        """ JSON-friendly, with None for NaN """
+
+        def floats(array: np.ndarray) -> List:
+            return np.where(np.isnan(array), None, array).tolist()
+
+        return {
+            "possible": int(self.included.sum()),
+            "students": [
+                {"student_id": student_id, "score": score}
+                for student_id, score in zip(self.student_ids, self.scores.tolist())
+            ],
+            "questions": [
+                {
+                    "included": included,
+                    "difficulty": difficulty,
+                    "choice_counts": counts,
+                    "choice_mean_scores": mean_scores,
+                }
+                for included, difficulty, counts, mean_scores in zip(
+                    self.included.tolist(),
+                    floats(self.difficulty),
+                    self.choice_counts.tolist(),
+                    floats(self.choice_mean_scores),
+                )
+            ],
+        }
+
+
+def pack_key(content: Dict[str, Any]) -> PackedKey:
+    """ The answer key of one version of a quiz's content, as arrays """
+    key = AnswerKey(content)
+    questions = content.get("q", [])
+    width = max(
+        (len(q["answers"]) for q in questions if q["type"] == "multiple-choice"),
+        default=0,
+    )
+    is_multiple_choice = np.zeros(len(questions), dtype=bool)
+    correct_choices = np.zeros((len(questions), width + 1), dtype=bool)
+    accepted = []
+    for i, (type_, correct) in enumerate(key.questions):
+        if type_ == "multiple-choice":
+            is_multiple_choice[i] = True
+            correct_choices[i, list(correct)] = True
+            accepted.append(frozenset())
+        else:
+            accepted.append(correct)
+    return PackedKey(is_multiple_choice, correct_choices, accepted)
+
+
+def pack_responses(
+    key: PackedKey,
+    rows: Iterable[Tuple[Hashable, int, Optional[int], Optional[str]]],
+) -> PackedResponses:
+    """
+    Packs (student id, question, choice, text) rows into students × questions
+    arrays, the last row of a student and question winning.
+
+    Short answers are graded here, once per distinct bucket of a question.
+    """
+    students: Dict[Hashable, int] = {}
+    graded: Dict[Tuple[int, str], int] = {}
+    rows_, columns, choices, short_answers = [], [], [], []
+    for student_id, question, choice, text in rows:
+        rows_.append(students.setdefault(student_id, len(students)))
+        columns.append(question)
+        choices.append(UNANSWERED if choice is None else choice)
+        if text is None or key.is_multiple_choice[question]:
+            short_answers.append(UNANSWERED)
+            continue
+        bucket = to_bucket(text)
+        is_correct = graded.get((question, bucket))
+        if is_correct is None:
+            is_correct = int(bucket in key.accepted[question])
+            graded[question, bucket] = is_correct
+        short_answers.append(is_correct)
+
+    shape = (len(students), len(key.is_multiple_choice))
+    packed = PackedResponses(
+        student_ids=list(students),
+        choices=np.full(shape, UNANSWERED, dtype=np.int32),
+        short_answers=np.full(shape, UNANSWERED, dtype=np.int8),
+    )
+    packed.choices[rows_, columns] = choices
+    packed.short_answers[rows_, columns] = short_answers
+    return packed
+
+
+def grade(
+    key: PackedKey, responses: PackedResponses, included: np.ndarray
+) -> SessionGrades:
+    """
+    Grades every student at once.
+
+    `included` masks the questions that count; excluded questions add nothing
+    to scores, difficulty or choice counts.
+    """
+    questions, width = key.correct_choices.shape
+    none = width - 1
+    # Out of range choices are graded like no choice
+    choices = responses.choices.astype(np.intp)
+    choices[(choices < 0) | (choices >= none)] = none
+    chose = choices != none
+
+    multiple_choice = key.correct_choices[np.arange(questions), choices]
+    correct = np.where(
+        key.is_multiple_choice, multiple_choice, responses.short_answers == 1
+    )
+    answered = np.where(
+        key.is_multiple_choice, chose, responses.short_answers != UNANSWERED
+    )
+    correct &= included
+    answered &= included
+    scores = correct.sum(axis=1)
+
+    answers = answered.sum(axis=0)
+    difficulty = np.full(questions, np.nan)
+    np.divide(correct.sum(axis=0), answers, out=difficulty, where=answers > 0)
+
+    # One bincount over the flattened (question, choice) of every pick
+    picked = chose & key.is_multiple_choice & included
+    students, picked_questions = np.nonzero(picked)
+    flat = picked_questions * none + choices[picked]
+    counts = np.bincount(flat, minlength=questions * none)
+    score_sums = np.bincount(flat, weights=scores[students], minlength=counts.size)
+    mean_scores = np.full(counts.size, np.nan)
+    np.divide(score_sums, counts, out=mean_scores, where=counts > 0)
+
+    return SessionGrades(
+        student_ids=responses.student_ids,
+        scores=scores,
+        included=included,
+        difficulty=difficulty,
+        choice_counts=counts.reshape(questions, none),
+        choice_mean_scores=mean_scores.reshape(questions, none),
+    )
+
+
+def grade_session(db: Session, *, quiz_session_id: Any) -> Optional[SessionGrades]:
+    """
+    Grades each student's latest answers to a quiz session.
+
+    Answers are graded against the quiz as of the earliest version answered
+    in the session. Questions edited or removed after that are excluded,
+    and answers to questions added since are ignored, as are answers to
+    versions that don't exist (clients say which version they answered).
+
+    Returns None if the session (or its quiz) doesn't exist.
+    """
+    quiz_session = crud.quiz_session.get(db, id=quiz_session_id)
+    if quiz_session is None:
+        return None
+    quiz_id = quiz_session.quiz_id
+    rows = crud.student_response.get_latest(db, quiz_session_id=quiz_session_id)
+    versions = {row.version for row in rows}
+    epochs = crud.quiz.question_epochs(db, id=quiz_id, versions=versions)
+    if not epochs:
+        quiz = crud.quiz.get(db, id=quiz_id)
+        if quiz is None:
+            return None
+        epochs = crud.quiz.question_epochs(db, id=quiz_id, versions={quiz.version})
+    if not epochs:
+        return None
+    base = min(epochs)
+    content = crud.quiz.get_content(db, id=quiz_id, version=base)
+    if content is None:
+        return None
+    key = pack_key(content)
+
+    # Questions with the same epoch are the same, unedited question
+    columns = {epoch: i for i, epoch in enumerate(epochs[base])}
+    unedited = set(columns).intersection(*map(set, epochs.values()))
+    included = np.array([epoch in unedited for epoch in columns], dtype=bool)
+
+    def latest():
+        for row in rows:
+            version = epochs.get(row.version, ())
+            if 0 <= row.question < len(version):
+                column = columns.get(version[row.question])
+                if column is not None:
+                    yield row.student_id, column, row.choice, row.text
+
+    return grade(key, pack_responses(key, latest()), included)
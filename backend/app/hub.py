@@ -0,0 +1,141 @@
+__all__ = ["RoomHub", "hub"]
+
+import asyncio
+import json
+import logging
+from typing import Any, Dict, Hashable, Optional, Set
+
+from fastapi import WebSocket
+
+from app.core import settings
+
+logger = logging.getLogger(__name__)
+
+# Sent when a client is disconnected for falling behind ("Try Again Later")
+SLOW_CONSUMER_CLOSE_CODE = 1013
+
+
+class _Client:
+    def __init__(self, room_id: Hashable, websocket: WebSocket, queue_size: int):
+        self.room_id = room_id
+        self.websocket = websocket
+        self.queue: "asyncio.Queue[str]" = asyncio.Queue(queue_size)
+        self.sender: Optional[asyncio.Task] = None
+
+
+class RoomHub:
+    def __init__(self, *, queue_size: int):
+        """
+        Fans room events out to every websocket connected to the room
+        (in this process).
+
+        An event is encoded once, however many clients receive it.
+        Each client has its own sender task and a bounded queue of `queue_size`
+        events. A client whose queue is full is disconnected
+        (close code 1013) instead of slowing the room down,
+        and may reconnect to catch up.
+
+        The hub must only be used from the event loop's thread,
+        except for `publish_threadsafe`.
+        """
+        self.queue_size = queue_size
+        self.published = 0
+        self.dropped_clients = 0
+        self._rooms: Dict[Hashable, Set[_Client]] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def join(self, room_id: Hashable, websocket: WebSocket) -> _Client:
+        """ Starts sending the room's events to an accepted websocket """
+        self._loop = asyncio.get_running_loop()
+        client = _Client(room_id, websocket, self.queue_size)
+        client.sender = asyncio.create_task(self._send(client))
+        self._rooms.setdefault(room_id, set()).add(client)
+        return client
+
+    async def leave(self, client: _Client) -> None:
+        self._remove(client)
+
+    def publish(self, room_id: Hashable, event: Any) -> int:
+        """
+        Queues an event for every client in the room.
+
+        `event` is json-encoded unless it is already a string.
+        Returns the number of clients the event was queued for.
+        """
+        clients = self._rooms.get(room_id)
+        if not clients:
+            return 0
+        message = event if isinstance(event, str) else json.dumps(event)
+        self.published += 1
+        queued = 0
+        for client in list(clients):
+            try:
+                client.queue.put_nowait(message)
+                queued += 1
+            except asyncio.QueueFull:
+                self._drop(client)
+        return queued
+
+    def send(self, client: _Client, event: Any) -> None:
+        """ Queues an event for one client, e.g. the state it starts from """
+        message = event if isinstance(event, str) else json.dumps(event)
+        try:
+            client.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            self._drop(client)
+
+    def publish_threadsafe(self, room_id: Hashable, event: Any) -> None:
+        """ publish, for synchronous routes running in the threadpool """
+        if self._loop is None:
+            # Nobody has ever joined a room
+            return
+        self._loop.call_soon_threadsafe(self.publish, room_id, event)
+
+    def has_room(self, room_id: Hashable) -> bool:
+        """ Whether any client is in the room """
+        return room_id in self._rooms
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "rooms": len(self._rooms),
+            "clients": sum(len(clients) for clients in self._rooms.values()),
+            "published": self.published,
+            "dropped_clients": self.dropped_clients,
+        }
+
+    def _drop(self, client: _Client) -> None:
+        # The client fell queue_size events behind
+        self.dropped_clients += 1
+        self._remove(client)
+        asyncio.create_task(self._close(client.websocket))
+
+    def _remove(self, client: _Client) -> None:
+        clients = self._rooms.get(client.room_id)
+        if clients is not None:
+            clients.discard(client)
+            if not clients:
+                del self._rooms[client.room_id]
+        if client.sender is not None:
+            client.sender.cancel()
+
+    @staticmethod
+    async def _close(websocket: WebSocket) -> None:
+        try:
+            await websocket.close(code=SLOW_CONSUMER_CLOSE_CODE)
+        except Exception:
+            # The connection is already gone
+            pass
+
+    async def _send(self, client: _Client) -> None:
+        try:
+            while True:
+                message = await client.queue.get()
+                await client.websocket.send_text(message)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # The client disconnected; the websocket route calls leave
+            logger.debug("Sending to a websocket failed", exc_info=True)
+
+
+hub = RoomHub(queue_size=settings.ROOM_HUB_QUEUE_SIZE)
@@ -0,0 +1,210 @@
+__all__ = ["ResponseIngester", "ingester"]
+
+import asyncio
+import bisect
+import io
+import logging
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+import psycopg2
+from sqlalchemy.engine import Engine
+
+from app.core import settings
+from app.database import engine
+from app.models import StudentResponse
+from app.schemas import StudentResponseCreate
+
+logger = logging.getLogger(__name__)
+
+_COLUMNS = ("quiz_session_id", "student_id", "question", "version", "choice", "text")
+_COPY = f"COPY {StudentResponse.__tablename__} ({', '.join(_COLUMNS)}) FROM STDIN"
+# Upper bounds of the flush size histogram's buckets
+_SIZE_BUCKETS = (1, 10, 100, 1000, 10000)
+# Attempts at the final flush before the remaining responses are given up on
+_SHUTDOWN_ATTEMPTS = 3
+
+
+def _copy_value(value: Any) -> str:
+    # COPY's text format
+    if value is None:
+        return "\\N"
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+class ResponseIngester:
+    def __init__(
+        self, *, engine: Engine, max_rows: int, interval: float, capacity: int
+    ):
+        """
+        Buffers student responses and writes them with COPY, in batches,
+        instead of a transaction per response.
+
+        **Parameters**
+
+        * `max_rows`: A flush starts once this many responses are buffered...
+        * `interval`: ...or after this many seconds, whichever comes first.
+            A flush writes at most `max_rows` responses per COPY.
+        * `capacity`: Responses that may be buffered or being written.
+            `put` waits for room beyond that, so a websocket stops reading
+            (and its client slows down) instead of memory growing.
+
+        A failed flush keeps its responses and is retried on the next tick.
+        A batch the database rejects (e.g. a response's session was deleted)
+        is split in halves until only the rejected responses are dropped.
+        `stop` flushes whatever is left.
+
+        `start`, `put` and `stop` must be called from the event loop;
+        the COPY itself runs in the threadpool.
+        """
+        self.engine = engine
+        self.max_rows = max_rows
+        self.interval = interval
+        self.capacity = capacity
+        self.rows = 0
+        self.flushes = 0
+        self.failed_flushes = 0
+        self.lost_rows = 0
+        self.flush_sizes = [0] * (len(_SIZE_BUCKETS) + 1)
+        self._latencies: Deque[float] = deque(maxlen=1024)
+        self._buffer: List[StudentResponseCreate] = []
+        self._space: Optional[asyncio.Semaphore] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._closing = False
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        if self._task is not None:
+            return
+        self._closing = False
+        self._space = asyncio.Semaphore(self.capacity)
+        self._wake = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """ Flushes every buffered response, then stops """
+        if self._task is None:
+            return
+        self._closing = True
+        self._wake.set()
+        await self._task
+        self._task = None
+
+    async def put(self, response: StudentResponseCreate) -> None:
+        """ Buffers a response, waiting while the buffer is full """
+        await self._space.acquire()
+        self._buffer.append(response)
+        if len(self._buffer) >= self.max_rows:
+            self._wake.set()
+
+    def stats(self) -> Dict[str, Any]:
+        latencies = sorted(self._latencies)
+        if latencies:
+            latency = {
+                "p50": latencies[len(latencies) // 2] * 1e3,
+                "p99": latencies[int(len(latencies) * 0.99)] * 1e3,
+                "max": latencies[-1] * 1e3,
+            }
+        else:
+            latency = {}
+        bounds = [f"<={bound}" for bound in _SIZE_BUCKETS] + [f">{_SIZE_BUCKETS[-1]}"]
+        return {
+            "rows": self.rows,
+            "flushes": self.flushes,
+            "failed_flushes": self.failed_flushes,
+            "lost_rows": self.lost_rows,
+            "buffered": len(self._buffer),
+            "flush_sizes": dict(zip(bounds, self.flush_sizes)),
+            # Of the last 1024 flushes
+            "flush_latency_ms": latency,
+        }
+
+    async def _run(self) -> None:
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self._drain()
+        for attempt in range(_SHUTDOWN_ATTEMPTS):
+            if await self._drain():
+                return
+            await asyncio.sleep(self.interval * 2 ** attempt)
+        self.lost_rows += len(self._buffer)
+        logger.error("Gave up writing %s student responses", len(self._buffer))
+
+    async def _drain(self) -> bool:
+        # Writes the buffer a batch at a time. Returns False if a flush failed.
+        loop = asyncio.get_running_loop()
+        while self._buffer:
+            # A stack of what's left of the batch, next to write last
+            batches = [self._buffer[: self.max_rows]]
+            del self._buffer[: self.max_rows]
+            while batches:
+                batch = batches.pop()
+                try:
+                    duration = await loop.run_in_executor(None, self._flush, batch)
+                except (psycopg2.IntegrityError, psycopg2.DataError):
+                    self.failed_flushes += 1
+                    if len(batch) > 1:
+                        middle = len(batch) // 2
+                        batches += [batch[middle:], batch[:middle]]
+                        continue
+                    # e.g. the quiz session was deleted; retrying wouldn't help
+                    logger.exception("Dropped a student response")
+                    self.lost_rows += 1
+                    self._release(batch)
+                    continue
+                except Exception:
+                    logger.exception("Writing %s student responses failed", len(batch))
+                    self.failed_flushes += 1
+                    # Retried with the next batch
+                    self._buffer[:0] = batch + [
+                        response for rest in reversed(batches) for response in rest
+                    ]
+                    return False
+                self.rows += len(batch)
+                self.flushes += 1
+                self.flush_sizes[bisect.bisect_left(_SIZE_BUCKETS, len(batch))] += 1
+                self._latencies.append(duration)
+                self._release(batch)
+        return True
+
+    def _release(self, batch: List[StudentResponseCreate]) -> None:
+        for _ in batch:
+            self._space.release()
+
+    def _flush(self, batch: List[StudentResponseCreate]) -> float:
+        # Runs in the threadpool. Returns how long the COPY took.
+        start = time.perf_counter()
+        data = io.StringIO(
+            "".join(
+                "\t".join(_copy_value(getattr(response, c)) for c in _COLUMNS) + "\n"
+                for response in batch
+            )
+        )
+        connection = self.engine.raw_connection()
+        try:
+            with connection.cursor() as cursor:
+                cursor.copy_expert(_COPY, data)
+            connection.commit()
+        finally:
+            # Rolls back anything uncommitted
+            connection.close()
+        return time.perf_counter() - start
+
+
+ingester = ResponseIngester(
+    engine=engine,
+    max_rows=settings.RESPONSE_FLUSH_ROWS,
+    interval=settings.RESPONSE_FLUSH_INTERVAL_MS / 1000,
+    capacity=settings.RESPONSE_BUFFER_CAPACITY,
+)
@@ -4,8 +4,12 @@ from os import path
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
-from app.core import settings
+from app.core import settings, security
+from app.ingest import ingester
+from app.relay import relay
 from app.routes import router
+from app.tallies import tallies
+from app.sweeper import sweeper
 
 _HERE = path.dirname(path.realpath(__file__))
 
@@ -13,6 +17,16 @@ _HERE = path.dirname(path.realpath(__file__))
 def init_app():
     app = FastAPI()
     app.include_router(router)
+    app.add_event_handler("shutdown", security.password_pool.shutdown)
+    app.add_event_handler("startup", sweeper.start)
+    app.add_event_handler("shutdown", sweeper.stop)
+    app.add_event_handler("startup", relay.start)
+    app.add_event_handler("shutdown", relay.stop)
+    app.add_event_handler("startup", ingester.start)
+    # Writes the responses that are still buffered
+    app.add_event_handler("shutdown", ingester.stop)
+    app.add_event_handler("startup", tallies.start)
+    app.add_event_handler("shutdown", tallies.stop)
 
     origins = settings.BACKEND_CORS_ORIGINS
     app.add_middleware(
@@ -21,6 +35,8 @@ def init_app():
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["*"],
+        # Editors send the quiz's ETag back as If-Match (see routes.quiz.patch_quiz)
+        expose_headers=["ETag"],
     )
     return app
 
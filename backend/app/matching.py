@@ -0,0 +1,113 @@
+__all__ = ["MatchIndex", "normalize"]
+
+import unicodedata
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Set, Union
+
+from app.cache import LRUCache
+from app.core import settings
+
+
+class _FoldPunctuation(dict):
+    # str.translate table mapping punctuation to a space,
+    #  filled in as characters are first seen
+    def __missing__(self, char: int) -> Union[str, int]:
+        folded = " " if unicodedata.category(chr(char)).startswith("P") else char
+        self[char] = folded
+        return folded
+
+
+_fold_punctuation = _FoldPunctuation()
+
+
+@lru_cache(maxsize=settings.SHORT_ANSWER_CACHE_SIZE)
+def normalize(text: str) -> str:
+    """
+    Normalizes like Security.to_identifier (NFKD, lowercase),
+    then folds punctuation and runs of whitespace into single spaces:
+    "  Jean-Luc  Picard. " -> "jean luc picard"
+    """
+    text = unicodedata.normalize("NFKD", text).lower()
+    return " ".join(text.translate(_fold_punctuation).split())
+
+
+def _deletions(text: str, edits: int) -> Set[str]:
+    # Every string made by deleting up to `edits` characters, including `text`
+    found = {text}
+    frontier = {text}
+    for _ in range(edits):
+        frontier = {s[:i] + s[i + 1 :] for s in frontier for i in range(len(s))}
+        found |= frontier
+    return found
+
+
+def _within(a: str, b: str, edits: int) -> bool:
+    """ Whether the optimal string alignment distance of a and b is <= edits """
+    if abs(len(a) - len(b)) > edits:
+        return False
+    previous: List[int] = []
+    row = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        before, previous, row = previous, row, [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            row[j] = min(previous[j] + 1, row[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                # A transposition is one edit
+                row[j] = min(row[j], before[j - 2] + 1)
+        if min(row) > edits:
+            return False
+    return row[-1] <= edits
+
+
+class MatchIndex:
+    def __init__(self, answers: Iterable[str], *, max_edits: int = 0):
+        """
+        The accepted answers to a short answer question, normalized once
+        (see normalize) so that checking an answer is a set lookup.
+
+        With `max_edits`, answers within that many edits (insertions,
+        deletions, substitutions or transpositions) of an accepted answer
+        also match. Candidates are found through a symmetric deletion index:
+        strings within k edits share a string made by deleting at most k
+        characters from each, so only those need an edit distance check.
+        Accepted answers of `max_edits` characters or fewer only match exactly,
+        or anything that short would match.
+
+        `in` expects normalized text; `match` normalizes it.
+        """
+        self.accepted = frozenset(normalize(answer) for answer in answers)
+        self.max_edits = max_edits
+        self._deletions: Dict[str, List[str]] = {}
+        self._fuzzy: Optional[LRUCache] = None
+        if max_edits:
+            for answer in self.accepted:
+                if len(answer) <= max_edits:
+                    continue
+                for deleted in _deletions(answer, max_edits):
+                    self._deletions.setdefault(deleted, []).append(answer)
+            self._fuzzy = LRUCache(maxsize=settings.SHORT_ANSWER_CACHE_SIZE)
+
+    def __contains__(self, normalized: str) -> bool:
+        if normalized in self.accepted:
+            return True
+        if self._fuzzy is None:
+            return False
+        found = self._fuzzy.get(normalized)
+        if found is None:
+            found = self._search(normalized)
+            self._fuzzy.set(normalized, found)
+        return found
+
+    def match(self, text: str) -> bool:
+        return normalize(text) in self
+
+    def _search(self, normalized: str) -> bool:
+        checked = set()
+        for deleted in _deletions(normalized, self.max_edits):
+            for answer in self._deletions.get(deleted, ()):
+                if answer not in checked:
+                    checked.add(answer)
+                    if _within(normalized, answer, self.max_edits):
+                        return True
+        return False
@@ -8,7 +8,7 @@ from sqlalchemy.sql.schema import (
     Column as C,
     ForeignKey as FK,
     CheckConstraint,
-    UniqueConstraint,
+    Index,
 )
 from sqlalchemy.dialects.postgresql import UUID, ExcludeConstraint, ENUM, JSONB
 from sqlalchemy.sql import functions
@@ -92,11 +92,31 @@ def QuizFK(**kw):
     )
 
 
+def QuizSessionFK(**kw):
+    return C(
+        UUID(as_uuid=True),
+        FK("quiz_session.id", ondelete="CASCADE"),
+        nullable=False,
+        **kw,
+    )
+
+
 #######################################################################################
 class User(Base):
-    # Todo: as it stands, one can get someone else's number
-    #  if the person with the highest number deletes their account
-    __table_args__ = (UniqueConstraint("identifier_name", "number"),)
+    # Numbers are allocated from UserNumber, which never counts down,
+    #  so a number is never handed out twice (even after an account is deleted)
+    __table_args__ = (
+        # Unique, and covering for name#number -> id lookups (index-only scans)
+        Index(
+            "uq_user_identifier_name_number",
+            "identifier_name",
+            "number",
+            unique=True,
+            postgresql_include=["id"],
+        ),
+        # Keyset pagination (crud._CRUDBase.get_multi) orders by (ts, id)
+        Index("ix_user_ts_id", "ts", "id"),
+    )
     id = ID()
     ts = TS()
     display_name = C(
@@ -122,32 +142,136 @@ class User(Base):
         return self.display_name + "#" + str(self.number).zfill(4)
 
 
+class UserNumber(Base):
+    # The last number handed out for each identifier name.
+    #  See crud.CRUDUser.create
+    identifier_name = C(VARCHAR(32), primary_key=True)
+    last_number = C(INT, nullable=False)
+
+
 class Room(Base):
     # Guarantees unique room code (of currently active rooms).
     # Two rooms can not share the same code if they are both active.
-    # Todo: add time component so people can't get the same room right after each other
+    # Codes are allocated by room_codes.RoomCodeAllocator, which also keeps a closed
+    #  room's code from being handed out again right away.
     __table_args__ = (
         ExcludeConstraint(("code", "="), where=(text("is_active = TRUE"))),
+        # Joining a room looks it up by code; closed rooms are left out of the index
+        Index("ix_room_code_active", "code", postgresql_where=text("is_active")),
+        Index("ix_room_owner_id_ts_id", "owner_id", "ts", "id"),
+        # Finds idle rooms for sweeper.RoomSweeper
+        Index(
+            "ix_room_last_active_active",
+            "last_active",
+            postgresql_where=text("is_active"),
+        ),
     )
     id = ID()
     ts = TS()
     code = C(TEXT, nullable=False)
     is_active = C(BOOL)
     owner_id = UserFK()
-    session = relationship("QuizSession")
+    # Written in batches (see crud.CRUDRoom.flush_activity), so it can lag behind
+    last_active = TS(nullable=False)
+    session = relationship("QuizSession", back_populates="room")
+
+
+class QuizSession(Base):
+    # A quiz being given in a room
+    id = ID()
+    ts = TS()
+    room_id = RoomFK(index=True)
+    room = relationship("Room", back_populates="session")
+    quiz_id = QuizFK()
+    is_active = C(BOOL, default=True, nullable=False)
+    # Set once the closed session's responses are added to QuizRollup
+    rolled_up = C(BOOL, nullable=False, server_default=text("false"))
+
+
+class StudentResponse(Base):
+    # A student's answer to one question of a quiz session.
+    # Written in batches by ingest.ResponseIngester, never one at a time.
+    __table_args__ = (
+        Index(
+            "ix_student_response_quiz_session_id_question",
+            "quiz_session_id",
+            "question",
+        ),
+    )
+    id = ID()
+    ts = TS()
+    quiz_session_id = QuizSessionFK()
+    student_id = UserFK()
+    # The question's index in the quiz content, at the quiz's `version`
+    question = C(INT, nullable=False)
+    version = C(INT, nullable=False)
+    # The index of the chosen answer (multiple choice) or the text (short answer)
+    choice = C(INT)
+    text = C(TEXT)
+
+
+class RoomEventOverflow(Base):
+    # Room events too large for a NOTIFY payload (see relay.RoomRelay).
+    # Rows are short-lived; listeners read them right after they're written.
+    id = ID()
+    ts = TS(index=True)
+    payload = C(TEXT, nullable=False)
 
 
 class Quiz(Base):
-    __table_args__ = (UniqueConstraint("title", "owner_id"),)
+    __table_args__ = (
+        # The title is stored in the content (see schemas._QuizContent)
+        Index(
+            "uq_quiz_owner_id_title",
+            "owner_id",
+            text("(content ->> 't')"),
+            unique=True,
+        ),
+        Index("ix_quiz_owner_id_ts_id", "owner_id", "ts", "id"),
+    )
     id = ID()
     ts = TS()
     owner_id = UserFK()
     owner = relationship("User", back_populates="quizzes")
     is_public = C(BOOL, default=True)
     content = C(JSONB)
+    # Incremented every time the content changes
+    version = C(INT, nullable=False, server_default=text("1"))
+
+
+# A quiz's history is stored as an append-only log of the json-patches applied to it
+#  (QuizRevision), plus a full copy of the content every few versions (QuizSnapshot).
+#  The content as of any version is the closest earlier snapshot
+#  with the revisions since then applied. See crud.CRUDQuiz.get_content
+class QuizRevision(Base):
+    quiz_id = QuizFK(primary_key=True)
+    # The version the patch produced
+    version = C(INT, primary_key=True)
+    ts = TS()
+    patch = C(JSONB, nullable=False)
+
 
+class QuizSnapshot(Base):
+    quiz_id = QuizFK(primary_key=True)
+    version = C(INT, primary_key=True)
+    content = C(JSONB, nullable=False)
 
 
+class QuizRollup(Base):
+    # All-time tallies of the responses to a quiz's questions,
+    #  added to as sessions close (see crud.CRUDQuizRollup).
+    # A question is identified by the version it was last added or edited in
+    #  and its index in that version. Responses to an unchanged question are
+    #  counted together across versions; an edit starts a new row.
+    quiz_id = QuizFK(primary_key=True)
+    version = C(INT, primary_key=True)
+    question = C(INT, primary_key=True)
+    responses = C(INT, nullable=False, server_default=text("0"))
+    correct = C(INT, nullable=False, server_default=text("0"))
+    incorrect = C(INT, nullable=False, server_default=text("0"))
+    # Choice index -> count (multiple choice), bucket -> count (short answer)
+    choices = C(JSONB, nullable=False, server_default=text("'{}'"))
+    buckets = C(JSONB, nullable=False, server_default=text("'{}'"))
 
 
 ########################################################################################
@@ -170,9 +294,12 @@ CREATE FUNCTION _to_identifier_func() RETURNS TRIGGER AS $$
     return "MODIFY"
 $$ LANGUAGE PLPYTHON3U;"""
 )
+# Only fires when the display name is written,
+#  so updates to other columns (e.g. a password rehash) skip the normalization
 _to_identifier_trigger = DDL(
     """\
-CREATE TRIGGER _to_identifier_trigger BEFORE INSERT OR UPDATE on public.user
+CREATE TRIGGER _to_identifier_trigger BEFORE INSERT OR UPDATE OF display_name
+ON public.user
 FOR EACH ROW EXECUTE PROCEDURE _to_identifier_func();"""
 )
 
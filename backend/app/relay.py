@@ -0,0 +1,157 @@
+__all__ = ["RoomRelay", "relay"]
+
+import json
+import logging
+import select
+import threading
+import uuid
+from typing import Any, Hashable, Optional
+from uuid import UUID
+
+import psycopg2
+import psycopg2.extensions
+from sqlalchemy import delete, func, insert, select as sql_select
+from sqlalchemy.engine import Engine
+
+from app.core import settings
+from app.database import engine
+from app.hub import RoomHub, hub
+from app.models import RoomEventOverflow
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "room_events"
+# Marks a notification whose event is stored in room_event_overflow
+_OVERFLOW = "@"
+
+
+class RoomRelay:
+    def __init__(
+        self,
+        hub: RoomHub,
+        *,
+        engine: Engine,
+        dsn: str,
+        max_payload: int,
+        overflow_ttl_seconds: int = 60,
+    ):
+        """
+        Relays room events between worker processes with Postgres LISTEN/NOTIFY,
+        so students connected to another worker receive them too.
+
+        Each process has one listening connection (not one per websocket),
+        owned by a background thread. `publish` delivers an event to this
+        process's hub right away and notifies every other process.
+
+        A notification is "<origin> <room id> <event json>".
+        Events too large for a notification (`max_payload` bytes; Postgres
+        allows just under 8000) are stored in room_event_overflow, and the
+        notification carries the row's id instead.
+        Overflow rows are deleted after `overflow_ttl_seconds`.
+        """
+        self.hub = hub
+        self.engine = engine
+        self.dsn = dsn
+        self.max_payload = max_payload
+        self.overflow_ttl_seconds = overflow_ttl_seconds
+        # Identifies this process's notifications, which it has already delivered
+        self.origin = uuid.uuid4().hex
+        self.received = 0
+        self.listening = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._listen, name="room-relay", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        self.listening.clear()
+
+    def publish(self, room_id: Hashable, event: Any) -> None:
+        """ Sends an event to the room's websockets in every process """
+        message = event if isinstance(event, str) else json.dumps(event)
+        self.hub.publish_threadsafe(room_id, message)
+        payload = f"{self.origin} {room_id} {message}"
+        with self.engine.begin() as conn:
+            if len(payload.encode()) > self.max_payload:
+                table = RoomEventOverflow.__table__
+                overflow_id = conn.execute(
+                    insert(table).values(payload=message).returning(table.c.id)
+                ).scalar_one()
+                payload = f"{self.origin} {room_id} {_OVERFLOW}{overflow_id}"
+            # Sent when the transaction commits
+            conn.execute(sql_select(func.pg_notify(CHANNEL, payload)))
+
+    def _listen(self) -> None:
+        while not self._stop.is_set():
+            conn = None
+            try:
+                conn = psycopg2.connect(self.dsn)
+                conn.set_isolation_level(
+                    psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT
+                )
+                with conn.cursor() as cursor:
+                    cursor.execute(f"LISTEN {CHANNEL}")
+                self.listening.set()
+                while not self._stop.is_set():
+                    # Wakes up at least once a second to check for stop
+                    if select.select([conn], [], [], 1.0) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        notification = conn.notifies.pop(0)
+                        self._deliver(conn, notification.payload)
+            except Exception:
+                self.listening.clear()
+                logger.exception("Room relay listener failed; reconnecting")
+                self._stop.wait(1.0)
+            finally:
+                if conn is not None:
+                    conn.close()
+
+    def _deliver(self, conn, payload: str) -> None:
+        origin, room_id, message = payload.split(" ", 2)
+        if origin == self.origin:
+            return
+        if message.startswith(_OVERFLOW):
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    "SELECT payload FROM room_event_overflow WHERE id = %s",
+                    (message[len(_OVERFLOW) :],),
+                )
+                row = cursor.fetchone()
+            if row is None:
+                # Expired before it was read
+                logger.warning("Room event %s has expired", message)
+                return
+            message = row[0]
+            self._delete_expired()
+        self.received += 1
+        self.hub.publish_threadsafe(UUID(room_id), message)
+
+    def _delete_expired(self) -> None:
+        table = RoomEventOverflow.__table__
+        cutoff = func.now() - func.make_interval(
+            0, 0, 0, 0, 0, 0, self.overflow_ttl_seconds
+        )
+        with self.engine.begin() as conn:
+            conn.execute(delete(table).where(table.c.ts < cutoff))
+
+
+relay = RoomRelay(
+    hub,
+    engine=engine,
+    dsn=str(settings.SQLALCHEMY_DATABASE_URI),
+    max_payload=settings.ROOM_RELAY_MAX_PAYLOAD,
+)
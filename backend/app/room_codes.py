@@ -0,0 +1,163 @@
+__all__ = ["RoomCodeAllocator"]
+
+import random
+import string
+import threading
+import time
+from collections import deque
+from math import gcd
+from typing import Deque, Dict, Iterable, Set, Tuple
+
+from app.exceptions import Http503ServerBusy
+from app.sharding import shard_of
+
+
+class RoomCodeAllocator:
+    def __init__(
+        self,
+        *,
+        length: int = 5,
+        alphabet: str = string.ascii_uppercase,
+        cooldown: float = 600.0,
+        batch_size: int = 256,
+        shard: int = 0,
+        shards: int = 1,
+    ):
+        """
+        Hands out room codes that no other active room (in this process) is using.
+
+        Free codes are kept in a pool, refilled `batch_size` at a time by walking
+        a random permutation of every possible code. Each code comes up once per
+        walk, so allocating never has to guess and retry,
+        no matter how many rooms are active.
+
+        **Parameters**
+
+        * `length`, `alphabet`: The shape of a code. 5 uppercase letters
+            make 26^5 (about 11.8 million) codes.
+        * `cooldown`: Seconds a released code waits before it's handed out again,
+            so students of the old room can't wander into the new one.
+        * `batch_size`: Codes generated per refill.
+        * `shard`, `shards`: Only codes owned by `shard` (see sharding.shard_of)
+            are handed out. Workers of a sharded deployment allocate
+            from disjoint sets of codes, so they never collide.
+        """
+        self.length = length
+        self.alphabet = alphabet
+        self.cooldown = cooldown
+        self.batch_size = batch_size
+        self.shard = shard
+        self.shards = shards
+        self.size = len(alphabet) ** length
+        # The permutation is i -> (step * i + offset) % size,
+        #  which visits every code once if step and size are coprime
+        rng = random.SystemRandom()
+        self._step = rng.randrange(1, self.size)
+        while gcd(self._step, self.size) != 1:
+            self._step = rng.randrange(1, self.size)
+        self._offset = rng.randrange(self.size)
+        self._cursor = 0
+
+        self._free: Deque[str] = deque()
+        self._claimed: Set[str] = set()
+        # (time the code can be reused, code), oldest first
+        self._cooling: Deque[Tuple[float, str]] = deque()
+        self._cooling_codes: Set[str] = set()
+        self._lock = threading.Lock()
+
+    def allocate(self) -> str:
+        """
+        Claims a free code.
+
+        Raises: Http503ServerBusy (every code is in use or cooling down)
+        """
+        with self._lock:
+            self._thaw()
+            while True:
+                if not self._free:
+                    self._refill()
+                code = self._free.popleft()
+                # A code in the pool may have been claimed since it was added
+                if code not in self._claimed and code not in self._cooling_codes:
+                    self._claimed.add(code)
+                    return code
+
+    def claim(self, code: str) -> None:
+        """ Marks a code as in use, e.g. one chosen by a user """
+        with self._lock:
+            self._claimed.add(code)
+
+    def load(self, codes: Iterable[str]) -> None:
+        """ Claims every code in `codes` (the codes of the active rooms) """
+        with self._lock:
+            self._claimed.update(codes)
+
+    def reload(self, codes: Iterable[str]) -> None:
+        """
+        Makes `codes` (the codes of the active rooms) the claimed codes.
+
+        Other claimed codes, e.g. of rooms another process closed,
+        are released.
+        """
+        codes = set(codes)
+        with self._lock:
+            for code in self._claimed - codes:
+                self._cooling.append((time.monotonic() + self.cooldown, code))
+                self._cooling_codes.add(code)
+            self._claimed = codes
+
+    def release(self, code: str) -> None:
+        """ Returns a code to the pool once it has cooled down """
+        with self._lock:
+            if code not in self._claimed:
+                return
+            self._claimed.discard(code)
+            self._cooling.append((time.monotonic() + self.cooldown, code))
+            self._cooling_codes.add(code)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "free": len(self._free),
+            "claimed": len(self._claimed),
+            "cooling": len(self._cooling),
+            "size": self.size,
+        }
+
+    def _thaw(self) -> None:
+        # Caller must hold the lock
+        now = time.monotonic()
+        while self._cooling and self._cooling[0][0] <= now:
+            _, code = self._cooling.popleft()
+            self._cooling_codes.discard(code)
+            if code not in self._claimed:
+                self._free.append(code)
+
+    def _refill(self) -> None:
+        # Caller must hold the lock
+        if len(self._claimed) + len(self._cooling_codes) >= self.size:
+            raise Http503ServerBusy
+        added = 0
+        # Stops after a full walk of the permutation,
+        #  in case every remaining code is claimed
+        for _ in range(self.size):
+            code = self._code(self._cursor)
+            self._cursor = (self._cursor + 1) % self.size
+            if code in self._claimed or code in self._cooling_codes:
+                continue
+            if self.shards > 1 and shard_of(code, self.shards) != self.shard:
+                continue
+            self._free.append(code)
+            added += 1
+            if added == self.batch_size:
+                return
+        if not added:
+            raise Http503ServerBusy
+
+    def _code(self, i: int) -> str:
+        n = (self._step * i + self._offset) % self.size
+        base = len(self.alphabet)
+        chars = []
+        for _ in range(self.length):
+            n, r = divmod(n, base)
+            chars.append(self.alphabet[r])
+        return "".join(chars)
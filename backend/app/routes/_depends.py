@@ -27,6 +27,27 @@ def get_db() -> Generator:
 def get_current_user(
     db: Session = Depends(get_db), token: str = Depends(_reusable_oauth2)
 ) -> models.User:
+    return _get_user(db, token)
+
+
+def authenticate_websocket(token: str) -> models.User:
+    """
+    The active user a websocket's token belongs to.
+
+    Browsers can't set headers on websockets, so the token is a query parameter.
+    The database session is only held for the lookup; depending on get_db would
+    hold a pooled connection for as long as the websocket is open.
+
+    Raises: HTTPException
+    """
+    with SessionLocal() as db:
+        user = _get_user(db, token)
+    if not crud.user.is_active(user):
+        raise HTTPException(status_code=400, detail="Inactive user")
+    return user
+
+
+def _get_user(db: Session, token: str) -> models.User:
     try:
         payload = jwt.decode(
             token, settings.SECRET_KEY, algorithms=[security.ALGORITHM]
@@ -37,7 +58,7 @@ def get_current_user(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Could not validate credentials",
         )
-    user = crud.user.get(db, id=token_data.sub)
+    user = crud.user.get_principal(db, id=token_data.sub, token=token)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     return user
@@ -0,0 +1,63 @@
+from typing import Any, Dict, Iterable, Optional, Type
+
+from fastapi.responses import Response, StreamingResponse
+from pydantic import BaseModel
+
+from ..exceptions import Http412QuizVersionConflict
+
+
+def ndjson_response(objs: Iterable, schema: Type[BaseModel]) -> StreamingResponse:
+    """
+    Streams `objs` as newline-delimited JSON, one object per line.
+
+    Objects are serialized as they are produced, so a generator backed by a
+    server-side cursor (e.g. crud._CRUDBase.stream) is sent in constant memory.
+    """
+
+    def lines():
+        for obj in objs:
+            yield schema.from_orm(obj).json() + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+def unvalidated_response(
+    obj: Any, schema: Type[BaseModel], headers: Optional[Dict[str, str]] = None
+) -> Response:
+    """
+    Serializes `obj` as `schema` without validating it.
+
+    Returning an object lets FastAPI validate it against the route's
+    response_model again, which for a quiz means every question.
+    Use this only for objects whose fields were validated before they were
+    stored (e.g. quizzes loaded by crud), and whose schema has no validators
+    that change values.
+    """
+    fields = {name: getattr(obj, name) for name in schema.__fields__}
+    return Response(
+        content=schema.construct(**fields).json(),
+        media_type="application/json",
+        headers=headers,
+    )
+
+
+def etag(version: int) -> str:
+    return f'"{version}"'
+
+
+def parse_if_match(if_match: Optional[str]) -> Optional[int]:
+    """
+    Returns the version an If-Match header requires; None if any version will do.
+
+    Raises: Http412QuizVersionConflict
+    """
+    if if_match is None or if_match.strip() == "*":
+        return None
+    tag = if_match.strip()
+    # If-Match uses strong comparison, so a weak tag never matches
+    if tag.startswith("W/") or not (len(tag) > 2 and tag[0] == tag[-1] == '"'):
+        raise Http412QuizVersionConflict
+    try:
+        return int(tag[1:-1])
+    except ValueError as err:
+        raise Http412QuizVersionConflict from err
@@ -16,16 +16,16 @@ router = APIRouter(
 
 
 @router.post("access", response_model=schemas.Token)
-def login_access_token(
+async def login_access_token(
     db: Session = Depends(deps.get_db),
     form_data: OAuth2PasswordRequestForm = Depends(OAuth2PasswordRequestForm),
 ):
     """
     OAuth2 compatible token login, get an access token for future requests
 
-    Raises: Http404UserNotFound, Http400IncorrectPassword
+    Raises: Http404UserNotFound, Http400IncorrectPassword, Http503ServerBusy
     """
-    user = crud.user.authenticate(
+    user = await crud.user.authenticate(
         db, username=form_data.username, password=form_data.password
     )
     if not crud.user.is_active(user):
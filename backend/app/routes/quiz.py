@@ -1,12 +1,20 @@
-from typing import List
+import json
+from typing import List, Optional
 from uuid import UUID
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response, status
 from sqlalchemy.orm import Session
 
 from app import schemas, models, crud
 from . import _depends as deps
-from ..exceptions import Http404QuizNotFound
+from ._responses import ndjson_response, etag, parse_if_match, unvalidated_response
+from ..exceptions import (
+    Http404QuizNotFound,
+    Http404QuizSessionNotFound,
+    Http412QuizVersionConflict,
+)
+from ..grading import grade_session
+from ..relay import relay
 
 router = APIRouter(
     prefix="/quizzes",
@@ -22,7 +30,20 @@ def create_quiz(
 ):
     if current_user.id != quiz.owner_id:
         raise HTTPException(400, "You do not have permission to post this quiz.")
-    return crud.quiz.create(db, obj_in=quiz)
+    # The content was just validated as QuizCreate
+    return unvalidated_response(crud.quiz.create(db, obj_in=quiz), schemas.Quiz)
+
+
+@router.post("/create-many", response_model=List[schemas.Quiz])
+def create_quizzes(
+    quizzes: List[schemas.QuizCreate],
+    db: Session = Depends(deps.get_db),
+    current_user: models.User = Depends(deps.get_current_active_user),
+):
+    """ Imports several quizzes in a single transaction """
+    if any(quiz.owner_id != current_user.id for quiz in quizzes):
+        raise HTTPException(400, "You do not have permission to post these quizzes.")
+    return crud.quiz.create_many(db, objs_in=quizzes)
 
 
 @router.post("/get", response_model=schemas.Quiz)
@@ -31,32 +52,163 @@ def get_quiz(
     db: Session = Depends(deps.get_db),
     current_user: models.User = Depends(deps.get_current_active_user),
 ):
+    """ The ETag header is the quiz's version; send it back as If-Match to /patch """
     quiz_in_db = crud.quiz.get(db, quiz_id)
+    if quiz_in_db is None:
+        raise Http404QuizNotFound
     if quiz_in_db.owner_id != current_user.id:
         raise HTTPException(400, "You do not have permission to get this quiz.")
-    return quiz_in_db
+    headers = {"ETag": etag(quiz_in_db.version)}
+    return unvalidated_response(quiz_in_db, schemas.Quiz, headers=headers)
 
 
-@router.patch("/patch", response_model=schemas.Quiz)
-def patch_quiz(
-    quiz: schemas.QuizUpdate,
+@router.post("/get-for-student", response_model=schemas.QuizForStudent)
+def get_quiz_for_student(
+    quiz_id: UUID,
     db: Session = Depends(deps.get_db),
     current_user: models.User = Depends(deps.get_current_active_user),
 ):
-    """ Arguments: json-diff"""
-    # Todo: Order errors for security
-    quiz_in_db = crud.quiz.get(db, quiz.id)
-    if current_user.id != quiz.id:
-        raise HTTPException(400, "You do not have permission to get this quiz.")
-    return crud.quiz.update(db, db_obj=quiz_in_db, obj_in=quiz)
-
+    """ A public quiz without its correct answers """
+    view = crud.quiz.get_for_student(db, id=quiz_id)
+    if view is None:
+        raise Http404QuizNotFound
+    # Already serialized (and cached), so the response model isn't applied
+    return Response(content=view, media_type="application/json")
 
 
+@router.post("/get-version", response_model=schemas.QuizVersion)
+def get_quiz_version(
+    quiz_id: UUID,
+    version: int,
+    db: Session = Depends(deps.get_db),
+    current_user: models.User = Depends(deps.get_current_active_user),
+):
+    """ The quiz's content as it was at `version` """
+    content = crud.quiz.get_content(
+        db, id=quiz_id, version=version, owner_id=current_user.id
+    )
+    if content is None:
+        raise Http404QuizNotFound
+    return {"id": quiz_id, "version": version, "content": content}
 
 
+@router.post("/changed-since", response_model=schemas.QuizChanges)
+def get_quiz_changes(
+    quiz_id: UUID,
+    version: int,
+    db: Session = Depends(deps.get_db),
+    current_user: models.User = Depends(deps.get_current_active_user),
+):
+    """ The questions that were added or edited after `version` """
+    changed = crud.quiz.changed_since(
+        db, id=quiz_id, version=version, owner_id=current_user.id
+    )
+    if changed is None:
+        raise Http404QuizNotFound
+    return {"id": quiz_id, "since": version, "changed_questions": changed}
 
 
+@router.post("/all-time-responses", response_model=List[schemas.QuestionRollup])
+def get_all_time_responses(
+    quiz_id: UUID,
+    db: Session = Depends(deps.get_db),
+    current_user: models.User = Depends(deps.get_current_active_user),
+):
+    """
+    Tallies of every closed session's responses, by question.
+    A question edited over the quiz's lifetime has a row per edit.
+    """
+    return crud.quiz_rollup.get_all_time(
+        db, quiz_id=quiz_id, owner_id=current_user.id
+    )
+
+
+@router.post("/session-grades", response_model=schemas.SessionGrades)
+def get_session_grades(
+    quiz_session_id: UUID,
+    db: Session = Depends(deps.get_db),
+    current_user: models.User = Depends(deps.get_current_active_user),
+):
+    """
+    Each student's score in a session, with every question's difficulty
+    and how often each answer was picked.
+    """
+    session = crud.quiz_session.get(db, id=quiz_session_id)
+    if session is None or session.room.owner_id != current_user.id:
+        raise Http404QuizSessionNotFound
+    grades = grade_session(db, quiz_session_id=quiz_session_id)
+    if grades is None:
+        raise Http404QuizSessionNotFound
+    return grades.as_dict()
+
+
+@router.get("/list", response_model=schemas.Page[schemas.Quiz])
+def list_quizzes(
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    db: Session = Depends(deps.get_db),
+    current_user: models.User = Depends(deps.get_current_active_user),
+):
+    """ The current user's quizzes, oldest first """
+    quizzes, next_cursor = crud.quiz.get_multi(
+        db, cursor=cursor, limit=limit, owner_id=current_user.id
+    )
+    return {"items": quizzes, "next_cursor": next_cursor}
 
 
+@router.get("/stream")
+def stream_quizzes(
+    db: Session = Depends(deps.get_db),
+    current_user: models.User = Depends(deps.get_current_active_user),
+):
+    """ All of the current user's quizzes as newline-delimited JSON """
+    return ndjson_response(
+        crud.quiz.stream(db, owner_id=current_user.id), schemas.Quiz
+    )
 
 
+@router.patch("/patch", response_model=schemas.Quiz)
+def patch_quiz(
+    quiz: schemas.QuizUpdate,
+    if_match: Optional[str] = Header(None),
+    db: Session = Depends(deps.get_db),
+    current_user: models.User = Depends(deps.get_current_active_user),
+):
+    """
+    Arguments: json-diff
+
+    With an If-Match header (the ETag from /get), the patch is only applied
+    if nobody else changed the quiz since; otherwise 412 is returned.
+
+    Rooms giving the quiz get the change, redacted for students
+    (see crud.CRUDQuiz.student_event).
+
+    Raises: Http404QuizNotFound, Http412QuizVersionConflict,
+        Http422InvalidQuizContent
+    """
+    where = {"owner_id": current_user.id}
+    version = parse_if_match(if_match)
+    if version is not None:
+        where["version"] = version
+    # Quizzes owned by someone else are reported as not found
+    #  so the existence of a quiz isn't leaked
+    quiz_in_db = crud.quiz.update(db, id=quiz.id, obj_in=quiz, **where)
+    if quiz_in_db is None:
+        if version is not None:
+            # Tell a stale version apart from a missing quiz
+            existing = crud.quiz.get(db, quiz.id)
+            if existing is not None and existing.owner_id == current_user.id:
+                raise Http412QuizVersionConflict
+        raise Http404QuizNotFound
+    if quiz.patch_content:
+        room_ids = crud.quiz_session.get_active_room_ids(db, quiz_id=quiz.id)
+        if room_ids:
+            # Encoded once for every room
+            event = crud.quiz.student_event(
+                quiz_in_db, patch_content=quiz.patch_content
+            )
+            message = json.dumps(event)
+            for room_id in room_ids:
+                relay.publish(room_id, message)
+    headers = {"ETag": etag(quiz_in_db.version)}
+    return unvalidated_response(quiz_in_db, schemas.Quiz, headers=headers)
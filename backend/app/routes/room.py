@@ -1,8 +1,13 @@
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.encoders import jsonable_encoder
 from sqlalchemy.orm import Session
 
 from app import schemas, models, crud
 from . import _depends as deps
+from ..exceptions import Http404RoomNotFound
+from ..ingest import ingester
+from ..relay import relay
+from ..sweeper import sweeper
 
 router = APIRouter(
     prefix="/rooms",
@@ -29,10 +34,8 @@ def get_room_by_code(
     current_user: models.User = Depends(deps.get_current_active_user),
     code: str,
 ):
-    room = crud.room.get_by_code(db, code=code)
-    room.session
-    print("\n" * 3, room.__dict__)
-    return room
+    """ The active room and its quiz sessions """
+    return crud.room.get_by_code(db, code=code)
 
 
 @router.put("/update", response_model=schemas.Room)
@@ -42,4 +45,26 @@ def update_room(
     obj_in: schemas.RoomUpdate,
     current_user: models.User = Depends(deps.get_current_active_user),
 ):
-    return crud.room.get(db, id=obj_in.id)
+    room = crud.room.update(db, id=obj_in.id, obj_in=obj_in, owner_id=current_user.id)
+    if room is None:
+        raise Http404RoomNotFound
+    # e.g. so students see the room close, whichever worker they're connected to
+    event = {"type": "room-updated", "room": schemas.Room.from_orm(room)}
+    relay.publish(room.id, jsonable_encoder(event))
+    return room
+
+
+@router.get("/sweeper-stats")
+def read_sweeper_stats(
+    current_user: models.User = Depends(deps.get_current_active_superuser),
+):
+    """ Idle rooms closed by this worker's sweeper """
+    return {"sweeper": sweeper.stats(), "codes": crud.room.codes.stats()}
+
+
+@router.get("/response-stats")
+def read_response_stats(
+    current_user: models.User = Depends(deps.get_current_active_superuser),
+):
+    """ Student responses written by this worker: flush sizes and latency """
+    return ingester.stats()
@@ -1,8 +1,12 @@
-from fastapi import APIRouter, Depends
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, Query
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 
-from app import schemas, models, crud
+from app import schemas, models, crud, security
 from . import _depends as deps
+from ._responses import ndjson_response
 
 router = APIRouter(
     prefix="/users",
@@ -11,12 +15,36 @@ router = APIRouter(
 
 
 @router.post("/create", response_model=schemas.User)
-def create_user(
+async def create_user(
     *,
     db: Session = Depends(deps.get_db),
     user_in: schemas.UserCreate,
 ):
-    return crud.user.create(db, obj_in=user_in)
+    """ Raises: Http503ServerBusy """
+    hashed_password = await security.hash_password_async(user_in.password)
+    return await run_in_threadpool(
+        crud.user.create, db, obj_in=user_in, hashed_password=hashed_password
+    )
+
+
+@router.post("/create-many", response_model=List[schemas.User])
+async def create_users(
+    *,
+    db: Session = Depends(deps.get_db),
+    users_in: List[schemas.UserCreate],
+    current_user: models.User = Depends(deps.get_current_active_superuser),
+):
+    """
+    Creates a roster of users in a single transaction
+
+    Raises: Http503ServerBusy
+    """
+    hashed_passwords = await security.hash_passwords_async(
+        [user_in.password for user_in in users_in]
+    )
+    return await run_in_threadpool(
+        crud.user.create_many, db, objs_in=users_in, hashed_passwords=hashed_passwords
+    )
 
 
 @router.get("/get-by-name", response_model=schemas.User)
@@ -24,9 +52,41 @@ def get_user_by_name(*, db: Session = Depends(deps.get_db), name: str, number: i
     return crud.user.get_by_name(db=db, name=name, number=number)
 
 
+@router.get("/list", response_model=schemas.Page[schemas.User])
+def list_users(
+    *,
+    db: Session = Depends(deps.get_db),
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    current_user: models.User = Depends(deps.get_current_active_superuser),
+):
+    users, next_cursor = crud.user.get_multi(db, cursor=cursor, limit=limit)
+    return {"items": users, "next_cursor": next_cursor}
+
+
+@router.get("/stream")
+def stream_users(
+    *,
+    db: Session = Depends(deps.get_db),
+    current_user: models.User = Depends(deps.get_current_active_superuser),
+):
+    """ Every user as newline-delimited JSON """
+    return ndjson_response(crud.user.stream(db), schemas.User)
+
+
 @router.get("/me", response_model=schemas.User)
 def read_current_user(
     db: Session = Depends(deps.get_db),
     current_user: models.User = Depends(deps.get_current_active_user),
 ):
     return current_user
+
+
+@router.get("/cache-stats")
+def read_cache_stats(
+    current_user: models.User = Depends(deps.get_current_active_superuser),
+):
+    return {
+        "principals": crud.user.principals.stats(),
+        "names": crud.user.names.stats(),
+    }
@@ -1,10 +1,17 @@
 from uuid import UUID
 
-from fastapi import APIRouter, Depends, WebSocket, HTTPException
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from pydantic import ValidationError
+from starlette import status
 
 from app import schemas, models, crud
+from app.database import SessionLocal
+from app.hub import hub
+from app.ingest import ingester
+from app.tallies import tallies
 from . import _depends as deps
+from ..exceptions import Http404ActiveQuizSessionNotFound, Http404ActiveRoomNotFound
 
 router = APIRouter()
 
@@ -16,20 +23,120 @@ router = APIRouter()
 #          data = await websocket.receive_text()
 #          await websocket.send_text(f"Message text was: {data}")
 
+def _get_own_session(session_id: UUID, code: str, token: str) -> models.QuizSession:
+    """ Raises: HTTPException """
+    user = deps.authenticate_websocket(token)
+    with SessionLocal() as db:
+        session = crud.quiz_session.get(db, id=session_id)
+        if (
+            session is None
+            or session.room.owner_id != user.id
+            or session.room.code != code
+        ):
+            raise HTTPException(
+                status_code=400,
+                detail="You can only view responses to your own sessions.",
+            )
+    return session
+
+
+# The session websockets take the code of the session's room, which is what
+#  a sharded deployment routes on (see sharding.py), so a session's students
+#  and teachers reach the one worker whose tallies count their answers.
 @router.websocket("/session/get_responses")
 async def get_responses_by_session(
-    websocket: WebSocket,
-    *,
-    db: Session = Depends(deps.get_db),
-    session_id: UUID,
-    current_user: models.User = Depends(deps.get_current_active_user),
+    websocket: WebSocket, session_id: UUID, code: str, token: str
 ):
-    session = crud.quiz_session.get(db, id=session_id)
-    if session.room.owner_id != current_user.id:
-        raise HTTPException(
-            status_code=400, detail="You can only view responses to your own sessions."
+    """
+    Live tallies of the session's responses, for the room's owner.
+    Sent as JSON text messages (see tallies.TallyBoard).
+    """
+    # Everything the websocket needs is loaded before it's accepted.
+    #  Later database work should use its own short-lived SessionLocal.
+    try:
+        session = await run_in_threadpool(_get_own_session, session_id, code, token)
+    except HTTPException:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    await websocket.accept()
+    client = await tallies.watch(session, websocket)
+    try:
+        # Teachers don't send anything; receiving notices the disconnect
+        while True:
+            await websocket.receive_text()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        await tallies.leave(client)
+
+
+def _get_active_session(session_id: UUID, code: str, token: str):
+    """ Raises: HTTPException """
+    user = deps.authenticate_websocket(token)
+    with SessionLocal() as db:
+        session = crud.quiz_session.get(db, id=session_id)
+        if session is None or not session.is_active or session.room.code != code:
+            raise Http404ActiveQuizSessionNotFound
+    return user, session
+
+
+@router.websocket("/session/answers")
+async def answer_session(websocket: WebSocket, session_id: UUID, code: str, token: str):
+    """ Students send their answers as JSON text messages (schemas.StudentAnswer) """
+    try:
+        user, session = await run_in_threadpool(
+            _get_active_session, session_id, code, token
         )
+    except HTTPException:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    await websocket.accept()
+    try:
+        while True:
+            data = await websocket.receive_text()
+            try:
+                answer = schemas.StudentAnswer.parse_raw(data)
+            except ValidationError as e:
+                await websocket.send_json({"type": "error", "detail": e.errors()})
+                continue
+            # Waits while the ingester's buffer is full, which stops reading
+            #  from the socket until it has room
+            await ingester.put(
+                schemas.StudentResponseCreate(
+                    **answer.dict(), quiz_session_id=session.id, student_id=user.id
+                )
+            )
+            await tallies.record(session, user.id, answer)
+    except WebSocketDisconnect:
+        pass
+
+
+def _get_active_room(code: str) -> models.Room:
+    # The database session is only held for the lookup,
+    #  not for as long as the websocket is open
+    with SessionLocal() as db:
+        return crud.room.get_by_code(db, code=code)
+
+
+@router.websocket("/rooms/events")
+async def get_room_events(websocket: WebSocket, code: str):
+    """
+    Events in the active room with the code, sent as JSON text messages:
+    "room-updated", and "quiz-patched" or "quiz-resync" when a quiz given in
+    the room is edited (see crud.CRUDQuiz.student_event)
+    """
+    try:
+        room = await run_in_threadpool(_get_active_room, code)
+    except Http404ActiveRoomNotFound:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
     await websocket.accept()
-    while True:
-        data = await websocket.receive_text()
-        await websocket.send_text(f"Message text was: {data}")
+    client = hub.join(room.id, websocket)
+    try:
+        # Clients don't send anything yet; receiving notices the disconnect
+        while True:
+            await websocket.receive_text()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        await hub.leave(client)
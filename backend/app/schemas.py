@@ -1,11 +1,12 @@
-import random
-import string
-from typing import Optional, List, Literal, Union, Any
+from typing import Optional, List, Literal, Union, Any, Generic, TypeVar, Annotated
 
 import pydantic
 from pydantic import BaseModel, validator, Field, Json
+from pydantic.generics import GenericModel
 from uuid import UUID
 
+ItemType = TypeVar("ItemType")
+
 
 # def _sort_by_id(_list: List, on: str):
 #     # Todo: This function isn't optimized.
@@ -30,6 +31,13 @@ from uuid import UUID
 # _sort_answers = partial(_sort_by_id, on="previous_answer")
 
 
+########################################################################################
+class Page(GenericModel, Generic[ItemType]):
+    items: List[ItemType]
+    # Pass next_cursor to get the next page. It is null on the last page.
+    next_cursor: Optional[str]
+
+
 ########################################################################################
 class Token(BaseModel):
     access_token: str
@@ -86,11 +94,8 @@ class UserInDB(_UserInDB):
 ########################################################################################
 class RoomCreate(BaseModel):
     owner_id: UUID
-    code: str = Field(
-        default_factory=lambda: "".join(
-            random.choice(string.ascii_uppercase) for _ in range(5)
-        )
-    )
+    # A free code is allocated if none is given (see room_codes.RoomCodeAllocator)
+    code: Optional[str] = None
     is_active: bool = True
 
 
@@ -101,12 +106,62 @@ class RoomUpdate(BaseModel):
     is_active: Optional[bool]
 
 
+class QuizSessionCreate(BaseModel):
+    room_id: UUID
+    quiz_id: UUID
+    is_active: bool = True
+
+
+class QuizSessionUpdate(BaseModel):
+    id: UUID
+    is_active: Optional[bool]
+
+
+class _QuizSessionInDB(BaseModel):
+    id: UUID
+    room_id: UUID
+    quiz_id: UUID
+    is_active: bool
+
+    class Config:
+        orm_mode = True
+
+
+class QuizSession(_QuizSessionInDB):
+    pass
+
+
+# Bounds of the integer columns answers are written to
+_INT32_MAX = 2 ** 31 - 1
+
+
+class StudentAnswer(BaseModel):
+    # Sent by a student over the session's websocket
+    question: int = Field(..., ge=0, le=_INT32_MAX)
+    # The version of the quiz the student was shown
+    version: int = Field(..., ge=0, le=_INT32_MAX)
+    choice: Optional[int] = Field(None, ge=0, le=_INT32_MAX)
+    text: Optional[str] = None
+
+    @validator("text")
+    def no_nul(cls, v):
+        # Postgres text can't hold NUL characters
+        if v is not None and "\x00" in v:
+            raise ValueError("text can't contain NUL characters")
+        return v
+
+
+class StudentResponseCreate(StudentAnswer):
+    quiz_session_id: UUID
+    student_id: UUID
+
+
 class _RoomInDB(BaseModel):
     id: UUID
     owner_id: UUID
     code: str
     is_active: bool
-    # session_ids: List[Optional[QuizSession]] = Field(..., alias="session")
+    session: List[QuizSession] = []
 
     class Config:
         orm_mode = True
@@ -124,7 +179,7 @@ class AnswerChoice(BaseModel):
 
 class _QuestionBase(BaseModel):
     query: str
-    type = str
+    type: str
 
 
 class MultipleChoice(_QuestionBase):
@@ -135,9 +190,13 @@ class MultipleChoice(_QuestionBase):
 class ShortAnswer(_QuestionBase):
     type: Literal["short-answer"] = "short-answer"
     answers: list[str]
+    # Also accept answers within this many typos of an answer (see matching.py)
+    max_edits: int = Field(0, ge=0, le=2)
 
 
-AnyQuestion = Union[MultipleChoice, ShortAnswer]
+# Questions are validated by the model matching their "type",
+#  rather than by trying each model of the union in turn
+AnyQuestion = Annotated[Union[MultipleChoice, ShortAnswer], Field(discriminator="type")]
 
 
 class _QuizContent(BaseModel):
@@ -151,6 +210,98 @@ class QuizCreate(BaseModel):
     content: _QuizContent
 
 
+class _QuizInDB(BaseModel):
+    id: UUID
+    owner_id: UUID
+    is_public: bool
+    content: _QuizContent
+    version: int
+
+    class Config:
+        orm_mode = True
+
+
+class Quiz(_QuizInDB):
+    pass
+
+
+class QuizVersion(BaseModel):
+    id: UUID
+    version: int
+    content: _QuizContent
+
+
+class QuestionRollup(BaseModel):
+    # The question as it was at `version` (see models.QuizRollup)
+    version: int
+    question: int
+    responses: int
+    correct: int
+    incorrect: int
+    choices: dict[int, int]
+    buckets: dict[str, int]
+
+    class Config:
+        orm_mode = True
+
+
+class StudentGrade(BaseModel):
+    student_id: UUID
+    score: int
+
+
+class QuestionGrades(BaseModel):
+    # Excluded questions (edited during the session) count for nobody
+    included: bool
+    # The share of answers that were correct
+    difficulty: Optional[float]
+    # By answer index, for multiple choice questions
+    choice_counts: list[int]
+    choice_mean_scores: list[Optional[float]]
+
+
+class SessionGrades(BaseModel):
+    # Included questions
+    possible: int
+    students: list[StudentGrade]
+    questions: list[QuestionGrades]
+
+
+class QuizChanges(BaseModel):
+    id: UUID
+    since: int
+    # Indices (in the current version) of the questions added or edited since then
+    changed_questions: List[int]
+
+
+# What a student taking a quiz sees: no correct answers.
+#  These document crud.CRUDQuiz.get_for_student, which serializes the view itself.
+class AnswerChoiceForStudent(BaseModel):
+    text: str
+
+
+class MultipleChoiceForStudent(_QuestionBase):
+    type: Literal["multiple-choice"] = "multiple-choice"
+    answers: list[AnswerChoiceForStudent]
+
+
+class ShortAnswerForStudent(_QuestionBase):
+    type: Literal["short-answer"] = "short-answer"
+
+
+AnyQuestionForStudent = Annotated[
+    Union[MultipleChoiceForStudent, ShortAnswerForStudent],
+    Field(discriminator="type"),
+]
+
+
+class QuizForStudent(BaseModel):
+    id: UUID
+    version: int
+    t: str = Field(..., title="title")
+    q: list[AnyQuestionForStudent] = Field(..., title="questions")
+
+
 class QuizUpdate(BaseModel):
     # This implementation is flaky.
     # If updating this schema, also update crud.CRUDQuiz
@@ -158,7 +309,7 @@ class QuizUpdate(BaseModel):
     set_is_public: Optional[bool]
     patch_content: Optional[Union[Json, list[Json]]]
 
-    @validator("set_title", "set_is_public", "patch_content")
+    @validator("set_is_public", "patch_content")
     def not_null(cls, v):
         if v is None:
             raise ValueError
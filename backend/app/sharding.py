@@ -0,0 +1,186 @@
+__all__ = ["shard_of", "ShardRouter", "run_sharded"]
+
+import asyncio
+import logging
+import os
+import sys
+import zlib
+from typing import List, Optional
+from urllib.parse import parse_qs, urlsplit
+
+logger = logging.getLogger(__name__)
+
+# The largest request head the router reads before choosing a worker
+_MAX_HEAD = 64 * 1024
+
+
+def shard_of(code: str, shards: int) -> int:
+    """ The worker that owns the room with the code. Stable across processes. """
+    return zlib.crc32(code.encode()) % shards
+
+
+class ShardRouter:
+    def __init__(
+        self,
+        *,
+        worker_ports: List[int],
+        worker_host: str = "127.0.0.1",
+        connect_timeout: float = 30.0,
+    ):
+        """
+        TCP proxy in front of the workers of a sharded deployment
+        (see `run_sharded`).
+
+        The router reads the head of a connection's first request.
+        If the query string has a room `code`, e.g. `/rooms/events?code=ABCDE`,
+        the connection goes to the worker that owns the room (`shard_of`).
+        Otherwise it goes to the next worker in turn. Afterwards the router
+        only copies bytes, so a websocket stays on its room's worker.
+
+        Only the first request is routed, so a connection carries one request:
+        requests other than websocket upgrades are sent on with
+        `Connection: close`, and a client's next request on a new connection
+        is routed again. Upgraded connections close when the websocket does.
+
+        While a worker restarts, connections meant for it wait up to
+        `connect_timeout` seconds for it to come back rather than failing.
+        Clients of the restarted worker reconnect and land on it again.
+        """
+        self.worker_ports = worker_ports
+        self.worker_host = worker_host
+        self.connect_timeout = connect_timeout
+        self._next = 0
+
+    def choose(self, head: bytes) -> int:
+        """ The index of the worker for a request head """
+        try:
+            target = head.split(b"\r\n", 1)[0].split(b" ")[1].decode("latin-1")
+        except IndexError:
+            target = ""
+        codes = parse_qs(urlsplit(target).query).get("code")
+        if codes:
+            return shard_of(codes[0], len(self.worker_ports))
+        self._next = (self._next + 1) % len(self.worker_ports)
+        return self._next
+
+    @staticmethod
+    def single_request(head: bytes) -> bytes:
+        """ A request head, changed to close the connection after its response """
+        lines = head[: -len(b"\r\n\r\n")].split(b"\r\n")
+        headers = {}
+        for line in lines[1:]:
+            name, _, value = line.partition(b":")
+            headers[name.strip().lower()] = value.strip().lower()
+        if b"upgrade" in headers and b"upgrade" in headers.get(b"connection", b""):
+            return head
+        kept = [
+            line
+            for line in lines[1:]
+            if line.partition(b":")[0].strip().lower()
+            not in (b"connection", b"keep-alive")
+        ]
+        return b"\r\n".join([lines[0], *kept, b"Connection: close"]) + b"\r\n\r\n"
+
+    async def serve(self, host: str, port: int) -> None:
+        server = await asyncio.start_server(self._handle, host, port)
+        async with server:
+            await server.serve_forever()
+
+    async def _handle(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            writer.close()
+            return
+        worker = self.choose(head)
+        upstream = await self._connect(self.worker_ports[worker])
+        if upstream is None:
+            writer.write(b"HTTP/1.1 503 Service Unavailable\r\n\r\n")
+            writer.close()
+            return
+        upstream_reader, upstream_writer = upstream
+        upstream_writer.write(self.single_request(head))
+        await asyncio.gather(
+            self._pipe(reader, upstream_writer),
+            self._pipe(upstream_reader, writer),
+        )
+
+    async def _connect(self, port: int):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.connect_timeout
+        while True:
+            try:
+                return await asyncio.open_connection(
+                    self.worker_host, port, limit=_MAX_HEAD
+                )
+            except OSError:
+                # The worker is (re)starting
+                if loop.time() >= deadline:
+                    logger.warning("Worker on port %s is unavailable", port)
+                    return None
+                await asyncio.sleep(0.1)
+
+    @staticmethod
+    async def _pipe(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                data = await reader.read(_MAX_HEAD)
+                if not data:
+                    break
+                writer.write(data)
+                await writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+
+async def _run_worker(shard: int, shards: int, port: int) -> None:
+    # Restarts the worker whenever it exits
+    env = {**os.environ, "SHARD": str(shard), "SHARDS": str(shards)}
+    while True:
+        process = await asyncio.create_subprocess_exec(
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "app.main:app",
+            "--host",
+            "127.0.0.1",
+            "--port",
+            str(port),
+            env=env,
+        )
+        try:
+            returncode = await process.wait()
+        except asyncio.CancelledError:
+            process.terminate()
+            await process.wait()
+            raise
+        logger.warning("Worker %s exited with %s; restarting", shard, returncode)
+        await asyncio.sleep(1)
+
+
+async def run_sharded(
+    *, host: str, port: int, workers: int, worker_port: Optional[int] = None
+) -> None:
+    """
+    Runs `workers` uvicorn processes, each owning the rooms of one shard,
+    behind a ShardRouter listening on `host`:`port`.
+    Workers listen on localhost, on the ports after `worker_port`
+    (by default, the ports after `port`).
+    """
+    first = (worker_port or port) + 1
+    worker_ports = [first + shard for shard in range(workers)]
+    tasks = [
+        asyncio.create_task(_run_worker(shard, workers, worker_ports[shard]))
+        for shard in range(workers)
+    ]
+    router = ShardRouter(worker_ports=worker_ports)
+    try:
+        await router.serve(host, port)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
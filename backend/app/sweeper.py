@@ -0,0 +1,120 @@
+__all__ = ["RoomSweeper", "sweeper"]
+
+import logging
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+from sqlalchemy.orm import Session
+
+from app import crud
+from app.core import settings
+from app.database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+
+class RoomSweeper:
+    def __init__(
+        self,
+        *,
+        idle_seconds: int,
+        interval: float,
+        batch_size: int,
+        session_factory: Callable[[], Session] = SessionLocal,
+    ):
+        """
+        Background thread that closes rooms nobody has used for a while,
+        keeping the set of active rooms (and the indexes over it) small.
+
+        **Parameters**
+
+        * `idle_seconds`: How long a room must go unused before it's closed.
+        * `interval`: Seconds between sweeps.
+        * `batch_size`: Rooms closed per transaction. Each batch commits
+            on its own, so row locks are held briefly.
+        * `session_factory`: Makes the sweeper's database sessions.
+
+        Every worker may run a sweeper; batches skip rows another sweeper
+        has locked.
+        """
+        self.idle_seconds = idle_seconds
+        self.interval = interval
+        self.batch_size = batch_size
+        self.session_factory = session_factory
+        self.runs = 0
+        self.swept = 0
+        self.last_swept = 0
+        self.last_duration = 0.0
+        self.max_duration = 0.0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self.interval <= 0 or self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="room-sweeper", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def run_once(self) -> int:
+        """ Sweeps until no idle rooms are left. Returns the number of rooms closed. """
+        start = time.perf_counter()
+        swept = 0
+        with self.session_factory() as db:
+            # Joins served from the cache count as activity too
+            crud.room.flush_activity(db)
+            while not self._stop.is_set():
+                closed = crud.room.deactivate_idle(
+                    db, idle_seconds=self.idle_seconds, limit=self.batch_size
+                )
+                swept += closed
+                if closed < self.batch_size:
+                    break
+            # Sessions closed without their responses being rolled up
+            crud.quiz_rollup.add_closed_sessions(db, limit=self.batch_size)
+        duration = time.perf_counter() - start
+        self.runs += 1
+        self.swept += swept
+        self.last_swept = swept
+        self.last_duration = duration
+        self.max_duration = max(self.max_duration, duration)
+        return swept
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "runs": self.runs,
+            "swept": self.swept,
+            "last_swept": self.last_swept,
+            "last_duration_seconds": self.last_duration,
+            "max_duration_seconds": self.max_duration,
+        }
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                swept = self.run_once()
+            except Exception:
+                # The next run tries again
+                logger.exception("Sweeping idle rooms failed")
+                continue
+            if swept:
+                logger.info(
+                    "Closed %s idle rooms in %.3fs", swept, self.last_duration
+                )
+
+
+sweeper = RoomSweeper(
+    idle_seconds=settings.ROOM_IDLE_SECONDS,
+    interval=settings.ROOM_SWEEP_INTERVAL_SECONDS,
+    batch_size=settings.ROOM_SWEEP_BATCH_SIZE,
+)
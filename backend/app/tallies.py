@@ -0,0 +1,252 @@
+__all__ = ["SessionTally", "TallyBoard", "tallies"]
+
+import asyncio
+import time
+from typing import Any, Dict, Hashable, Optional, Set, Tuple
+
+from fastapi import WebSocket
+from fastapi.concurrency import run_in_threadpool
+
+from app import crud
+from app.answer_key import AnswerKey, to_bucket
+from app.cache import LRUCache
+from app.core import settings
+from app.database import SessionLocal
+from app.hub import RoomHub
+from app.models import QuizSession
+from app.schemas import StudentAnswer
+
+# (choice, short-answer bucket, is_correct) of a student's latest answer
+_Answer = Tuple[Optional[int], Optional[str], Optional[bool]]
+# The bucket of short answers counted once a question has max_buckets buckets
+_OTHER = object()
+
+
+class _QuestionTally:
+    __slots__ = ("choices", "buckets", "other", "correct", "incorrect")
+
+    def __init__(self):
+        self.choices: Dict[int, int] = {}
+        self.buckets: Dict[str, int] = {}
+        # Short answers that didn't get a bucket
+        self.other = 0
+        self.correct = 0
+        self.incorrect = 0
+
+    def add(self, answer: _Answer, count: int) -> None:
+        choice, bucket, is_correct = answer
+        if choice is not None:
+            self._count(self.choices, choice, count)
+        if bucket is _OTHER:
+            self.other += count
+        elif bucket is not None:
+            self._count(self.buckets, bucket, count)
+        if is_correct:
+            self.correct += count
+        elif is_correct is not None:
+            self.incorrect += count
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "choices": self.choices,
+            "buckets": self.buckets,
+            "other": self.other,
+            "correct": self.correct,
+            "incorrect": self.incorrect,
+        }
+
+    @staticmethod
+    def _count(counts: Dict[Any, int], key: Any, count: int) -> None:
+        total = counts.get(key, 0) + count
+        if total:
+            counts[key] = total
+        else:
+            del counts[key]
+
+
+class SessionTally:
+    def __init__(self, max_buckets: int):
+        """
+        Per-question tallies of a quiz session's responses,
+        counting each student's latest answer to a question once.
+        """
+        self.max_buckets = max_buckets
+        self.seq = 0
+        self.last_active = time.monotonic()
+        self._questions: Dict[int, _QuestionTally] = {}
+        self._answers: Dict[Tuple[Hashable, int], _Answer] = {}
+        # Questions changed since the last tick
+        self._dirty: Set[int] = set()
+
+    def record(
+        self, student_id: Hashable, answer: StudentAnswer, is_correct: Optional[bool]
+    ) -> None:
+        self.last_active = time.monotonic()
+        key = (student_id, answer.question)
+        tally = self._questions.setdefault(answer.question, _QuestionTally())
+        bucket = None
+        if answer.text is not None:
+            bucket = to_bucket(answer.text)
+            if bucket not in tally.buckets and len(tally.buckets) >= self.max_buckets:
+                bucket = _OTHER
+        new = (answer.choice, bucket, is_correct)
+        old = self._answers.get(key)
+        if old == new:
+            return
+        if old is not None:
+            tally.add(old, -1)
+        tally.add(new, 1)
+        self._answers[key] = new
+        self._dirty.add(answer.question)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "type": "tallies",
+            "seq": self.seq,
+            "questions": {i: q.as_dict() for i, q in self._questions.items()},
+        }
+
+    def take_delta(self) -> Optional[Dict[str, Any]]:
+        """ The tallies of the questions changed since the last delta, if any """
+        if not self._dirty:
+            return None
+        self.seq += 1
+        questions = {i: self._questions[i].as_dict() for i in sorted(self._dirty)}
+        self._dirty.clear()
+        return {"type": "tally-delta", "seq": self.seq, "questions": questions}
+
+
+class TallyBoard:
+    def __init__(
+        self, *, tick: float, max_buckets: int, idle_seconds: float, queue_size: int
+    ):
+        """
+        Live tallies of the responses to active quiz sessions,
+        updated in memory as answers arrive instead of queried from the database.
+
+        Teachers watching a session get its tallies when they connect,
+        then, every `tick` seconds, a "tally-delta" with the tallies of the
+        questions that changed since the last one. However many answers
+        arrived, a teacher gets at most one message per tick.
+        `seq` increases by one with every delta; a teacher that sees a gap
+        should reconnect.
+
+        A session's tallies are loaded from its stored responses the first time
+        they're needed, e.g. after a restart. Tallies only count the answers
+        received by this process, so students and teachers of a session
+        must reach the same worker: the session websockets require the room's
+        `code`, which the router shards on (see sharding.py).
+        """
+        self.tick = tick
+        self.max_buckets = max_buckets
+        self.idle_seconds = idle_seconds
+        # Teachers' websockets, by session id
+        self.hub = RoomHub(queue_size=queue_size)
+        self._sessions: Dict[Hashable, SessionTally] = {}
+        self._loading: Dict[Hashable, asyncio.Future] = {}
+        self._keys: LRUCache = LRUCache(maxsize=settings.ANSWER_KEY_CACHE_SIZE)
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def record(
+        self, session: QuizSession, student_id: Hashable, answer: StudentAnswer
+    ) -> None:
+        tally = await self._tally(session)
+        key = await self._key(session.quiz_id, answer.version)
+        is_correct = key.grade(answer) if key is not None else None
+        tally.record(student_id, answer, is_correct)
+
+    async def watch(self, session: QuizSession, websocket: WebSocket):
+        """ Starts sending the session's tallies to an accepted websocket """
+        tally = await self._tally(session)
+        client = self.hub.join(session.id, websocket)
+        self.hub.send(client, tally.snapshot())
+        return client
+
+    async def leave(self, client) -> None:
+        await self.hub.leave(client)
+
+    def publish(self) -> None:
+        """ Sends every session's changes to its teachers """
+        now = time.monotonic()
+        for session_id, tally in list(self._sessions.items()):
+            delta = tally.take_delta()
+            if delta is not None:
+                self.hub.publish(session_id, delta)
+            elif (
+                now - tally.last_active > self.idle_seconds
+                and not self.hub.has_room(session_id)
+            ):
+                del self._sessions[session_id]
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.tick)
+            self.publish()
+
+    async def _tally(self, session: QuizSession) -> SessionTally:
+        tally = self._sessions.get(session.id)
+        if tally is not None:
+            return tally
+        loading = self._loading.get(session.id)
+        if loading is None:
+            loading = asyncio.ensure_future(self._load(session))
+            self._loading[session.id] = loading
+            loading.add_done_callback(lambda _: self._loading.pop(session.id, None))
+        return await asyncio.shield(loading)
+
+    async def _load(self, session: QuizSession) -> SessionTally:
+        def latest():
+            with SessionLocal() as db:
+                return crud.student_response.get_latest(db, quiz_session_id=session.id)
+
+        tally = SessionTally(self.max_buckets)
+        for row in await run_in_threadpool(latest):
+            answer = StudentAnswer(
+                question=row.question,
+                version=row.version,
+                choice=row.choice,
+                text=row.text,
+            )
+            key = await self._key(session.quiz_id, row.version)
+            is_correct = key.grade(answer) if key is not None else None
+            tally.record(row.student_id, answer, is_correct)
+        self._sessions[session.id] = tally
+        return tally
+
+    async def _key(self, quiz_id: Hashable, version: int) -> Optional[AnswerKey]:
+        cache_key = (quiz_id, version)
+        key = self._keys.get(cache_key)
+        if key is None:
+
+            def content():
+                with SessionLocal() as db:
+                    return crud.quiz.get_content(db, id=quiz_id, version=version)
+
+            found = await run_in_threadpool(content)
+            if found is None:
+                return None
+            key = AnswerKey(found)
+            self._keys.set(cache_key, key)
+        return key
+
+
+tallies = TallyBoard(
+    tick=settings.TALLY_TICK_MS / 1000,
+    max_buckets=settings.TALLY_MAX_BUCKETS,
+    idle_seconds=settings.TALLY_IDLE_SECONDS,
+    queue_size=settings.ROOM_HUB_QUEUE_SIZE,
+)
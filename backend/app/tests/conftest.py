@@ -4,11 +4,12 @@ from typing import Generator, Dict
 
 import pytest
 from fastapi.testclient import TestClient
+from sqlalchemy import event
 from sqlalchemy.orm import Session
 
 from app import main, crud, schemas
 from app.core import settings
-from app.database import SessionLocal
+from app.database import SessionLocal, engine
 
 
 ########################################################################################
@@ -32,6 +33,19 @@ def db() -> Generator:
     yield SessionLocal()
 
 
+@pytest.fixture
+def statements() -> Generator:
+    """ Records every SQL statement sent to the database during a test """
+    _statements = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        _statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    yield _statements
+    event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
 @pytest.fixture(scope="module")
 def client() -> Generator:
     app = main.init_app()
@@ -0,0 +1,121 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import Session
+
+from app import crud, schemas, security
+from app.models import Room
+from app.routes import quiz as quiz_routes
+from app.routes import user as user_routes
+from app.tests.conftest import random_string
+
+
+def _users(db: Session, count: int):
+    users_in = [
+        schemas.UserCreate(display_name="bulk", password=random_string())
+        for _ in range(count)
+    ]
+    return crud.user.create_many(db, objs_in=users_in)
+
+
+def test_objects_only_change_the_fields_they_set(db: Session):
+    first, second, third = _users(db, 3)
+    updated = crud.user.update_many(
+        db,
+        objs_in=[
+            {"id": first.id, "is_active": False},
+            schemas.UserUpdate(id=second.id, is_superuser=True),
+        ],
+    )
+    assert {user.id for user in updated} == {first.id, second.id}
+    first_now, second_now, third_now = (
+        crud.user.get(db, user.id) for user in (first, second, third)
+    )
+    assert (first_now.is_active, first_now.is_superuser) == (False, False)
+    assert (second_now.is_active, second_now.is_superuser) == (True, True)
+    assert first_now.hashed_password == first.hashed_password
+    # Objects outside the batch are left alone
+    assert (third_now.is_active, third_now.is_superuser) == (True, False)
+
+
+def test_bulk_password_changes_are_hashed(db: Session):
+    first, second = _users(db, 2)
+    updated = crud.user.update_many(
+        db,
+        objs_in=[
+            {"id": first.id, "password": "first password"},
+            {"id": second.id, "password": "second password"},
+        ],
+    )
+    hashes = {user.id: user.hashed_password for user in updated}
+    assert "first password" not in hashes.values()
+    assert security.verify_password("first password", hashes[first.id])
+    assert security.verify_password("second password", hashes[second.id])
+
+
+def test_bulk_updates_evict_cached_users(db: Session):
+    (user,) = _users(db, 1)
+    assert crud.user.get_principal(db, id=user.id, token="token").is_active
+    crud.user.update_many(db, objs_in=[{"id": user.id, "is_active": False}])
+    assert not crud.user.get_principal(db, id=user.id, token="token").is_active
+
+
+def test_bulk_room_updates_count_as_activity(db: Session):
+    (user,) = _users(db, 1)
+    rooms = crud.room.create_many(
+        db, objs_in=[schemas.RoomCreate(owner_id=user.id) for _ in range(2)]
+    )
+    ids = [room.id for room in rooms]
+    # Idle for an hour
+    db.execute(
+        update(Room)
+        .where(Room.id.in_(ids))
+        .values(last_active=func.now() - func.make_interval(0, 0, 0, 0, 1))
+    )
+    db.commit()
+    crud.room.update_many(db, objs_in=[{"id": id, "is_active": True} for id in ids])
+    idle = db.execute(
+        select(func.count())
+        .select_from(Room)
+        .where(
+            Room.id.in_(ids),
+            Room.last_active < func.now() - func.make_interval(0, 0, 0, 0, 0, 1),
+        )
+    ).scalar_one()
+    assert idle == 0
+
+
+def test_create_many_routes(db: Session):
+    users_in = [
+        schemas.UserCreate(display_name="roster", password=random_string())
+        for _ in range(3)
+    ]
+    admin = crud.user.update(db, id=_users(db, 1)[0].id, obj_in={"is_superuser": True})
+    # A loop of our own; asyncio.run would unset the TestClient's loop
+    loop = asyncio.new_event_loop()
+    try:
+        roster = loop.run_until_complete(
+            user_routes.create_users(db=db, users_in=users_in, current_user=admin)
+        )
+    finally:
+        loop.close()
+    numbers = [int(user.number) for user in roster]
+    assert numbers == list(range(numbers[0], numbers[0] + 3))
+    assert security.verify_password(users_in[0].password, roster[0].hashed_password)
+
+    quizzes_in = [
+        schemas.QuizCreate(
+            owner_id=admin.id, is_public=True, content={"t": random_string(), "q": []}
+        )
+        for _ in range(2)
+    ]
+    quizzes = quiz_routes.create_quizzes(quizzes=quizzes_in, db=db, current_user=admin)
+    assert [quiz.content["t"] for quiz in quizzes] == [
+        quiz_in.content.t for quiz_in in quizzes_in
+    ]
+    assert all(quiz.version == 1 for quiz in quizzes)
+    # Every quiz must belong to the caller
+    with pytest.raises(HTTPException):
+        quiz_routes.create_quizzes(quizzes=quizzes_in, db=db, current_user=roster[0])
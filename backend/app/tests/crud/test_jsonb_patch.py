@@ -0,0 +1,96 @@
+import jsonpatch
+import pytest
+from sqlalchemy import cast, select
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.orm import Session
+
+from app import crud, schemas
+from app.exceptions import Http422InvalidQuizContent
+from app.tests.conftest import random_string
+
+CONTENT = {
+    "t": "Patches",
+    "q": [
+        {"type": "short-answer", "query": "One?", "answers": ["1"]},
+        {"type": "short-answer", "query": "Two?", "answers": ["2", "two"]},
+    ],
+}
+QUESTION = {"type": "short-answer", "query": "New?", "answers": ["new"]}
+
+
+def _postgres(db: Session, patch):
+    # Typed like the column it normally patches
+    content = crud._jsonb_patch(cast(crud._jsonb(CONTENT), JSONB), patch)
+    assert content is not None
+    return db.execute(select(content)).scalar_one()
+
+
+@pytest.mark.parametrize(
+    "patch",
+    [
+        [{"op": "replace", "path": "/t", "value": "Renamed"}],
+        [{"op": "replace", "path": "/q/1/answers/0", "value": "deux"}],
+        [{"op": "add", "path": "/q/0", "value": QUESTION}],
+        [{"op": "add", "path": "/q/2", "value": QUESTION}],
+        [{"op": "add", "path": "/q/-", "value": QUESTION}],
+        [{"op": "add", "path": "/q/1/answers/2", "value": "zwei"}],
+        [{"op": "add", "path": "/q/0/max_edits", "value": 1}],
+        [{"op": "add", "path": "/q/1/answers/-", "value": "deux"}],
+        [{"op": "replace", "path": "/q/1", "value": QUESTION}],
+        [{"op": "remove", "path": "/q/0"}],
+        [{"op": "remove", "path": "/q/1/answers/1"}],
+        [
+            {"op": "remove", "path": "/q/0"},
+            {"op": "add", "path": "/q/1", "value": QUESTION},
+            {"op": "replace", "path": "/q/0/query", "value": "Still two?"},
+        ],
+    ],
+)
+def test_postgres_patches_like_jsonpatch(db: Session, patch):
+    assert _postgres(db, patch) == jsonpatch.apply_patch(CONTENT, patch)
+
+
+@pytest.mark.parametrize(
+    "patch",
+    [
+        [{"op": "add", "path": "/q/3", "value": QUESTION}],
+        [{"op": "add", "path": "/q/1/answers/5", "value": "cinq"}],
+        # In range only until the question before it is removed
+        [
+            {"op": "remove", "path": "/q/0"},
+            {"op": "add", "path": "/q/2", "value": QUESTION},
+        ],
+        # Postgres counts from the end, and reads "01" as 1
+        [{"op": "remove", "path": "/q/-1"}],
+        [{"op": "replace", "path": "/q/01/query", "value": "One?"}],
+        [{"op": "add", "path": "/q/-1/answers/0", "value": "un"}],
+        [{"op": "replace", "path": "/q/-", "value": QUESTION}],
+        # Paths that don't exist
+        [{"op": "remove", "path": "/q/2"}],
+        [{"op": "replace", "path": "/q/0/hint", "value": "One"}],
+        [{"op": "remove", "path": "/q/0/answers/first"}],
+        [{"op": "add", "path": "/q/0/answers/first", "value": "un"}],
+        [{"op": "add", "path": "/x/t", "value": "Title"}],
+        [
+            {"op": "replace", "path": "/t", "value": "Renamed"},
+            {"op": "remove", "path": "/q/5"},
+        ],
+    ],
+)
+def test_patches_jsonpatch_rejects_are_rejected(db: Session, patch):
+    with pytest.raises(
+        (jsonpatch.JsonPatchException, jsonpatch.JsonPointerException)
+    ):
+        jsonpatch.apply_patch(CONTENT, patch)
+    # Either left to jsonpatch, or Postgres leaves no document
+    content = crud._jsonb_patch(cast(crud._jsonb(CONTENT), JSONB), patch)
+    assert content is None or db.execute(select(content)).scalar_one() is None
+
+    user_in = schemas.UserCreate(display_name="patcher", password=random_string())
+    owner = crud.user.create(db, obj_in=user_in)
+    content = {**CONTENT, "t": random_string()}
+    quiz_in = schemas.QuizCreate(owner_id=owner.id, is_public=True, content=content)
+    quiz = crud.quiz.create(db, obj_in=quiz_in)
+    with pytest.raises(Http422InvalidQuizContent):
+        crud.quiz.update(db, id=quiz.id, obj_in={"patch_content": patch})
+    assert crud.quiz.get(db, quiz.id).version == 1
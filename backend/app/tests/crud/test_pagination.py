@@ -0,0 +1,40 @@
+import pytest
+from sqlalchemy.orm import Session
+
+from app import crud, schemas
+from app.exceptions import Http400InvalidCursor
+from app.tests.conftest import random_string
+
+
+def test_pages_follow_the_stream_order(db: Session):
+    user_in = schemas.UserCreate(display_name="paginator", password=random_string())
+    owner = crud.user.create(db, obj_in=user_in)
+    # Created in one statement, so every quiz has the same ts and pages
+    #  are told apart by id
+    quizzes = crud.quiz.create_many(
+        db,
+        objs_in=[
+            schemas.QuizCreate(
+                owner_id=owner.id,
+                is_public=True,
+                content={"t": random_string(), "q": []},
+            )
+            for _ in range(5)
+        ],
+    )
+    streamed = [quiz.id for quiz in crud.quiz.stream(db, owner_id=owner.id)]
+    assert sorted(streamed) == sorted(quiz.id for quiz in quizzes)
+
+    paged, cursor = [], None
+    for _ in range(3):
+        page, cursor = crud.quiz.get_multi(
+            db, cursor=cursor, limit=2, owner_id=owner.id
+        )
+        paged += [quiz.id for quiz in page]
+    assert paged == streamed
+    assert cursor is None
+
+
+def test_invalid_cursors_are_rejected(db: Session):
+    with pytest.raises(Http400InvalidCursor):
+        crud.quiz.get_multi(db, cursor="not a cursor")
@@ -0,0 +1,121 @@
+import jsonpatch
+import pytest
+from sqlalchemy.orm import Session
+
+from app import crud, schemas
+from app.exceptions import Http422InvalidQuizContent
+from app.tests.conftest import random_string
+
+
+def _question(name: str):
+    answers = [{"text": text, "is_correct": text == "a"} for text in "abc"]
+    return {"type": "multiple-choice", "query": name, "answers": answers}
+
+
+# Version 2 on. Questions are A, B, C and D at version 1.
+PATCHES = [
+    # 2: B's answers are reordered
+    [{"op": "move", "from": "/q/1/answers/0", "path": "/q/1/answers/2"}],
+    # 3: A is copied to the end
+    [{"op": "copy", "from": "/q/0", "path": "/q/4"}],
+    # 4: One of D's answers is removed
+    [{"op": "remove", "path": "/q/3/answers/0"}],
+    # 5: A moves after C
+    [{"op": "move", "from": "/q/0", "path": "/q/2"}],
+    # 6: C is removed
+    [{"op": "remove", "path": "/q/1"}],
+    # 7: B's query is copied into A
+    [{"op": "copy", "from": "/q/0/query", "path": "/q/1/query"}],
+]
+
+
+@pytest.fixture(scope="module")
+def history(db: Session):
+    user_in = schemas.UserCreate(display_name="editor", password=random_string())
+    owner = crud.user.create(db, obj_in=user_in)
+    content = {"t": random_string(), "q": [_question(name) for name in "ABCD"]}
+    quiz_in = schemas.QuizCreate(owner_id=owner.id, is_public=True, content=content)
+    quiz = crud.quiz.create(db, obj_in=quiz_in)
+    contents = {1: content}
+    for version, patch in enumerate(PATCHES, start=2):
+        updated = crud.quiz.update(db, id=quiz.id, obj_in={"patch_content": patch})
+        assert updated.version == version
+        contents[version] = jsonpatch.apply_patch(contents[version - 1], patch)
+    return quiz, contents
+
+
+def test_get_content_replays_every_version(db: Session, history):
+    quiz, contents = history
+    for version, content in contents.items():
+        assert crud.quiz.get_content(db, id=quiz.id, version=version) == content
+
+
+def test_changed_since_marks_only_the_edited_questions(db: Session, history):
+    quiz, _ = history
+    # Now B, A, D and the copy of A. D changed at 4, the copy was added at 3
+    # and A was edited at 7; moving and removing questions changes nothing.
+    assert crud.quiz.changed_since(db, id=quiz.id, version=4) == [1]
+    assert crud.quiz.changed_since(db, id=quiz.id, version=2) == [1, 2, 3]
+    assert crud.quiz.changed_since(db, id=quiz.id, version=7) == []
+
+
+def test_question_epochs_follow_questions(db: Session, history):
+    quiz, contents = history
+    versions = set(contents)
+    epochs = crud.quiz.question_epochs(db, id=quiz.id, versions=versions)
+    assert epochs[2] == [(1, 0), (2, 1), (1, 2), (1, 3)]
+    assert epochs[5] == [(2, 1), (1, 2), (1, 0), (4, 3), (3, 4)]
+    assert epochs[7] == [(2, 1), (7, 1), (4, 3), (3, 4)]
+    # A question with the same epoch in two versions is the same question
+    for version, questions in epochs.items():
+        assert len(questions) == len(contents[version]["q"])
+        for other, other_questions in epochs.items():
+            for i, epoch in enumerate(questions):
+                if epoch in other_questions:
+                    j = other_questions.index(epoch)
+                    assert contents[version]["q"][i] == contents[other]["q"][j]
+
+
+def test_every_stored_version_replays_to_what_was_live(db: Session):
+    user_in = schemas.UserCreate(display_name="editor", password=random_string())
+    owner = crud.user.create(db, obj_in=user_in)
+    content = {"t": random_string(), "q": [_question(name) for name in "ABC"]}
+    quiz_in = schemas.QuizCreate(owner_id=owner.id, is_public=True, content=content)
+    quiz = crud.quiz.create(db, obj_in=quiz_in)
+    live = {quiz.version: quiz.content}
+    for patch in [
+        # Rejected, so never logged
+        [{"op": "remove", "path": "/q/-1"}],
+        [{"op": "replace", "path": "/q/01/query", "value": "X"}],
+        [{"op": "remove", "path": "/q/3"}],
+        [{"op": "remove", "path": "/q/0/answers/5"}],
+        # Applied by Postgres
+        [{"op": "replace", "path": "/t", "value": random_string()}],
+        [{"op": "replace", "path": "/q/1/query", "value": "X"}],
+        [{"op": "remove", "path": "/q/2"}],
+        [{"op": "add", "path": "/q/-", "value": _question("D")}],
+        [{"op": "add", "path": "/q/0/answers/0", "value": {"text": "z"}}],
+        # Applied in Python
+        [{"op": "move", "from": "/q/0", "path": "/q/2"}],
+    ]:
+        try:
+            quiz = crud.quiz.update(db, id=quiz.id, obj_in={"patch_content": patch})
+        except Http422InvalidQuizContent:
+            continue
+        live[quiz.version] = quiz.content
+    assert len(live) == 7
+
+    for version, content in live.items():
+        assert crud.quiz.get_content(db, id=quiz.id, version=version) == content
+    epochs = crud.quiz.question_epochs(db, id=quiz.id, versions=set(live))
+    for version, content in live.items():
+        assert len(epochs[version]) == len(content["q"])
+
+
+def test_a_patch_log_that_doesnt_apply_fails():
+    content = {"t": "Quiz", "q": [_question("A")]}
+    broken = [[{"op": "remove", "path": "/q/1"}]]
+    with pytest.raises(jsonpatch.JsonPatchException):
+        crud._replay(content, broken)
+    with pytest.raises(ValueError):
+        crud._question_epochs(1, broken, {2})
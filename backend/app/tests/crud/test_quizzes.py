@@ -0,0 +1,111 @@
+import json
+
+import pytest
+from sqlalchemy.orm import Session
+
+from app import crud, schemas
+from app.exceptions import (
+    Http403QuizNameConflict,
+    Http404QuizNotFound,
+    Http412QuizVersionConflict,
+    Http422InvalidQuizContent,
+)
+from app.routes import quiz as quiz_routes
+from app.tests.conftest import random_string
+
+
+@pytest.fixture(scope="module")
+def owner(db: Session):
+    user_in = schemas.UserCreate(display_name="quiz_owner", password=random_string())
+    return crud.user.create(db, obj_in=user_in)
+
+
+def _quiz(db: Session, owner, title=None, questions=()):
+    content = {"t": title or random_string(), "q": list(questions)}
+    quiz_in = schemas.QuizCreate(owner_id=owner.id, is_public=True, content=content)
+    return crud.quiz.create(db, obj_in=quiz_in)
+
+
+def test_titles_are_unique_per_owner(db: Session, owner):
+    first = _quiz(db, owner)
+    with pytest.raises(Http403QuizNameConflict):
+        _quiz(db, owner, title=first.content["t"])
+
+    second = _quiz(db, owner)
+    rename = [{"op": "replace", "path": "/t", "value": first.content["t"]}]
+    with pytest.raises(Http403QuizNameConflict):
+        crud.quiz.update(db, id=second.id, obj_in={"patch_content": rename})
+    with pytest.raises(Http403QuizNameConflict):
+        crud.quiz.update_many(db, objs_in=[{"id": second.id, "patch_content": rename}])
+    # Nothing was written
+    assert crud.quiz.get(db, second.id).version == 1
+
+    # Another owner may use the title
+    user_in = schemas.UserCreate(display_name="quiz_owner", password=random_string())
+    _quiz(db, crud.user.create(db, obj_in=user_in), title=first.content["t"])
+
+
+@pytest.mark.parametrize(
+    "patch",
+    [
+        # Applied by Postgres
+        [{"op": "remove", "path": "/q/0/query"}],
+        # Applied in Python
+        [{"op": "move", "from": "/q/0/query", "path": "/t"}],
+        # Doesn't apply
+        [{"op": "move", "from": "/q/5", "path": "/q/0"}],
+    ],
+)
+def test_patches_leaving_invalid_content_are_rejected(db: Session, owner, patch):
+    question = {"type": "short-answer", "query": "Why?", "answers": ["because"]}
+    quiz = _quiz(db, owner, questions=[question])
+    with pytest.raises(Http422InvalidQuizContent):
+        crud.quiz.update(db, id=quiz.id, obj_in={"patch_content": patch})
+    with pytest.raises(Http422InvalidQuizContent):
+        crud.quiz.update_many(db, objs_in=[{"id": quiz.id, "patch_content": patch}])
+    # Nothing was written, and students can still load the quiz
+    assert crud.quiz.get(db, quiz.id).version == 1
+    assert crud.quiz.get_for_student(db, id=quiz.id) is not None
+
+
+@pytest.mark.parametrize(
+    "patch",
+    [
+        # Applied by Postgres
+        [{"op": "replace", "path": "/t", "value": random_string()}],
+        # Applied in Python
+        [{"op": "copy", "from": "/t", "path": "/q/0/query"}],
+    ],
+)
+def test_edits_to_a_stale_version_are_rejected(db: Session, owner, patch):
+    question = {"type": "short-answer", "query": "Why?", "answers": ["because"]}
+    quiz = _quiz(db, owner, questions=[question])
+    edit = {"patch_content": patch}
+    assert crud.quiz.update(db, id=quiz.id, obj_in=edit, version=1).version == 2
+    # Another editor's copy is still at version 1
+    assert crud.quiz.update(db, id=quiz.id, obj_in=edit, version=1) is None
+    assert crud.quiz.get(db, quiz.id).version == 2
+
+
+def test_if_match_is_checked_against_the_version(db: Session, owner):
+    quiz = _quiz(db, owner)
+    rename = json.dumps([{"op": "replace", "path": "/t", "value": random_string()}])
+    quiz_in = schemas.QuizUpdate(id=quiz.id, patch_content=rename)
+
+    def patch(if_match, user=owner):
+        return quiz_routes.patch_quiz(
+            quiz=quiz_in, if_match=if_match, db=db, current_user=user
+        )
+
+    response = patch('"1"')
+    assert response.headers["ETag"] == '"2"'
+    with pytest.raises(Http412QuizVersionConflict):
+        patch('"1"')
+    with pytest.raises(Http412QuizVersionConflict):
+        patch('W/"2"')
+    assert patch("*").headers["ETag"] == '"3"'
+
+    # Someone else's quiz isn't told apart from a missing one
+    user_in = schemas.UserCreate(display_name="quiz_owner", password=random_string())
+    with pytest.raises(Http404QuizNotFound):
+        patch('"1"', user=crud.user.create(db, obj_in=user_in))
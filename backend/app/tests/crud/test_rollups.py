@@ -0,0 +1,81 @@
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from app import crud, schemas
+from app.models import StudentResponse
+from app.tests.conftest import random_string
+
+MULTIPLE_CHOICE = {
+    "type": "multiple-choice",
+    "query": "Which?",
+    "answers": [{"text": "a", "is_correct": False}, {"text": "b", "is_correct": True}],
+}
+SHORT_ANSWER = {"type": "short-answer", "query": "What?", "answers": ["blue"]}
+
+
+def _session(db: Session, owner, quiz):
+    room = crud.room.create(db, obj_in=schemas.RoomCreate(owner_id=owner.id))
+    return crud.quiz_session.create(
+        db, obj_in=schemas.QuizSessionCreate(room_id=room.id, quiz_id=quiz.id)
+    )
+
+
+def _respond(db: Session, session, student, version, answers):
+    rows = [
+        {
+            "quiz_session_id": session.id,
+            "student_id": student.id,
+            "question": question,
+            "version": version,
+            "choice": answer.get("choice"),
+            "text": answer.get("text"),
+        }
+        for question, answer in answers
+    ]
+    db.execute(insert(StudentResponse), rows)
+    db.commit()
+
+
+def _close(db: Session, session):
+    session_in = schemas.QuizSessionUpdate(id=session.id, is_active=False)
+    crud.quiz_session.update(db, id=session.id, obj_in=session_in)
+
+
+def test_rollups_split_edited_questions(db: Session):
+    user_in = schemas.UserCreate(display_name="teacher", password=random_string())
+    owner = crud.user.create(db, obj_in=user_in)
+    content = {"t": random_string(), "q": [MULTIPLE_CHOICE, SHORT_ANSWER]}
+    quiz_in = schemas.QuizCreate(owner_id=owner.id, is_public=True, content=content)
+    quiz = crud.quiz.create(db, obj_in=quiz_in)
+
+    first = _session(db, owner, quiz)
+    _respond(db, first, owner, 1, [(0, {"choice": 1}), (1, {"text": " Blue"})])
+    _close(db, first)
+
+    # Version 2 edits the short answer, version 3 adds a question in front
+    edit = [{"op": "replace", "path": "/q/1/answers", "value": ["red"]}]
+    crud.quiz.update(db, id=quiz.id, obj_in={"patch_content": edit})
+    add = [{"op": "add", "path": "/q/0", "value": SHORT_ANSWER}]
+    crud.quiz.update(db, id=quiz.id, obj_in={"patch_content": add})
+
+    second = _session(db, owner, quiz)
+    answers = [(0, {"text": "blue"}), (1, {"choice": 0}), (2, {"text": "blue"})]
+    _respond(db, second, owner, 3, answers)
+    _close(db, second)
+    # Sessions are only added once
+    assert not crud.quiz_rollup.add_session(db, quiz_session_id=second.id)
+
+    rollups = {
+        (r.version, r.question): schemas.QuestionRollup.from_orm(r)
+        for r in crud.quiz_rollup.get_all_time(db, quiz_id=quiz.id)
+    }
+    assert set(rollups) == {(1, 0), (1, 1), (2, 1), (3, 0)}
+    # The unchanged question is counted across both sessions
+    assert rollups[1, 0].responses == 2
+    assert rollups[1, 0].choices == {0: 1, 1: 1}
+    assert (rollups[1, 0].correct, rollups[1, 0].incorrect) == (1, 1)
+    assert rollups[1, 1].buckets == {"blue": 1}
+    assert rollups[1, 1].correct == 1
+    # "blue" was no longer correct after the edit
+    assert rollups[2, 1].incorrect == 1
+    assert rollups[3, 0].correct == 1
@@ -0,0 +1,62 @@
+import pytest
+from sqlalchemy.orm import Session
+
+from app import crud, schemas
+from app.exceptions import Http404ActiveRoomNotFound
+from app.tests.conftest import random_string
+
+
+@pytest.fixture(scope="module")
+def owner(db: Session):
+    user_in = schemas.UserCreate(display_name="room_owner", password=random_string())
+    return crud.user.create(db, obj_in=user_in)
+
+
+@pytest.fixture(scope="module")
+def quiz(db: Session, owner):
+    content = {"t": random_string(), "q": []}
+    quiz_in = schemas.QuizCreate(owner_id=owner.id, is_public=True, content=content)
+    return crud.quiz.create(db, obj_in=quiz_in)
+
+
+def _session(db: Session, room, quiz):
+    quiz_session_in = schemas.QuizSessionCreate(room_id=room.id, quiz_id=quiz.id)
+    return crud.quiz_session.create(db, obj_in=quiz_session_in)
+
+
+def test_joins_are_served_from_memory(db: Session, owner, quiz, statements):
+    room = crud.room.create(db, obj_in=schemas.RoomCreate(owner_id=owner.id))
+    quiz_session = _session(db, room, quiz)
+    statements.clear()
+    crud.room.get_by_code(db, code=room.code)
+    # The room and its sessions in one query
+    assert len(statements) == 1
+
+    statements.clear()
+    for _ in range(10):
+        joined = crud.room.get_by_code(db, code=room.code)
+        assert [s.id for s in joined.session] == [quiz_session.id]
+    assert statements == []
+    # Every join gets its own instance
+    assert crud.room.get_by_code(db, code=room.code) is not joined
+
+    # Joins are recorded in one UPDATE
+    assert crud.room.flush_activity(db) >= 1
+    assert crud.room.flush_activity(db) == 0
+
+
+def test_cached_rooms_follow_writes(db: Session, owner, quiz):
+    room = crud.room.create(db, obj_in=schemas.RoomCreate(owner_id=owner.id))
+    assert crud.room.get_by_code(db, code=room.code).session == []
+
+    # A new session is seen by the next join
+    quiz_session = _session(db, room, quiz)
+    joined = crud.room.get_by_code(db, code=room.code)
+    assert [s.id for s in joined.session] == [quiz_session.id]
+    crud.quiz_session.update(db, id=quiz_session.id, obj_in={"is_active": False})
+    assert crud.room.get_by_code(db, code=room.code).session[0].is_active is False
+
+    # Closed rooms can't be joined
+    crud.room.update(db, id=room.id, obj_in={"is_active": False})
+    with pytest.raises(Http404ActiveRoomNotFound):
+        crud.room.get_by_code(db, code=room.code)
@@ -0,0 +1,97 @@
+import json
+import uuid
+
+import jsonpatch
+import pytest
+
+from app import crud
+from app.models import Quiz
+
+CONTENT = {
+    "t": "Events",
+    "q": [
+        {
+            "type": "multiple-choice",
+            "query": "Which?",
+            "answers": [
+                {"text": "a", "is_correct": False},
+                {"text": "b", "is_correct": True},
+            ],
+        },
+        {"type": "short-answer", "query": "What?", "answers": ["hidden 1"]},
+    ],
+}
+NEW_QUESTION = {"type": "short-answer", "query": "Who?", "answers": ["hidden 2"]}
+
+
+def _apply(document, patch):
+    # How clients apply events: operations that don't apply are skipped
+    for operation in patch:
+        try:
+            document = jsonpatch.apply_patch(document, [operation])
+        except (jsonpatch.JsonPatchException, jsonpatch.JsonPointerException):
+            pass
+    return document
+
+
+def _view(content, version):
+    quiz = Quiz(id=uuid.UUID(int=1), version=version, content=content)
+    return json.loads(crud._student_view(quiz))
+
+
+@pytest.mark.parametrize(
+    "patch",
+    [
+        [{"op": "replace", "path": "/q/0/query", "value": "Which one?"}],
+        [{"op": "replace", "path": "/q/1/answers/0", "value": "hidden 3"}],
+        [{"op": "add", "path": "/q/1/answers/-", "value": "hidden 4"}],
+        [{"op": "add", "path": "/q/0/answers/-", "value": {"text": "c"}}],
+        [{"op": "add", "path": "/q/0", "value": NEW_QUESTION}],
+        [{"op": "move", "from": "/q/0", "path": "/q/1"}],
+        [{"op": "remove", "path": "/q/0/answers/0"}],
+        [{"op": "replace", "path": "/t", "value": "Renamed"}],
+        [
+            {"op": "test", "path": "/q/1/answers/0", "value": "hidden 1"},
+            {"op": "replace", "path": "/q/0/answers/1/is_correct", "value": False},
+            {"op": "replace", "path": "/q/0/answers/0/is_correct", "value": True},
+            {"op": "add", "path": "/q/-", "value": NEW_QUESTION},
+        ],
+        [{"op": "replace", "path": "", "value": {"t": "New", "q": [NEW_QUESTION]}}],
+    ],
+)
+def test_patched_event_turns_the_old_view_into_the_new(patch):
+    content = jsonpatch.apply_patch(CONTENT, patch)
+    quiz = Quiz(id=uuid.UUID(int=1), version=2, content=content)
+    event = crud.quiz.student_event(quiz, patch_content=patch)
+
+    assert event["type"] == "quiz-patched"
+    assert event["version"] == 2
+    assert _apply(_view(CONTENT, 1), event["patch"]) == _view(content, 2)
+    # Nothing students can't see is sent
+    sent = json.dumps(event)
+    assert "is_correct" not in sent
+    assert "hidden" not in sent
+
+
+@pytest.mark.parametrize(
+    "patch",
+    [
+        # Copying a hidden value somewhere visible
+        [{"op": "copy", "from": "/q/1/answers/0", "path": "/q/0/query"}],
+        # Short-answer to multiple-choice: students have no answers to replace
+        [
+            {"op": "replace", "path": "/q/1/type", "value": "multiple-choice"},
+            {"op": "replace", "path": "/q/1/answers", "value": [{"text": "c"}]},
+        ],
+        # Multiple-choice to short-answer: students' choices would linger
+        [
+            {"op": "replace", "path": "/q/0/type", "value": "short-answer"},
+            {"op": "replace", "path": "/q/0/answers", "value": ["hidden 3"]},
+        ],
+    ],
+)
+def test_patches_that_cant_be_redacted_ask_for_a_resync(patch):
+    content = jsonpatch.apply_patch(CONTENT, patch)
+    quiz = Quiz(id=uuid.UUID(int=1), version=2, content=content)
+    event = crud.quiz.student_event(quiz, patch_content=patch)
+    assert event == {"type": "quiz-resync", "quiz_id": str(quiz.id), "version": 2}
@@ -0,0 +1,142 @@
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from app import cache, crud, schemas
+from app.cache import LRUCache
+from app.database import SessionLocal
+from app.exceptions import Http404UserNotFound
+from app.models import User
+from app.tests.conftest import random_string
+
+
+def _user(db: Session, display_name: str = "user"):
+    user_in = schemas.UserCreate(display_name=display_name, password=random_string())
+    return crud.user.create(db, obj_in=user_in)
+
+
+def test_removed_users_lose_their_cached_principals(db: Session):
+    for remove in (
+        lambda user: crud.user.remove(db, id=user.id),
+        lambda user: crud.user.remove_many(db, ids=[user.id]),
+    ):
+        user = _user(db)
+        assert crud.user.get_principal(db, id=user.id, token="token") is not None
+        remove(user)
+        assert crud.user.get_principal(db, id=user.id, token="token") is None
+
+
+def test_concurrent_sign_ups_with_one_name_get_distinct_numbers():
+    name = random_string()[:12]
+
+    def sign_up(_):
+        with SessionLocal() as db:
+            return int(_user(db, name).number)
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        numbers = sorted(pool.map(sign_up, range(16)))
+    assert numbers == list(range(numbers[0], numbers[0] + 16))
+
+
+def test_numbers_are_consecutive_per_name_and_never_reused(db: Session):
+    name = random_string()[:12]
+    first = _user(db, name)
+    users_in = [
+        schemas.UserCreate(display_name=display_name, password=random_string())
+        for display_name in (name.upper(), "other" + name, name.lower())
+    ]
+    upper, other, lower = crud.user.create_many(db, objs_in=users_in)
+    # Names are compared by their identifier (see Security.to_identifier)
+    assert [int(upper.number), int(lower.number)] == [
+        int(first.number) + 1,
+        int(first.number) + 2,
+    ]
+    assert int(other.number) == 1
+
+    crud.user.remove(db, id=lower.id)
+    assert int(_user(db, name).number) == int(first.number) + 3
+
+
+def test_name_lookups_reload_the_cached_user(db: Session):
+    user = _user(db, random_string()[:12])
+    name = f"{user.display_name}#{user.number}"
+    assert crud.user.get_by_name(db, name=name).id == user.id
+    assert crud.user.names.get((user.identifier_name, user.number)) == user.id
+
+    # Another worker's writes don't invalidate this process's cache,
+    #  but the user is loaded fresh on every hit
+    db.execute(
+        update(User)
+        .where(User.id == user.id)
+        .values(hashed_password="changed", is_active=False)
+    )
+    db.commit()
+    found = crud.user.get_by_name(db, name=user.display_name, number=user.number)
+    assert (found.hashed_password, found.is_active) == ("changed", False)
+    db.execute(update(User).where(User.id == user.id).values(identifier_name="x"))
+    db.commit()
+    with pytest.raises(Http404UserNotFound):
+        crud.user.get_by_name(db, name=name)
+    with pytest.raises(Http404UserNotFound):
+        crud.user.get_by_name(db, name=f"{user.display_name}#x")
+
+
+@pytest.fixture
+def principals(monkeypatch: pytest.MonkeyPatch):
+    # A small cache of our own, with a clock the tests move
+    now = [0.0]
+    monkeypatch.setattr(cache, "time", SimpleNamespace(monotonic=lambda: now[0]))
+    principals = LRUCache(maxsize=2, ttl=60)
+    monkeypatch.setattr(crud.user, "principals", principals)
+    return principals, now
+
+
+def test_cached_principals_skip_the_database(db: Session, principals, statements):
+    principals, _ = principals
+    user = _user(db)
+    statements.clear()
+    crud.user.get_principal(db, id=user.id, token="token")
+    assert len(statements) == 1
+    statements.clear()
+    assert crud.user.get_principal(db, id=user.id, token="token").id == user.id
+    assert statements == []
+    assert (principals.hits, principals.misses) == (1, 1)
+    # Each token has its own entry
+    crud.user.get_principal(db, id=user.id, token="other")
+    assert principals.stats() == {"hits": 1, "misses": 2, "size": 2, "maxsize": 2}
+
+
+def test_cached_principals_expire(db: Session, principals):
+    principals, now = principals
+    user = _user(db)
+    assert crud.user.get_principal(db, id=user.id, token="token").is_active
+    # Another worker deactivates the user; this process only learns at expiry
+    db.execute(update(User).where(User.id == user.id).values(is_active=False))
+    db.commit()
+    now[0] += 59
+    assert crud.user.get_principal(db, id=user.id, token="token").is_active
+    now[0] += 2
+    assert not crud.user.get_principal(db, id=user.id, token="token").is_active
+    assert principals.misses == 2
+
+
+def test_principal_cache_keeps_the_recently_used(db: Session, principals):
+    principals, _ = principals
+    first, second, third = (_user(db) for _ in range(3))
+    for user in (first, second, first, third):
+        crud.user.get_principal(db, id=user.id, token="token")
+    assert len(principals) == 2
+    assert principals.get((first.id, "token")) is not None
+    assert principals.get((second.id, "token")) is None
+
+
+def test_updated_users_lose_their_cached_principals(db: Session, principals):
+    user = _user(db)
+    crud.user.get_principal(db, id=user.id, token="token")
+    crud.user.update(db, id=user.id, obj_in={"is_superuser": True})
+    assert crud.user.get_principal(db, id=user.id, token="token").is_superuser
+    crud.user.deactivate(db, id=user.id)
+    assert not crud.user.get_principal(db, id=user.id, token="token").is_active
@@ -0,0 +1,97 @@
+from typing import List
+
+import pytest
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from app import crud, schemas
+from app.exceptions import Http403RoomCodeConflict
+from app.models import Room
+from app.tests.conftest import random_string
+
+
+@pytest.fixture(scope="module")
+def owner(db: Session):
+    user_in = schemas.UserCreate(display_name="room_owner", password=random_string())
+    return crud.user.create(db, obj_in=user_in)
+
+
+def test_create_is_one_statement(db: Session, owner, statements: List[str]):
+    # The first create also loads the codes of the active rooms, once per process
+    crud.room.create(db, obj_in=schemas.RoomCreate(owner_id=owner.id))
+    statements.clear()
+    room = crud.room.create(db, obj_in=schemas.RoomCreate(owner_id=owner.id))
+    assert room.id and room.ts
+    assert len(statements) == 1
+    assert statements[0].lstrip().startswith("INSERT")
+
+
+def test_update_is_one_statement(db: Session, owner, statements: List[str]):
+    room = crud.room.create(db, obj_in=schemas.RoomCreate(owner_id=owner.id))
+    statements.clear()
+    room_in = schemas.RoomUpdate(id=room.id, is_active=False)
+    updated = crud.room.update(db, id=room.id, obj_in=room_in, owner_id=owner.id)
+    assert updated.is_active is False
+    assert updated.code == room.code
+    assert len(statements) == 1
+    assert statements[0].lstrip().startswith("UPDATE")
+    # Only the changed column is sent
+    assert "code" not in statements[0].split("WHERE")[0].split("SET")[1]
+
+
+def test_update_checks_where_clause(db: Session, owner, statements: List[str]):
+    room = crud.room.create(db, obj_in=schemas.RoomCreate(owner_id=owner.id))
+    statements.clear()
+    room_in = schemas.RoomUpdate(id=room.id, is_active=False)
+    # Someone other than the owner can't update the room
+    assert crud.room.update(db, id=room.id, obj_in=room_in, owner_id=room.id) is None
+    assert len(statements) == 1
+
+
+def test_codes_claimed_elsewhere_are_reallocated_once(
+    db: Session, owner, monkeypatch: pytest.MonkeyPatch
+):
+    # Another process's active room holds the code this process allocates next
+    taken = crud.room.create(db, obj_in=schemas.RoomCreate(owner_id=owner.id))
+    codes = iter([taken.code, "A" + random_string()[:8]])
+    monkeypatch.setattr(crud.room.codes, "allocate", lambda: next(codes))
+    room = crud.room.create(db, obj_in=schemas.RoomCreate(owner_id=owner.id))
+    assert room.code != taken.code
+
+    codes = iter([taken.code, "B" + random_string()[:8], "C" + random_string()[:8]])
+    rooms_in = [schemas.RoomCreate(owner_id=owner.id) for _ in range(2)]
+    rooms = crud.room.create_many(db, objs_in=rooms_in)
+    assert taken.code not in [room.code for room in rooms]
+
+    # Colliding again gives up instead of retrying
+    codes = iter([taken.code, taken.code])
+    with pytest.raises(Http403RoomCodeConflict):
+        crud.room.create(db, obj_in=schemas.RoomCreate(owner_id=owner.id))
+    with pytest.raises(Http403RoomCodeConflict):
+        crud.room.create(
+            db, obj_in=schemas.RoomCreate(owner_id=owner.id, code=taken.code)
+        )
+
+
+def test_collisions_release_codes_closed_elsewhere(
+    db: Session, owner, monkeypatch: pytest.MonkeyPatch
+):
+    taken, closed = crud.room.create_many(
+        db, objs_in=[schemas.RoomCreate(owner_id=owner.id) for _ in range(2)]
+    )
+    # Another process closes one room; this process never hears of it
+    db.execute(update(Room).where(Room.id == closed.id).values(is_active=False))
+    db.commit()
+    assert closed.code in crud.room.codes._claimed
+
+    allocate = crud.room.codes.allocate
+    codes = iter([taken.code])
+    monkeypatch.setattr(
+        crud.room.codes, "allocate", lambda: next(codes, None) or allocate()
+    )
+    room = crud.room.create(db, obj_in=schemas.RoomCreate(owner_id=owner.id))
+    assert room.code != taken.code
+    # The active codes were reloaded: the closed room's code cools down
+    assert {taken.code, room.code} <= crud.room.codes._claimed
+    assert closed.code not in crud.room.codes._claimed
+    assert closed.code in crud.room.codes._cooling_codes
@@ -0,0 +1,127 @@
+import asyncio
+import uuid
+from urllib.parse import urlencode
+
+from sqlalchemy.orm import Session
+
+from app import crud, main, schemas
+from app.core import security
+from app.database import engine
+from app.tests.conftest import random_string
+
+SOCKETS = 1000
+
+
+class _Connection:
+    """ Drives one websocket through the ASGI app, without a network """
+
+    def __init__(self, app, path: str, query: dict):
+        self.scope = {
+            "type": "websocket",
+            "path": path,
+            "raw_path": path.encode(),
+            "root_path": "",
+            "scheme": "ws",
+            "query_string": urlencode(query).encode(),
+            "headers": [],
+            "client": ("127.0.0.1", 0),
+            "server": ("testserver", 80),
+            "subprotocols": [],
+        }
+        self.incoming: asyncio.Queue = asyncio.Queue()
+        self.outgoing: asyncio.Queue = asyncio.Queue()
+        self.incoming.put_nowait({"type": "websocket.connect"})
+        self.task = asyncio.create_task(
+            app(self.scope, self.incoming.get, self.outgoing.put)
+        )
+
+    async def accepted(self) -> bool:
+        message = await self.outgoing.get()
+        return message["type"] == "websocket.accept"
+
+    async def disconnect(self) -> None:
+        self.incoming.put_nowait({"type": "websocket.disconnect", "code": 1000})
+        await self.task
+
+
+def test_open_websockets_do_not_hold_connections(db: Session):
+    user_in = schemas.UserCreate(display_name="teacher", password=random_string())
+    user = crud.user.create(db, obj_in=user_in)
+    room = crud.room.create(db, obj_in=schemas.RoomCreate(owner_id=user.id))
+    quiz_in = schemas.QuizCreate(
+        owner_id=user.id, is_public=True, content={"t": random_string(), "q": []}
+    )
+    quiz = crud.quiz.create(db, obj_in=quiz_in)
+    session = crud.quiz_session.create(
+        db, obj_in=schemas.QuizSessionCreate(room_id=room.id, quiz_id=quiz.id)
+    )
+    db.close()
+    query = {
+        "session_id": session.id,
+        "code": room.code,
+        "token": security.create_access_token(user.id),
+    }
+    app = main.init_app()
+
+    async def run():
+        connections = [
+            _Connection(app, "/session/get_responses", query) for _ in range(SOCKETS)
+        ]
+        assert all([await connection.accepted() for connection in connections])
+        checked_out = engine.pool.checkedout()
+        for connection in connections:
+            await connection.disconnect()
+        return checked_out
+
+    assert asyncio.run(run()) <= 2
+
+
+def test_websocket_with_bad_token_is_closed():
+    app = main.init_app()
+
+    async def run():
+        query = {"session_id": uuid.uuid4(), "code": "ABCDE", "token": "not a token"}
+        connection = _Connection(app, "/session/get_responses", query)
+        message = await connection.outgoing.get()
+        await connection.task
+        return message
+
+    message = asyncio.run(run())
+    assert message["type"] == "websocket.close"
+
+
+def test_session_websockets_need_the_rooms_code(db: Session):
+    # Without it, a sharded deployment could send a session's students
+    #  and teachers to different workers
+    user_in = schemas.UserCreate(display_name="teacher", password=random_string())
+    user = crud.user.create(db, obj_in=user_in)
+    room = crud.room.create(db, obj_in=schemas.RoomCreate(owner_id=user.id))
+    other_room = crud.room.create(db, obj_in=schemas.RoomCreate(owner_id=user.id))
+    quiz_in = schemas.QuizCreate(
+        owner_id=user.id, is_public=True, content={"t": random_string(), "q": []}
+    )
+    quiz = crud.quiz.create(db, obj_in=quiz_in)
+    session = crud.quiz_session.create(
+        db, obj_in=schemas.QuizSessionCreate(room_id=room.id, quiz_id=quiz.id)
+    )
+    token = security.create_access_token(user.id)
+    app = main.init_app()
+
+    async def accepted(path, code):
+        query = {"session_id": session.id, "code": code, "token": token}
+        connection = _Connection(app, path, query)
+        is_accepted = await connection.accepted()
+        if is_accepted:
+            await connection.disconnect()
+        else:
+            await connection.task
+        return is_accepted
+
+    async def run():
+        return [
+            await accepted(path, code)
+            for path in ("/session/get_responses", "/session/answers")
+            for code in (room.code, other_room.code)
+        ]
+
+    assert asyncio.run(run()) == [True, False, True, False]
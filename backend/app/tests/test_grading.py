@@ -0,0 +1,110 @@
+import math
+
+import numpy as np
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from app import crud, schemas
+from app.grading import grade, grade_session, pack_key, pack_responses
+from app.models import StudentResponse
+from app.tests.conftest import random_string
+
+CONTENT = {
+    "t": "Grading",
+    "q": [
+        {
+            "type": "multiple-choice",
+            "query": "Which?",
+            "answers": [
+                {"text": "a", "is_correct": False},
+                {"text": "b", "is_correct": True},
+                {"text": "c", "is_correct": False},
+            ],
+        },
+        {"type": "short-answer", "query": "What?", "answers": ["Blue"]},
+        {
+            "type": "multiple-choice",
+            "query": "Either?",
+            "answers": [{"text": "x", "is_correct": True}],
+        },
+    ],
+}
+
+
+def test_grade_counts_scores_difficulty_and_distractors():
+    key = pack_key(CONTENT)
+    rows = [
+        ("ann", 0, 1, None),
+        ("ann", 1, None, " blue "),
+        ("ann", 2, 0, None),
+        ("bob", 0, 2, None),
+        ("bob", 1, None, "red"),
+        # Out of range choices count as unanswered
+        ("bob", 2, 7, None),
+        ("cy", 0, 2, None),
+    ]
+    included = np.array([True, True, False])
+    grades = grade(key, pack_responses(key, rows), included)
+
+    assert grades.student_ids == ["ann", "bob", "cy"]
+    assert grades.scores.tolist() == [2, 0, 0]
+    assert grades.difficulty[:2].tolist() == [1 / 3, 1 / 2]
+    # Nobody's answers to an excluded question count
+    assert math.isnan(grades.difficulty[2])
+    assert grades.choice_counts.tolist() == [[0, 1, 2], [0, 0, 0], [0, 0, 0]]
+    assert grades.choice_mean_scores[0, 1] == 2
+    assert grades.choice_mean_scores[0, 2] == 0
+    assert math.isnan(grades.choice_mean_scores[0, 0])
+
+    as_dict = grades.as_dict()
+    assert as_dict["possible"] == 2
+    assert as_dict["questions"][2]["difficulty"] is None
+
+
+def test_grade_session_excludes_questions_edited_mid_session(db: Session):
+    user_in = schemas.UserCreate(display_name="teacher", password=random_string())
+    owner = crud.user.create(db, obj_in=user_in)
+    student = crud.user.create(
+        db, obj_in=schemas.UserCreate(display_name="student", password=random_string())
+    )
+    content = {**CONTENT, "t": random_string()}
+    quiz_in = schemas.QuizCreate(owner_id=owner.id, is_public=True, content=content)
+    quiz = crud.quiz.create(db, obj_in=quiz_in)
+    room = crud.room.create(db, obj_in=schemas.RoomCreate(owner_id=owner.id))
+    session = crud.quiz_session.create(
+        db, obj_in=schemas.QuizSessionCreate(room_id=room.id, quiz_id=quiz.id)
+    )
+
+    def respond(user, version, question, choice=None, text=None):
+        row = {
+            "quiz_session_id": session.id,
+            "student_id": user.id,
+            "question": question,
+            "version": version,
+            "choice": choice,
+            "text": text,
+        }
+        db.execute(insert(StudentResponse), [row])
+        db.commit()
+
+    respond(owner, 1, 0, choice=1)
+    respond(owner, 1, 1, text="blue")
+    # Out of range of the question, and of a 16 bit integer
+    respond(owner, 1, 2, choice=40000)
+    # No such version; ignored rather than failing the session
+    respond(student, 0, 0, choice=1)
+    # Version 2 edits the short answer and moves the first question to the end
+    edit = [
+        {"op": "replace", "path": "/q/1/answers", "value": ["red"]},
+        {"op": "move", "from": "/q/0", "path": "/q/2"},
+    ]
+    crud.quiz.update(db, id=quiz.id, obj_in={"patch_content": edit})
+    respond(student, 2, 2, choice=0)
+    respond(student, 2, 1, text="red")
+    respond(student, 2, 1, text="blue")
+
+    grades = grade_session(db, quiz_session_id=session.id)
+    assert grades.included.tolist() == [True, False, True]
+    scores = dict(zip(grades.student_ids, grades.scores.tolist()))
+    assert scores == {owner.id: 1, student.id: 0}
+    assert grades.choice_counts[0].tolist() == [1, 1, 0]
@@ -0,0 +1,98 @@
+import asyncio
+import threading
+
+from app.hub import SLOW_CONSUMER_CLOSE_CODE, RoomHub
+
+
+class _FakeWebSocket:
+    def __init__(self, stalled: bool = False):
+        self.messages = []
+        self.closed_with = None
+        # A stalled client never finishes sending, like one on a dead network
+        self.stalled = stalled
+
+    async def send_text(self, message: str) -> None:
+        if self.stalled:
+            await asyncio.Event().wait()
+        self.messages.append(message)
+
+    async def close(self, code: int = 1000) -> None:
+        self.closed_with = code
+
+
+def _run(coroutine):
+    # A loop of our own; asyncio.run would unset the TestClient's loop
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        # Stop the senders of clients still in a room
+        senders = asyncio.all_tasks(loop)
+        for sender in senders:
+            sender.cancel()
+        loop.run_until_complete(asyncio.gather(*senders, return_exceptions=True))
+        loop.close()
+
+
+def test_events_reach_everyone_in_the_room_once_encoded():
+    async def run():
+        hub = RoomHub(queue_size=8)
+        room, other = [_FakeWebSocket() for _ in range(3)], _FakeWebSocket()
+        clients = [hub.join("room", websocket) for websocket in room]
+        hub.join("other", other)
+        assert hub.publish("room", {"event": 1}) == 3
+        assert hub.publish("empty", {"event": 2}) == 0
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+
+        # Clients that left get nothing more; empty rooms are forgotten
+        for client in clients[1:]:
+            await hub.leave(client)
+        hub.publish("room", "already encoded")
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        await hub.leave(clients[0])
+        assert not hub.has_room("room")
+        return room, other, hub.stats()
+
+    room, other, stats = _run(run())
+    assert room[0].messages == ['{"event": 1}', "already encoded"]
+    assert room[1].messages == room[2].messages == ['{"event": 1}']
+    assert other.messages == []
+    assert stats == {"rooms": 1, "clients": 1, "published": 2, "dropped_clients": 0}
+
+
+def test_slow_clients_are_dropped_instead_of_stalling_the_room():
+    async def run():
+        hub = RoomHub(queue_size=2)
+        fast, slow = _FakeWebSocket(), _FakeWebSocket(stalled=True)
+        hub.join("room", fast)
+        hub.join("room", slow)
+        for i in range(4):
+            hub.publish("room", {"event": i})
+            await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        return fast, slow, hub.stats()
+
+    fast, slow, stats = _run(run())
+    assert len(fast.messages) == 4
+    # One event in flight, two queued; the fourth doesn't fit
+    assert slow.messages == []
+    assert slow.closed_with == SLOW_CONSUMER_CLOSE_CODE
+    assert stats["clients"] == 1
+    assert stats["dropped_clients"] == 1
+
+
+def test_synchronous_routes_can_publish():
+    async def run():
+        hub = RoomHub(queue_size=8)
+        websocket = _FakeWebSocket()
+        hub.join("room", websocket)
+        thread = threading.Thread(target=hub.publish_threadsafe, args=("room", [1]))
+        thread.start()
+        thread.join()
+        for _ in range(3):
+            await asyncio.sleep(0)
+        return websocket
+
+    assert _run(run()).messages == ["[1]"]
@@ -0,0 +1,139 @@
+import asyncio
+import uuid
+
+import pydantic
+import pytest
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from app import crud, schemas
+from app.database import engine
+from app.ingest import ResponseIngester
+from app.models import StudentResponse
+from app.tests.conftest import random_string
+
+
+@pytest.fixture(scope="module")
+def owner(db: Session):
+    user_in = schemas.UserCreate(display_name="teacher", password=random_string())
+    return crud.user.create(db, obj_in=user_in)
+
+
+@pytest.fixture(scope="module")
+def session(db: Session, owner):
+    room = crud.room.create(db, obj_in=schemas.RoomCreate(owner_id=owner.id))
+    quiz_in = schemas.QuizCreate(
+        owner_id=owner.id, is_public=True, content={"t": random_string(), "q": []}
+    )
+    quiz = crud.quiz.create(db, obj_in=quiz_in)
+    return crud.quiz_session.create(
+        db, obj_in=schemas.QuizSessionCreate(room_id=room.id, quiz_id=quiz.id)
+    )
+
+
+def _responses(db: Session, session) -> int:
+    statement = select(func.count()).where(
+        StudentResponse.quiz_session_id == session.id
+    )
+    return db.execute(statement).scalar_one()
+
+
+def test_responses_are_written_in_batches(db: Session, session, owner):
+    before = _responses(db, session)
+    ingester = ResponseIngester(engine=engine, max_rows=100, interval=60, capacity=1000)
+
+    async def run():
+        await ingester.start()
+        for i in range(250):
+            await ingester.put(
+                schemas.StudentResponseCreate(
+                    quiz_session_id=session.id,
+                    student_id=owner.id,
+                    question=i % 10,
+                    version=1,
+                    text=f"answer\t{i}\n\\",
+                )
+            )
+        # A full buffer is written without waiting for the interval
+        while ingester.rows < 250:
+            await asyncio.sleep(0.01)
+        await ingester.stop()
+
+    asyncio.run(run())
+    assert _responses(db, session) == before + 250
+    stats = ingester.stats()
+    assert stats["flushes"] == 3
+    assert stats["flush_sizes"]["<=100"] == 3
+    assert stats["lost_rows"] == 0
+    text = db.execute(
+        select(StudentResponse.text).where(
+            StudentResponse.quiz_session_id == session.id,
+            StudentResponse.text == "answer\t7\n\\",
+        )
+    ).scalar_one()
+    assert text == "answer\t7\n\\"
+
+
+def test_put_waits_while_the_buffer_is_full(session, owner):
+    ingester = ResponseIngester(engine=engine, max_rows=100, interval=60, capacity=10)
+    response = schemas.StudentResponseCreate(
+        quiz_session_id=session.id,
+        student_id=owner.id,
+        question=0,
+        version=1,
+        choice=2,
+    )
+
+    async def run():
+        await ingester.start()
+        for _ in range(10):
+            await ingester.put(response)
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(ingester.put(response), 0.1)
+        await ingester.stop()
+
+    asyncio.run(run())
+    # Written by stop, long before the interval
+    assert ingester.rows == 10
+
+
+def test_a_rejected_response_only_drops_itself(db: Session, session, owner):
+    before = _responses(db, session)
+    ingester = ResponseIngester(engine=engine, max_rows=100, interval=60, capacity=1000)
+    responses = [
+        schemas.StudentResponseCreate(
+            quiz_session_id=session.id,
+            student_id=owner.id,
+            question=i,
+            version=1,
+            choice=0,
+        )
+        for i in range(20)
+    ]
+    # No such student, so the foreign key rejects the batch
+    responses[13] = responses[13].copy(update={"student_id": uuid.uuid4()})
+
+    async def run():
+        await ingester.start()
+        for response in responses:
+            await ingester.put(response)
+        await ingester.stop()
+
+    asyncio.run(run())
+    assert _responses(db, session) == before + 19
+    assert ingester.rows == 19
+    assert ingester.lost_rows == 1
+
+
+@pytest.mark.parametrize(
+    "answer",
+    [
+        {"question": 2 ** 31, "version": 1},
+        {"question": 0, "version": -1},
+        {"question": 0, "version": 1, "choice": 40000000000},
+        {"question": 0, "version": 1, "text": "nul\x00"},
+    ],
+)
+def test_answers_that_cant_be_written_are_rejected(answer):
+    with pytest.raises(pydantic.ValidationError):
+        schemas.StudentAnswer(**answer)
@@ -0,0 +1,54 @@
+from app.answer_key import AnswerKey
+from app.matching import MatchIndex, normalize
+from app.schemas import StudentAnswer
+
+
+def test_normalize_folds_case_width_punctuation_and_spacing():
+    assert normalize("  Jean-Luc  Picard. ") == "jean luc picard"
+    # NFKD turns compatibility characters into their equivalents
+    assert normalize("ＦＵＬＬ width") == "full width"
+    assert normalize("¿Qué?") == normalize("qué")
+
+
+def test_exact_matches_ignore_case_and_punctuation():
+    index = MatchIndex(["Mount Everest"])
+    assert index.match("mount everest!")
+    assert index.match("MOUNT-EVEREST")
+    assert not index.match("Mount Everest2")
+    assert not index.match("Everest")
+
+
+def test_fuzzy_matches_are_bounded_by_max_edits():
+    index = MatchIndex(["photosynthesis", "ox"], max_edits=2)
+    assert index.match("photosynthesis")
+    assert index.match("photosinthesis")  # substitution
+    assert index.match("photsynthesis")  # deletion
+    assert index.match("photosynthesiss")  # insertion
+    assert index.match("photosytnhesis")  # transposition
+    assert index.match("fotosynthesis")  # two edits
+    assert not index.match("fotosynthesys")
+    # Answers as short as max_edits only match exactly
+    assert index.match("OX")
+    assert not index.match("ax")
+    # Results are the same when they come from the cache
+    assert index.match("fotosynthesis")
+    assert not index.match("fotosynthesys")
+
+
+def test_answer_key_uses_the_question_max_edits():
+    content = {
+        "t": "Spelling",
+        "q": [
+            {"type": "short-answer", "query": "?", "answers": ["Mississippi"]},
+            {
+                "type": "short-answer",
+                "query": "?",
+                "answers": ["Mississippi"],
+                "max_edits": 1,
+            },
+        ],
+    }
+    key = AnswerKey(content)
+    for question, expected in [(0, False), (1, True)]:
+        answer = StudentAnswer(question=question, version=1, text="Missisippi")
+        assert key.grade(answer) is expected
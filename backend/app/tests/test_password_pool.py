@@ -0,0 +1,69 @@
+import asyncio
+import time
+
+import pytest
+from sqlalchemy.orm import Session
+
+from app import schemas, security
+from app.core import PasswordPool, _hash_password, settings
+from app.exceptions import Http503ServerBusy
+from app.routes import user
+
+
+def test_full_pool_rejects_requests():
+    pool = PasswordPool(workers=1, queue_depth=1, retry_after=3)
+    # A loop of our own; asyncio.run would unset the TestClient's loop
+    loop = asyncio.new_event_loop()
+
+    async def burst():
+        return await asyncio.gather(
+            *(pool.run_async(time.sleep, 0.5) for _ in range(4)),
+            return_exceptions=True,
+        )
+
+    try:
+        results = loop.run_until_complete(burst())
+        rejected = [r for r in results if isinstance(r, Http503ServerBusy)]
+        assert len(rejected) == 2
+        assert all(r.headers == {"Retry-After": "3"} for r in rejected)
+        # Slots are released once the admitted requests finish
+        assert loop.run_until_complete(pool.run_async(abs, -1)) == 1
+    finally:
+        loop.close()
+        pool.shutdown()
+
+
+def test_default_limit_is_below_the_threadpool():
+    # Synchronous callers hold one of the threadpool's 40 threads while they wait
+    assert settings.PASSWORD_HASH_WORKERS + settings.PASSWORD_HASH_QUEUE_DEPTH < 40
+
+
+def test_registration_is_rejected_while_the_pool_is_full(
+    db: Session, monkeypatch: pytest.MonkeyPatch
+):
+    pool = PasswordPool(workers=1, queue_depth=0, retry_after=5)
+    monkeypatch.setattr(security, "password_pool", pool)
+    user_in = schemas.UserCreate(display_name="busy", password="password")
+    loop = asyncio.new_event_loop()
+    # Hold the only slot, as a login in progress would
+    pool._slots.acquire()
+    try:
+        with pytest.raises(Http503ServerBusy) as exc_info:
+            loop.run_until_complete(user.create_user(db=db, user_in=user_in))
+    finally:
+        pool._slots.release()
+        loop.close()
+        pool.shutdown()
+    assert exc_info.value.headers == {"Retry-After": "5"}
+
+
+def test_workers_are_not_forked_from_the_app():
+    # Forking would copy the app's threads' locks into the workers
+    pool = PasswordPool(workers=1, queue_depth=0, retry_after=1)
+    try:
+        hashed = pool.run(_hash_password, "password")
+        assert security.verify_password("password", hashed)
+        context = pool._get_executor()._mp_context
+        assert context.get_start_method() == "forkserver"
+    finally:
+        pool.shutdown()
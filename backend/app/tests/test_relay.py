@@ -0,0 +1,79 @@
+import asyncio
+import json
+import multiprocessing
+import statistics
+import time
+import uuid
+
+from app.relay import relay
+
+WORKERS = 3
+SOCKETS_PER_WORKER = 20
+EVENTS = 100
+
+
+class _FakeWebSocket:
+    def __init__(self):
+        self.latencies = []
+
+    async def send_text(self, message: str) -> None:
+        self.latencies.append(time.time() - json.loads(message)["sent"])
+
+    async def close(self, code: int = 1000) -> None:
+        pass
+
+
+def _worker(room_id: str, ready, results) -> None:
+    # Runs in its own process, like a uvicorn worker
+    async def run():
+        sockets = [_FakeWebSocket() for _ in range(SOCKETS_PER_WORKER)]
+        for websocket in sockets:
+            relay.hub.join(uuid.UUID(room_id), websocket)
+        relay.start()
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, relay.listening.wait, 10)
+        ready.set()
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            if all(len(websocket.latencies) == EVENTS for websocket in sockets):
+                break
+            await asyncio.sleep(0.01)
+        await loop.run_in_executor(None, relay.stop)
+        return [latency for websocket in sockets for latency in websocket.latencies]
+
+    results.put(asyncio.run(run()))
+
+
+def test_events_reach_every_worker():
+    context = multiprocessing.get_context("spawn")
+    room_id = str(uuid.uuid4())
+    results = context.Queue()
+    workers = []
+    for _ in range(WORKERS):
+        ready = context.Event()
+        process = context.Process(target=_worker, args=(room_id, ready, results))
+        process.start()
+        workers.append((process, ready))
+    for _, ready in workers:
+        assert ready.wait(30)
+
+    for i in range(EVENTS):
+        event = {"type": "ping", "index": i, "sent": time.time()}
+        if i % 10 == 0:
+            # Too large for NOTIFY; goes through room_event_overflow
+            event["padding"] = "x" * 10000
+        relay.publish(uuid.UUID(room_id), event)
+        time.sleep(0.005)
+
+    latencies = []
+    for _ in range(WORKERS):
+        latencies += results.get(timeout=60)
+    for process, _ in workers:
+        process.join(10)
+
+    assert len(latencies) == WORKERS * SOCKETS_PER_WORKER * EVENTS
+    latencies.sort()
+    p50 = statistics.median(latencies)
+    p99 = latencies[int(len(latencies) * 0.99) - 1]
+    print(f"relay latency: p50={p50 * 1e3:.2f}ms p99={p99 * 1e3:.2f}ms")
+    assert p99 < 1
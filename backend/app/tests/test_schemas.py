@@ -0,0 +1,63 @@
+import json
+from uuid import uuid4
+
+import pytest
+from pydantic import ValidationError
+from sqlalchemy.orm import Session
+
+from app import crud, schemas
+from app.routes._responses import unvalidated_response
+from app.tests.conftest import random_string
+
+SHORT_ANSWER = {"type": "short-answer", "query": "Two?", "answers": ["2"]}
+MULTIPLE_CHOICE = {
+    "type": "multiple-choice",
+    "query": "One?",
+    "answers": [{"text": "1", "is_correct": True}, {"text": "2"}],
+}
+
+
+def _errors(question):
+    with pytest.raises(ValidationError) as exc_info:
+        schemas._QuizContent(t="Quiz", q=[question])
+    return exc_info.value.errors()
+
+
+def test_questions_are_validated_by_their_type():
+    content = schemas._QuizContent(t="Quiz", q=[SHORT_ANSWER, MULTIPLE_CHOICE])
+    assert [type(q) for q in content.q] == [schemas.ShortAnswer, schemas.MultipleChoice]
+    for_student = [
+        {"type": "short-answer", "query": "Two?"},
+        {"type": "multiple-choice", "query": "One?", "answers": [{"text": "1"}]},
+    ]
+    student = schemas.QuizForStudent(id=uuid4(), version=1, t="Quiz", q=for_student)
+    assert [q.type for q in student.q] == ["short-answer", "multiple-choice"]
+
+    # Only the model for the tag reports errors
+    errors = _errors({**MULTIPLE_CHOICE, "answers": ["1", "2"]})
+    assert {error["loc"][:3] for error in errors} == {("q", 0, "MultipleChoice")}
+
+
+@pytest.mark.parametrize(
+    "question, error_type",
+    [
+        ({**SHORT_ANSWER, "type": "essay"}, "invalid_discriminator"),
+        ({"query": "Two?", "answers": ["2"]}, "missing_discriminator"),
+    ],
+)
+def test_unknown_question_types_get_one_error(question, error_type):
+    [error] = _errors(question)
+    assert error["loc"] == ("q", 0)
+    assert error["type"] == f"value_error.discriminated_union.{error_type}"
+
+
+def test_stored_quizzes_serialize_like_validated_ones(db: Session):
+    user_in = schemas.UserCreate(display_name="serializer", password=random_string())
+    owner = crud.user.create(db, obj_in=user_in)
+    content = {"t": random_string(), "q": [SHORT_ANSWER, MULTIPLE_CHOICE]}
+    quiz_in = schemas.QuizCreate(owner_id=owner.id, is_public=True, content=content)
+    quiz = crud.quiz.create(db, obj_in=quiz_in)
+
+    response = unvalidated_response(quiz, schemas.Quiz)
+    validated = schemas.Quiz.from_orm(quiz).json()
+    assert json.loads(response.body) == json.loads(validated)
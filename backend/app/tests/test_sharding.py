@@ -0,0 +1,78 @@
+import asyncio
+
+from app.sharding import ShardRouter, shard_of
+
+
+def _head(target: str, *headers: str) -> bytes:
+    lines = [f"GET {target} HTTP/1.1", "Host: quiz", *headers]
+    return ("\r\n".join(lines) + "\r\n\r\n").encode()
+
+
+def test_rooms_are_routed_to_their_shard():
+    router = ShardRouter(worker_ports=[8001, 8002, 8003])
+    for code in ["ABCDE", "FGHIJ", "KLMNO"]:
+        shard = shard_of(code, 3)
+        assert router.choose(_head(f"/rooms/events?code={code}")) == shard
+        assert router.choose(_head(f"/session/answers?code={code}&x=1")) == shard
+    # Requests without a code take turns
+    assert {router.choose(_head("/api/quiz/get")) for _ in range(3)} == {0, 1, 2}
+
+
+def test_connections_carry_one_request_unless_upgraded():
+    head = _head("/api/quiz/get", "Connection: keep-alive", "Keep-Alive: 5")
+    assert ShardRouter.single_request(head) == _head(
+        "/api/quiz/get", "Connection: close"
+    )
+    upgrade = _head("/rooms/events?code=A", "Connection: Upgrade", "Upgrade: websocket")
+    assert ShardRouter.single_request(upgrade) == upgrade
+
+
+def test_a_keep_alive_connection_cant_reach_another_rooms_worker():
+    async def run():
+        heads = {0: [], 1: []}
+
+        def worker(shard):
+            # Answers requests until asked to close, like uvicorn
+            async def handle(reader, writer):
+                while True:
+                    try:
+                        head = await reader.readuntil(b"\r\n\r\n")
+                    except asyncio.IncompleteReadError:
+                        break
+                    heads[shard].append(head)
+                    writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: 0\r\n\r\n")
+                    if b"Connection: close" in head:
+                        break
+                writer.close()
+
+            return handle
+
+        workers = [
+            await asyncio.start_server(worker(shard), "127.0.0.1", 0)
+            for shard in heads
+        ]
+        ports = [server.sockets[0].getsockname()[1] for server in workers]
+        router = ShardRouter(worker_ports=ports)
+        # Two rooms on different workers
+        codes = [f"R{i:04d}" for i in range(100)]
+        first = codes[0]
+        second = next(c for c in codes if shard_of(c, 2) != shard_of(first, 2))
+
+        proxy = await asyncio.start_server(router._handle, "127.0.0.1", 0)
+        port = proxy.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(_head(f"/api/rooms?code={first}"))
+        writer.write(_head(f"/api/rooms?code={second}"))
+        response = await reader.read()
+        writer.close()
+
+        for server in [proxy, *workers]:
+            server.close()
+        return response, heads[shard_of(first, 2)], heads[shard_of(second, 2)]
+
+    response, first_worker, second_worker = asyncio.run(run())
+    # One response, then the connection closed; the second request
+    #  never reached the first room's worker
+    assert response.count(b"HTTP/1.1 200 OK") == 1
+    assert len(first_worker) == 1
+    assert second_worker == []
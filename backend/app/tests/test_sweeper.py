@@ -0,0 +1,42 @@
+from sqlalchemy import func, update
+from sqlalchemy.orm import Session
+
+from app import crud, schemas
+from app.models import Room
+from app.sweeper import RoomSweeper
+from app.tests.conftest import random_string
+
+
+def test_idle_rooms_are_closed_with_their_sessions(db: Session):
+    user_in = schemas.UserCreate(display_name="teacher", password=random_string())
+    owner = crud.user.create(db, obj_in=user_in)
+    idle_room = crud.room.create(db, obj_in=schemas.RoomCreate(owner_id=owner.id))
+    busy_room = crud.room.create(db, obj_in=schemas.RoomCreate(owner_id=owner.id))
+    quiz_in = schemas.QuizCreate(
+        owner_id=owner.id, is_public=True, content={"t": random_string(), "q": []}
+    )
+    quiz = crud.quiz.create(db, obj_in=quiz_in)
+    idle_session, busy_session = crud.quiz_session.create_many(
+        db,
+        objs_in=[
+            schemas.QuizSessionCreate(room_id=room.id, quiz_id=quiz.id)
+            for room in (idle_room, busy_room)
+        ],
+    )
+    db.execute(
+        update(Room)
+        .where(Room.id == idle_room.id)
+        .values(last_active=func.now() - func.make_interval(0, 0, 0, 0, 2))
+    )
+    db.commit()
+
+    sweeper = RoomSweeper(idle_seconds=3600, interval=0, batch_size=1000)
+    assert sweeper.run_once() >= 1
+
+    assert crud.room.get(db, idle_room.id).is_active is False
+    assert crud.room.get(db, busy_room.id).is_active is True
+    closed = crud.quiz_session.get(db, idle_session.id)
+    assert closed.is_active is False
+    # Closed sessions are rolled up in the same run
+    assert closed.rolled_up is True
+    assert crud.quiz_session.get(db, busy_session.id).is_active is True
@@ -0,0 +1,150 @@
+import asyncio
+import json
+import uuid
+
+from sqlalchemy.orm import Session
+
+from app import crud, schemas
+from app.answer_key import AnswerKey
+from app.sharding import ShardRouter
+from app.tallies import SessionTally, TallyBoard
+from app.tests.conftest import random_string
+
+CONTENT = {
+    "t": "Tallies",
+    "q": [
+        {
+            "type": "multiple-choice",
+            "query": "Which?",
+            "answers": [
+                {"text": "a", "is_correct": False},
+                {"text": "b", "is_correct": True},
+            ],
+        },
+        {"type": "short-answer", "query": "What?", "answers": ["Blue"]},
+    ],
+}
+
+
+class _FakeWebSocket:
+    def __init__(self):
+        self.messages = []
+
+    async def send_text(self, message: str) -> None:
+        self.messages.append(json.loads(message))
+
+    async def close(self, code: int = 1000) -> None:
+        pass
+
+
+def _answer(question: int, choice=None, text=None) -> schemas.StudentAnswer:
+    return schemas.StudentAnswer(question=question, version=1, choice=choice, text=text)
+
+
+def test_each_student_is_counted_once_per_question():
+    key = AnswerKey(CONTENT)
+    tally = SessionTally(max_buckets=1)
+    student = uuid.uuid4()
+    for answer in [_answer(0, choice=0), _answer(0, choice=1), _answer(0, choice=1)]:
+        tally.record(student, answer, key.grade(answer))
+    for text in [" blue", "Red", "green"]:
+        answer = _answer(1, text=text)
+        tally.record(uuid.uuid4(), answer, key.grade(answer))
+
+    delta = tally.take_delta()
+    assert delta["seq"] == 1
+    assert delta["questions"][0] == {
+        "choices": {1: 1},
+        "buckets": {},
+        "other": 0,
+        "correct": 1,
+        "incorrect": 0,
+    }
+    assert delta["questions"][1] == {
+        "choices": {},
+        "buckets": {"blue": 1},
+        "other": 2,
+        "correct": 1,
+        "incorrect": 2,
+    }
+    # Nothing changed since
+    assert tally.take_delta() is None
+
+
+def test_teachers_get_one_delta_per_tick(db: Session):
+    user_in = schemas.UserCreate(display_name="teacher", password=random_string())
+    owner = crud.user.create(db, obj_in=user_in)
+    room = crud.room.create(db, obj_in=schemas.RoomCreate(owner_id=owner.id))
+    quiz_in = schemas.QuizCreate(
+        owner_id=owner.id, is_public=True, content={**CONTENT, "t": random_string()}
+    )
+    quiz = crud.quiz.create(db, obj_in=quiz_in)
+    session = crud.quiz_session.create(
+        db, obj_in=schemas.QuizSessionCreate(room_id=room.id, quiz_id=quiz.id)
+    )
+    board = TallyBoard(tick=0.05, max_buckets=10, idle_seconds=60, queue_size=8)
+    teacher = _FakeWebSocket()
+
+    async def run():
+        await board.start()
+        client = await board.watch(session, teacher)
+        for _ in range(100):
+            await board.record(session, uuid.uuid4(), _answer(0, choice=1))
+        await asyncio.sleep(0.2)
+        await board.leave(client)
+        await board.stop()
+
+    asyncio.run(run())
+    snapshot, *deltas = teacher.messages
+    assert snapshot == {"type": "tallies", "seq": 0, "questions": {}}
+    assert len(deltas) == 1
+    assert deltas[0]["questions"]["0"]["correct"] == 100
+
+
+def test_a_sessions_students_and_teachers_reach_one_worker(db: Session):
+    user_in = schemas.UserCreate(display_name="teacher", password=random_string())
+    owner = crud.user.create(db, obj_in=user_in)
+    quiz_in = schemas.QuizCreate(
+        owner_id=owner.id, is_public=True, content={**CONTENT, "t": random_string()}
+    )
+    quiz = crud.quiz.create(db, obj_in=quiz_in)
+    router = ShardRouter(worker_ports=[8001, 8002])
+    # Each worker tallies the answers it receives
+    workers = [
+        TallyBoard(tick=0.05, max_buckets=10, idle_seconds=60, queue_size=8)
+        for _ in router.worker_ports
+    ]
+
+    def worker(path: str, session, code: str) -> TallyBoard:
+        query = f"session_id={session.id}&code={code}&token=t"
+        head = f"GET {path}?{query} HTTP/1.1\r\nHost: quiz\r\n\r\n".encode()
+        return workers[router.choose(head)]
+
+    sessions = []
+    for _ in range(4):
+        room = crud.room.create(db, obj_in=schemas.RoomCreate(owner_id=owner.id))
+        session_in = schemas.QuizSessionCreate(room_id=room.id, quiz_id=quiz.id)
+        sessions.append((crud.quiz_session.create(db, obj_in=session_in), room.code))
+    teachers = [_FakeWebSocket() for _ in sessions]
+
+    async def run():
+        clients = []
+        for (session, code), teacher in zip(sessions, teachers):
+            board = worker("/session/get_responses", session, code)
+            clients.append((board, await board.watch(session, teacher)))
+        for board in workers:
+            await board.start()
+        for session, code in sessions:
+            for _ in range(3):
+                board = worker("/session/answers", session, code)
+                await board.record(session, uuid.uuid4(), _answer(0, choice=1))
+        await asyncio.sleep(0.2)
+        for board, client in clients:
+            await board.leave(client)
+        for board in workers:
+            await board.stop()
+
+    asyncio.run(run())
+    for teacher in teachers:
+        snapshot, delta = teacher.messages
+        assert delta["questions"]["0"]["correct"] == 3
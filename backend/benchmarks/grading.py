@@ -0,0 +1,103 @@
+""" Benchmark: Grading a session of 10k students × 100 questions
+
+Grades random responses with app.grading (packed into NumPy arrays) and with
+a per-student loop grading each StudentAnswer with AnswerKey.grade,
+then checks both agree on every score.
+
+Doesn't need a database.
+
+    python -m benchmarks.grading --students 10000 --questions 100
+"""
+import random
+import time
+
+import click
+import numpy as np
+
+from app.answer_key import AnswerKey
+from app.grading import grade, pack_key, pack_responses
+from app.schemas import StudentAnswer
+
+WORDS = ["blue", "Blue ", "red", "green", "BLUE", "yellow"]
+
+
+def _content(questions: int, choices: int):
+    q = []
+    for i in range(questions):
+        if i % 4 == 3:
+            q.append({"type": "short-answer", "query": f"{i}?", "answers": ["blue"]})
+        else:
+            answers = [
+                {"text": str(c), "is_correct": c == i % choices} for c in range(choices)
+            ]
+            q.append({"type": "multiple-choice", "query": f"{i}?", "answers": answers})
+    return {"t": "Benchmark", "q": q}
+
+
+def _rows(content, students: int, skip: float, seed: int):
+    rng = random.Random(seed)
+    rows = []
+    for student in range(students):
+        for i, question in enumerate(content["q"]):
+            if rng.random() < skip:
+                continue
+            if question["type"] == "multiple-choice":
+                choice = rng.randrange(len(question["answers"]))
+                rows.append((student, i, choice, None))
+            else:
+                rows.append((student, i, None, rng.choice(WORDS)))
+    return rows
+
+
+def _loop(content, rows, included):
+    # What grading one student at a time looks like
+    key = AnswerKey(content)
+    scores = {}
+    for student, question, choice, text in rows:
+        answer = StudentAnswer(question=question, version=1, choice=choice, text=text)
+        if included[question] and key.grade(answer):
+            scores[student] = scores.get(student, 0) + 1
+        else:
+            scores.setdefault(student, 0)
+    return scores
+
+
+@click.command()
+@click.option("--students", default=10_000, help="Students in the session")
+@click.option("--questions", default=100, help="Questions in the quiz")
+@click.option("--choices", default=4, help="Answers per multiple choice question")
+@click.option("--skip", default=0.1, help="Share of questions left unanswered")
+@click.option("--excluded", default=5, help="Questions edited mid-session")
+def main(students: int, questions: int, choices: int, skip: float, excluded: int):
+    content = _content(questions, choices)
+    rows = _rows(content, students, skip, seed=0)
+    included = np.ones(questions, dtype=bool)
+    included[random.Random(1).sample(range(questions), excluded)] = False
+    click.echo(f"students={students} questions={questions} answers={len(rows)}")
+
+    start = time.perf_counter()
+    key = pack_key(content)
+    packed = pack_responses(key, rows)
+    packed_at = time.perf_counter()
+    grades = grade(key, packed, included)
+    graded_at = time.perf_counter()
+    click.echo(
+        f"  numpy: pack={(packed_at - start) * 1e3:.0f}ms "
+        f"grade={(graded_at - packed_at) * 1e3:.0f}ms "
+        f"total={(graded_at - start) * 1e3:.0f}ms"
+    )
+
+    start = time.perf_counter()
+    scores = _loop(content, rows, included)
+    click.echo(f"  per-student loop: total={(time.perf_counter() - start) * 1e3:.0f}ms")
+
+    assert scores == dict(zip(grades.student_ids, grades.scores.tolist()))
+    hardest = np.nanargmin(grades.difficulty)
+    click.echo(
+        f"  mean score {grades.scores.mean():.1f}/{grades.as_dict()['possible']}, "
+        f"hardest question {hardest} ({grades.difficulty[hardest]:.0%} correct)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+""" Benchmark: A burst of logins while other endpoints keep serving requests
+
+FastAPI runs synchronous routes in a threadpool of (by default) 40 threads.
+This benchmark fills a threadpool of the same size with a burst of logins
+and, at the same time, measures the latency of a cheap request
+(standing in for e.g. fetching a quiz) served by the same threadpool.
+
+The login and registration routes now await hashes without holding a thread;
+this models the synchronous callers (e.g. changing a password) that still do.
+
+    python -m benchmarks.login_throughput --logins 300 --workers 0
+    python -m benchmarks.login_throughput --logins 300 --workers 4
+"""
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import click
+
+from app.core import PasswordPool, _hash_password, _verify_and_update_password
+from app.exceptions import Http503ServerBusy
+
+THREADPOOL_SIZE = 40
+
+
+def _percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+@click.command()
+@click.option("--logins", default=300, help="Number of simultaneous logins")
+@click.option("--workers", default=2, help="Password hashing processes (0 = inline)")
+@click.option("--queue-depth", default=16, help="Logins allowed to wait for a process")
+@click.option("--probes", default=200, help="Cheap requests sent during the burst")
+def main(logins: int, workers: int, queue_depth: int, probes: int):
+    hashed_password = _hash_password("correct horse battery staple")
+    pool = PasswordPool(workers=workers, queue_depth=queue_depth, retry_after=1)
+    # Warm up the worker processes so process start-up isn't measured
+    pool.run(_verify_and_update_password, "warm up", hashed_password)
+
+    rejected = 0
+
+    def login():
+        nonlocal rejected
+        try:
+            pool.run(
+                _verify_and_update_password,
+                "correct horse battery staple",
+                hashed_password,
+            )
+        except Http503ServerBusy:
+            rejected += 1
+
+    def probe(submitted_at):
+        # The cheap request itself is ~1ms of work; everything else is queueing
+        time.sleep(0.001)
+        return time.perf_counter() - submitted_at
+
+    with ThreadPoolExecutor(max_workers=THREADPOOL_SIZE) as threadpool:
+        start = time.perf_counter()
+        login_futures = [threadpool.submit(login) for _ in range(logins)]
+        probe_futures = []
+        for _ in range(probes):
+            probe_futures.append(threadpool.submit(probe, time.perf_counter()))
+            time.sleep(0.005)
+        wait(login_futures)
+        elapsed = time.perf_counter() - start
+        latencies = [f.result() * 1000 for f in probe_futures]
+    pool.shutdown()
+
+    accepted = logins - rejected
+    click.echo(f"workers={workers} queue_depth={queue_depth} logins={logins}")
+    click.echo(f"  logins accepted:  {accepted} ({accepted / elapsed:.1f}/s)")
+    click.echo(f"  logins rejected:  {rejected} (503 Retry-After)")
+    click.echo(
+        f"  other requests:   p50={statistics.median(latencies):.1f}ms "
+        f"p99={_percentile(latencies, 0.99):.1f}ms max={max(latencies):.1f}ms"
+    )
+
+
+if __name__ == "__main__":
+    main()
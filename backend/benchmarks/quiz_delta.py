@@ -0,0 +1,92 @@
+""" Benchmark: Telling students about a quiz edit, delta vs whole quiz
+
+Applies typical teacher edits to a quiz and compares the redacted
+"quiz-patched" event (crud.CRUDQuiz.student_event) with re-sending the
+whole student view (crud._student_view): bytes on the wire per student
+and the time to build each.
+
+Doesn't need a database.
+
+    python -m benchmarks.quiz_delta --questions 50
+"""
+import json
+import time
+import uuid
+
+import click
+import jsonpatch
+
+from app import crud
+from app.models import Quiz
+
+
+def _content(questions: int):
+    q = []
+    for i in range(questions):
+        question = {"type": "multiple-choice", "query": f"Question {i}?"}
+        if i % 3 == 2:
+            question["type"] = "short-answer"
+            question["answers"] = [f"accepted answer {j}" for j in range(3)]
+        else:
+            question["answers"] = [
+                {"text": f"Answer {j} to question {i}", "is_correct": j == 0}
+                for j in range(4)
+            ]
+        q.append(question)
+    return {"t": "Benchmark", "q": q}
+
+
+EDITS = {
+    "fix a typo": [{"op": "replace", "path": "/q/1/query", "value": "Question one?"}],
+    "change the correct answer": [
+        {"op": "replace", "path": "/q/0/answers/0/is_correct", "value": False},
+        {"op": "replace", "path": "/q/0/answers/2/is_correct", "value": True},
+    ],
+    "accept another answer": [
+        {"op": "add", "path": "/q/2/answers/-", "value": "another answer"}
+    ],
+    "add a question": [
+        {
+            "op": "add",
+            "path": "/q/-",
+            "value": {
+                "type": "multiple-choice",
+                "query": "A new question?",
+                "answers": [{"text": "yes", "is_correct": True}, {"text": "no"}],
+            },
+        }
+    ],
+    "reorder": [{"op": "move", "from": "/q/0", "path": "/q/3"}],
+}
+
+
+def _time(function, repeat: int):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = function()
+    return (time.perf_counter() - start) / repeat, result
+
+
+@click.command()
+@click.option("--questions", default=50, help="Questions in the quiz")
+@click.option("--repeat", default=1000, help="Times each is built")
+def main(questions: int, repeat: int):
+    content = _content(questions)
+    click.echo(f"questions={questions}")
+    for name, patch in EDITS.items():
+        quiz = Quiz(
+            id=uuid.uuid4(), version=2, content=jsonpatch.apply_patch(content, patch)
+        )
+        event_time, event = _time(
+            lambda: json.dumps(crud.quiz.student_event(quiz, patch_content=patch)),
+            repeat,
+        )
+        view_time, view = _time(lambda: crud._student_view(quiz), repeat)
+        click.echo(
+            f"  {name}: delta={len(event.encode())}B ({event_time * 1e6:.0f}µs) "
+            f"whole quiz={len(view)}B ({view_time * 1e6:.0f}µs)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+""" Benchmark: Validating and serializing quiz content
+
+Compares, for quizzes of 10/100/1000 questions:
+    union:          Questions validated against each member of a plain Union in turn
+    discriminated:  Questions validated by the model matching their "type"
+                    (schemas.AnyQuestion)
+    response:       A quiz loaded from the database, validated against
+                    schemas.Quiz and serialized (what a response_model does)
+    unvalidated:    The same quiz serialized without validation
+                    (routes._responses.unvalidated_response)
+
+Doesn't need a database.
+
+    python -m benchmarks.quiz_validation --repeat 50
+"""
+import time
+from typing import Union
+from uuid import uuid4
+
+import click
+from pydantic import BaseModel, Field
+
+from app import schemas
+
+
+class _UnionContent(BaseModel):
+    # schemas._QuizContent before questions were discriminated by type
+    t: str = Field(..., title="title")
+    q: list[Union[schemas.MultipleChoice, schemas.ShortAnswer]]
+
+
+def _content(questions: int) -> dict:
+    # Alternating question types, so each union member matches half of them.
+    #  Short-answers come second in the union, so they are tried last.
+    q = []
+    for i in range(questions):
+        if i % 2:
+            q.append(
+                {"query": f"Question {i}", "type": "short-answer", "answers": ["a"]}
+            )
+        else:
+            q.append(
+                {
+                    "query": f"Question {i}",
+                    "type": "multiple-choice",
+                    "answers": [
+                        {"text": "Yes", "is_correct": True},
+                        {"text": "No", "is_correct": False},
+                    ],
+                }
+            )
+    return {"t": "Benchmark", "q": q}
+
+
+def _time(func, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat
+
+
+@click.command()
+@click.option("--repeat", default=50, help="Runs per measurement")
+def main(repeat: int):
+    for questions in (10, 100, 1000):
+        content = _content(questions)
+        row = {
+            "id": uuid4(),
+            "owner_id": uuid4(),
+            "is_public": True,
+            "content": content,
+            "version": 1,
+        }
+        results = {
+            "union": _time(lambda: _UnionContent.parse_obj(content), repeat),
+            "discriminated": _time(
+                lambda: schemas._QuizContent.parse_obj(content), repeat
+            ),
+            "response": _time(lambda: schemas.Quiz.parse_obj(row).json(), repeat),
+            "unvalidated": _time(lambda: schemas.Quiz.construct(**row).json(), repeat),
+        }
+        click.echo(f"questions={questions}")
+        for name, seconds in results.items():
+            click.echo(f"  {name:>13}: {seconds * 1e3:8.3f}ms")
+        click.echo(
+            f"  validation speedup: {results['union'] / results['discriminated']:.1f}x"
+            f", response speedup: {results['response'] / results['unvalidated']:.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+""" Benchmark: Broadcasting a room event to 500 websockets
+
+Publishes events through app.hub.RoomHub to fake websockets and measures
+the time from publishing an event until the last socket has sent it.
+Some of the sockets can be made slow; they should be disconnected
+without delaying the rest of the room.
+
+Doesn't need a database.
+
+    python -m benchmarks.room_broadcast --sockets 500 --slow 5
+"""
+import asyncio
+import statistics
+import time
+
+import click
+
+from app.hub import RoomHub
+
+
+class _FakeWebSocket:
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.received = 0
+        self.last_received = 0.0
+        self.closed_with = None
+
+    async def send_text(self, message: str) -> None:
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        self.received += 1
+        self.last_received = time.perf_counter()
+
+    async def close(self, code: int = 1000) -> None:
+        self.closed_with = code
+
+
+async def _run(sockets: int, slow: int, events: int, queue_size: int):
+    hub = RoomHub(queue_size=queue_size)
+    room_id = "room"
+    fast = [_FakeWebSocket(delay=0) for _ in range(sockets - slow)]
+    # Slow sockets take a second per message
+    laggards = [_FakeWebSocket(delay=1) for _ in range(slow)]
+    for websocket in fast + laggards:
+        hub.join(room_id, websocket)
+
+    event = {"type": "question", "index": 0, "query": "What is your quest?"}
+    latencies = []
+    for i in range(events):
+        published = time.perf_counter()
+        hub.publish(room_id, {**event, "index": i})
+        while any(websocket.received <= i for websocket in fast):
+            await asyncio.sleep(0)
+        last = max(websocket.last_received for websocket in fast)
+        latencies.append(last - published)
+    return latencies, hub.stats(), laggards
+
+
+@click.command()
+@click.option("--sockets", default=500, help="Websockets in the room")
+@click.option("--slow", default=5, help="How many of the websockets are slow")
+@click.option("--events", default=200, help="Events published")
+@click.option("--queue-size", default=64, help="Events a socket may fall behind")
+def main(sockets: int, slow: int, events: int, queue_size: int):
+    latencies, stats, laggards = asyncio.run(_run(sockets, slow, events, queue_size))
+    latencies.sort()
+    click.echo(f"sockets={sockets} slow={slow} events={events}")
+    click.echo(
+        f"  latency to the last fast socket: "
+        f"p50={statistics.median(latencies) * 1e3:.2f}ms "
+        f"p99={latencies[int(len(latencies) * 0.99) - 1] * 1e3:.2f}ms "
+        f"max={latencies[-1] * 1e3:.2f}ms"
+    )
+    disconnected = sum(1 for websocket in laggards if websocket.closed_with)
+    click.echo(f"  slow sockets disconnected: {disconnected}/{slow}")
+    click.echo(f"  hub: {stats}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+""" Benchmark: Grading a burst of answers to one short answer question
+
+Checks answers against a question's accepted answers the old way
+(a case-sensitive comparison with each one) and with app.matching.MatchIndex,
+exact and with typos allowed. Answers repeat, as they do in a class,
+and some are misspelled.
+
+Doesn't need a database.
+
+    python -m benchmarks.short_answers --answers 10000 --accepted 5
+"""
+import random
+import time
+
+import click
+
+from app import matching
+from app.matching import MatchIndex
+
+MISSPELLINGS = ["Photosynthesis", "photosynthesis.", "fotosynthesis", "photosinthesis"]
+
+
+def _answers(count: int, distinct: int, seed: int):
+    rng = random.Random(seed)
+    pool = MISSPELLINGS + [
+        "".join(rng.choice("abcdefghijklmnopqrstuvwxyz ") for _ in range(12))
+        for _ in range(distinct)
+    ]
+    return [rng.choice(pool) for _ in range(count)]
+
+
+def _time(grade, answers):
+    start = time.perf_counter()
+    correct = sum(1 for answer in answers if grade(answer))
+    return (time.perf_counter() - start) / len(answers), correct
+
+
+@click.command()
+@click.option("--answers", default=10_000, help="Answers in the burst")
+@click.option("--accepted", default=5, help="Accepted answers to the question")
+@click.option("--distinct", default=200, help="Distinct wrong answers")
+@click.option("--max-edits", default=2, help="Typos allowed by the fuzzy index")
+def main(answers: int, accepted: int, distinct: int, max_edits: int):
+    accepted_answers = ["Photosynthesis"] + [f"answer {i}" for i in range(accepted - 1)]
+    burst = _answers(answers, distinct, seed=0)
+    click.echo(f"answers={answers} accepted={accepted} distinct wrong={distinct}")
+
+    per_answer, correct = _time(lambda a: a in accepted_answers, burst)
+    click.echo(f"  linear, exact: {per_answer * 1e6:.2f}µs, {correct} correct")
+
+    for edits in [0, max_edits]:
+        matching.normalize.cache_clear()
+        start = time.perf_counter()
+        index = MatchIndex(accepted_answers, max_edits=edits)
+        built = time.perf_counter() - start
+        per_answer, correct = _time(index.match, burst)
+        click.echo(
+            f"  index, max_edits={edits}: {per_answer * 1e6:.2f}µs, "
+            f"{correct} correct (built in {built * 1e3:.2f}ms)"
+        )
+
+
+if __name__ == "__main__":
+    main()
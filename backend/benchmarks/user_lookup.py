@@ -0,0 +1,60 @@
+""" Benchmark: Looking up users by "name#number"
+
+Cold lookups normalize the name and query by (identifier_name, number).
+Warm lookups hit the memoized normalization and the name -> id cache,
+then load the user by primary key.
+
+Requires a running database.
+
+    python -m benchmarks.user_lookup --lookups 2000
+"""
+import time
+
+import click
+
+from app import crud, schemas
+from app.core import _normalize
+from app.database import SessionLocal
+
+
+def _time_lookups(names, clear_caches: bool) -> float:
+    start = time.perf_counter()
+    for name in names:
+        if clear_caches:
+            crud.user.names.clear()
+            _normalize.cache_clear()
+        # A session per lookup, as in a request
+        with SessionLocal() as db:
+            crud.user.get_by_name(db, name=name)
+    return (time.perf_counter() - start) / len(names)
+
+
+@click.command()
+@click.option("--users", default=50, help="Distinct users looked up")
+@click.option("--lookups", default=2000, help="Lookups per run")
+def main(users: int, lookups: int):
+    db = SessionLocal()
+    created = crud.user.create_many(
+        db,
+        objs_in=[
+            schemas.UserCreate(display_name="Ｌｏｏｋｕｐ", password="insecurE&123")
+            for _ in range(users)
+        ],
+    )
+    names = [created[i % users].name_and_number for i in range(lookups)]
+
+    cold = _time_lookups(names, clear_caches=True)
+    # Populate the caches, then measure
+    _time_lookups(names[:users], clear_caches=False)
+    warm = _time_lookups(names, clear_caches=False)
+    crud.user.remove_many(db, ids=[u.id for u in created])
+    db.close()
+
+    click.echo(f"users={users} lookups={lookups}")
+    click.echo(f"  cold: {cold * 1e6:.0f}us per lookup")
+    click.echo(f"  warm: {warm * 1e6:.0f}us per lookup")
+    click.echo(f"  cache: {crud.user.names.stats()}")
+
+
+if __name__ == "__main__":
+    main()
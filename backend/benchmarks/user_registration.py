@@ -0,0 +1,107 @@
+""" Stress test: Hundreds of simultaneous sign-ups with the same display name
+
+Compares allocating user numbers from the per-name counter (crud.CRUDUser.create)
+with the previous strategy of inserting "highest existing number + 1",
+which races on the (identifier_name, number) unique constraint.
+
+Requires a running database. bcrypt isn't what is being measured,
+so use a low cost, e.g.:
+
+    BCRYPT_ROUNDS=4 python -m benchmarks.user_registration --users 500
+"""
+import secrets
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import click
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import sessionmaker
+
+from app import crud, schemas
+from app.core import settings, security
+
+# The allocation used before the counter table
+_HIGHEST_NUMBER_PLUS_ONE = text(
+    """
+    WITH highest_number AS (
+      SELECT COALESCE(
+        (
+          SELECT number FROM "user"
+            WHERE identifier_name = :identifier_name
+            ORDER BY number desc limit 1
+        ),
+        0
+      )
+    )
+    INSERT INTO "user"(
+      display_name, hashed_password, is_superuser, is_active,
+      number
+    )
+    VALUES(
+      :display_name, :hashed_password, false, true,
+      (SELECT * FROM highest_number) + 1
+    )
+    RETURNING *
+    """
+)
+
+
+@click.command()
+@click.option("--users", default=500, help="Number of sign-ups")
+@click.option("--concurrency", default=50, help="Simultaneous sign-ups")
+@click.option(
+    "--strategy",
+    type=click.Choice(["counter", "highest-number"]),
+    default="counter",
+)
+def main(users: int, concurrency: int, strategy: str):
+    engine = create_engine(
+        settings.SQLALCHEMY_DATABASE_URI, pool_size=concurrency, future=True
+    )
+    Session = sessionmaker(bind=engine)
+    # A fresh name per run, so runs don't interfere with each other
+    name = "popular" + secrets.token_hex(4)
+    password = "insecurE&123"
+    hashed_password = security.hash_password(password)
+
+    def register(_):
+        with Session() as db:
+            try:
+                if strategy == "counter":
+                    user_in = schemas.UserCreate(display_name=name, password=password)
+                    crud.user.create(db, obj_in=user_in)
+                else:
+                    db.execute(
+                        _HIGHEST_NUMBER_PLUS_ONE,
+                        {
+                            "display_name": name,
+                            "hashed_password": hashed_password,
+                            "identifier_name": security.to_identifier(name),
+                        },
+                    )
+                    db.commit()
+                return True
+            except IntegrityError:
+                db.rollback()
+                return False
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(register, range(users)))
+    elapsed = time.perf_counter() - start
+
+    with Session() as db:
+        numbers = db.execute(
+            text('SELECT number FROM "user" WHERE identifier_name = :name'),
+            {"name": security.to_identifier(name)},
+        ).scalars().all()
+    succeeded = sum(results)
+    click.echo(f"strategy={strategy} users={users} concurrency={concurrency}")
+    click.echo(f"  succeeded:  {succeeded} ({succeeded / elapsed:.1f}/s)")
+    click.echo(f"  failed:     {users - succeeded}")
+    click.echo(f"  duplicates: {len(numbers) - len(set(numbers))}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,11 @@
 """ Command Line tool for interacting with the server and database """
+import asyncio
+
 import click
 import uvicorn
 
 from app import create_all, drop_all
+from app.sharding import run_sharded
 
 
 @click.group()
@@ -37,10 +40,21 @@ def runserver():
     uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=True)
 
 
+@click.command()
+@click.option("--host", default="0.0.0.0")
+@click.option("--port", default=8000)
+@click.option("--workers", default=4, help="Worker processes rooms are split across")
+def runsharded(host: str, port: int, workers: int):
+    """ Starts workers that each own a share of the rooms, behind a router """
+    create_all()
+    asyncio.run(run_sharded(host=host, port=port, workers=workers))
+
+
 cli.add_command(initdb)
 cli.add_command(dropdb)
 cli.add_command(resetdb)
 cli.add_command(runserver)
+cli.add_command(runsharded)
 
 if __name__ == "__main__":
     cli()